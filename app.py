@@ -1,39 +1,56 @@
 import os
-from fpdf import FPDF
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog,
     QListWidget, QListWidgetItem, QMessageBox, QComboBox, QDialog, QDialogButtonBox, QCheckBox
 )
-from PyQt5.QtGui import QIcon, QPixmap
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QDesktopServices, QIcon, QPixmap
+from PyQt5.QtCore import Qt, QSize, QThreadPool, QTimer, QUrl
+
+from cache import CACHE_FOLDER_NAME, ConversionCache
+from preview import PreviewPane
+from profiling import format_report
+from saved_pdfs import PdfSearchPanel, SavedPdfPanel
+from sources import EXTENSIONS, VALID_TYPES, common_root, output_path_for, pdf_filename, type_for
+from workers import EVICT_INTERVAL_MS, MAX_CONCURRENT_CONVERSIONS, BookJob, CacheEviction, ConversionJob, SourceScan
 
 # Define folder paths and default save folder
 PDF_FOLDER = "SavedPDFs"
-if not os.path.exists(PDF_FOLDER):
-    os.makedirs(PDF_FOLDER)
 
 # Paths for image assets (update these with your file paths)
 LOGO_ICON_PATH = os.path.join("images", "logo.png")
 SETTINGS_ICON_PATH = os.path.join("images", "settings.png")
 FILE_ICON_PATH = os.path.join("images", "folderbluer.png")
 
-class PDF(FPDF):
-    def header(self):
-        self.set_font("Arial", "B", 12)
-        self.cell(0, 10, "", 0, 1, "C")
-
 class App(QWidget):
     def __init__(self):
         super().__init__()
 
         self.setWindowTitle("Code to PDF Converter")
-        self.setGeometry(100, 100, 600, 500)
+        self.setGeometry(100, 100, 1100, 700)
 
         # Default settings
         self.is_drag_and_drop_enabled = True
         self.is_dark_mode = False
         self.save_folder = PDF_FOLDER
+        os.makedirs(PDF_FOLDER, exist_ok=True)
         self.file_path = None
+        # Everything picked in the file dialog; more than one file makes a book
+        self.file_paths = []
+
+        # Background conversions, keyed by job id
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(MAX_CONCURRENT_CONVERSIONS)
+        self.jobs = {}
+        # Outputs of queued jobs, so dropping a file twice doesn't convert it twice
+        self.queued_outputs = set()
+        # Dropped folders still being walked, by path
+        self.source_scans = {}
+        # Conversions add to the cache; a timer trims it off the GUI thread now and then
+        self.cache_touched = False
+        self.eviction = None
+        self.evict_timer = QTimer(self)
+        self.evict_timer.timeout.connect(self.evict_cache)
+        self.evict_timer.start(EVICT_INTERVAL_MS)
 
         self.initUI()
 
@@ -49,12 +66,11 @@ class App(QWidget):
         settings_button.setStyleSheet("background-color: transparent; border: none;")
         layout.addWidget(settings_button, alignment=Qt.AlignLeft)
 
-        # Logo
-        logo_label = QLabel(self)
-        logo_pixmap = QPixmap(LOGO_ICON_PATH)
-        logo_label.setPixmap(logo_pixmap.scaled(100, 100, Qt.KeepAspectRatio))
-        logo_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(logo_label)
+        # Logo; the space is kept now and the image decoded after the window first paints
+        self.logo_label = QLabel(self)
+        self.logo_label.setFixedHeight(100)
+        self.logo_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.logo_label)
 
         # Title Label
         self.title_label = QLabel("Code to PDF Converter", self)
@@ -79,19 +95,7 @@ class App(QWidget):
 
         # File type selection dropdown
         self.file_type_combobox = QComboBox(self)
-        self.file_type_combobox.addItem("Text File (.txt)")
-        self.file_type_combobox.addItem("Python File (.py)")
-        self.file_type_combobox.addItem("Java File (.java)")
-        self.file_type_combobox.addItem("C++ File (.cpp)")
-        self.file_type_combobox.addItem("HTML File (.html)")
-        self.file_type_combobox.addItem("CSS File (.css)")
-        self.file_type_combobox.addItem("JavaScript File (.js)")
-        self.file_type_combobox.addItem("Ruby File (.rb)")
-        self.file_type_combobox.addItem("PHP File (.php)")
-        self.file_type_combobox.addItem("Swift File (.swift)")
-        self.file_type_combobox.addItem("Go File (.go)")
-        self.file_type_combobox.addItem("Perl File (.pl)")
-        self.file_type_combobox.addItem("TypeScript File (.ts)")
+        self.file_type_combobox.addItems(VALID_TYPES)
         self.file_type_combobox.setStyleSheet("font-size: 14px; padding: 5px;")
         layout.addWidget(self.file_type_combobox)
 
@@ -101,15 +105,39 @@ class App(QWidget):
         convert_button.setStyleSheet("background-color: #2ecc71; color: white; font-size: 14px; padding: 10px; border-radius: 5px;")
         layout.addWidget(convert_button)
 
+        # Conversion queue
+        queue_label = QLabel("Conversion Queue", self)
+        queue_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #34495e;")
+        layout.addWidget(queue_label)
+
+        self.queue_listbox = QListWidget(self)
+        self.queue_listbox.setStyleSheet("background-color: #ecf0f1; font-size: 14px; border: 1px solid #ccc; border-radius: 5px;")
+        self.queue_listbox.setMaximumHeight(120)
+        layout.addWidget(self.queue_listbox)
+
+        # What the last drop queued
+        self.intake_label = QLabel(self)
+        self.intake_label.setStyleSheet("font-size: 12px; color: #7f8c8d;")
+        layout.addWidget(self.intake_label)
+
+        cancel_button = QPushButton("Cancel Selected Conversion", self)
+        cancel_button.clicked.connect(self.cancel_conversion)
+        cancel_button.setStyleSheet("background-color: #95a5a6; color: white; font-size: 14px; padding: 10px; border-radius: 5px;")
+        layout.addWidget(cancel_button)
+
         # Saved PDFs Section
         saved_label = QLabel("Saved PDFs", self)
         saved_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #34495e;")
         layout.addWidget(saved_label)
 
-        self.pdf_listbox = QListWidget(self)
-        self.pdf_listbox.setStyleSheet("background-color: #ecf0f1; font-size: 14px; border: 1px solid #ccc; border-radius: 5px;")
-        self.pdf_listbox.setIconSize(QSize(32, 32))  # Adjust icon size for list items
-        layout.addWidget(self.pdf_listbox)
+        self.pdf_panel = SavedPdfPanel(FILE_ICON_PATH, self)
+        self.pdf_panel.view.setStyleSheet("background-color: #ecf0f1; font-size: 14px; border: 1px solid #ccc; border-radius: 5px;")
+        self.pdf_panel.view.setIconSize(QSize(32, 32))  # Adjust icon size for list items
+        layout.addWidget(self.pdf_panel)
+
+        self.search_panel = PdfSearchPanel(self)
+        self.search_panel.opened.connect(self.open_pdf)
+        layout.addWidget(self.search_panel)
 
         # Buttons for managing PDFs
         button_layout = QHBoxLayout()
@@ -126,92 +154,247 @@ class App(QWidget):
 
         layout.addLayout(button_layout)
 
+        # Pages of the selected file, laid out as it will be converted; its render path is the one used
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(layout)
+        self.preview = PreviewPane(parent=self)
+        main_layout.addWidget(self.preview, stretch=1)
+
         # Set layout for the window
-        self.setLayout(layout)
+        self.setLayout(main_layout)
 
-        # Refresh the list of PDFs on startup
+        # Index the save folder on startup; it is kept current from then on
         self.refresh_pdf_list()
 
-        # Enable drag and drop (if implemented)
+        # Enable drag and drop
         self.setAcceptDrops(self.is_drag_and_drop_enabled)
 
         # Apply dark mode if enabled
         self.apply_dark_mode()
+        self.assets_loaded = False
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.assets_loaded:
+            self.assets_loaded = True
+            QTimer.singleShot(0, self.load_assets)
+
+    def load_assets(self):
+        logo_pixmap = QPixmap(LOGO_ICON_PATH)
+        self.logo_label.setPixmap(logo_pixmap.scaled(100, 100, Qt.KeepAspectRatio))
 
     def refresh_pdf_list(self):
-        self.pdf_listbox.clear()
-        pdf_files = [f for f in os.listdir(self.save_folder) if f.endswith(".pdf")]
-        for pdf_file in pdf_files:
-            item = QListWidgetItem(pdf_file)
-            item.setIcon(QIcon(FILE_ICON_PATH))  # Set icon for the item
-            self.pdf_listbox.addItem(item)
+        self.pdf_panel.index.set_folder(self.save_folder)
+        self.search_panel.set_folder(self.save_folder)
 
     def browse_file(self):
         file_dialog = QFileDialog(self)
         file_dialog.setFileMode(QFileDialog.ExistingFiles)
         if file_dialog.exec_():
-            file_path = file_dialog.selectedFiles()[0]
-            self.file_path = file_path
-            self.file_entry.setText(file_path)
+            self.file_paths = file_dialog.selectedFiles()
+            self.file_path = self.file_paths[0]
+            self.preview.set_source(self.file_path)
+            if len(self.file_paths) > 1:
+                self.file_entry.setText(f"{len(self.file_paths)} files, bound into one PDF")
+            else:
+                self.file_entry.setText(self.file_path)
+                file_type = type_for(self.file_path)
+                if file_type:
+                    self.file_type_combobox.setCurrentText(file_type)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if paths:
+            event.acceptProposedAction()
+            self.add_sources(paths)
+
+    def add_sources(self, paths):
+        # Every file is queued on its own, typed by its extension, and files we
+        # can't convert are left out rather than refusing the whole drop. Folders
+        # are walked in the background and their files queued as they turn up.
+        queued = unsupported = 0
+        previewed = False
+        for path in paths:
+            if os.path.isdir(path):
+                self.scan_folder(path)
+            elif type_for(path) is None:
+                unsupported += 1
+            else:
+                if not previewed:
+                    self.preview.set_source(path)
+                    previewed = True
+                if self.enqueue_conversion(path, os.path.join(self.save_folder, pdf_filename(path))):
+                    queued += 1
+        status = [f"{queued} files queued"]
+        if unsupported:
+            status.append(f"{unsupported} unsupported skipped")
+        if self.source_scans:
+            status.append(f"scanning {len(self.source_scans)} folders")
+        self.intake_label.setText(", ".join(status))
+
+    def scan_folder(self, folder):
+        folder = os.path.normpath(os.path.abspath(folder))
+        if folder in self.source_scans:
+            return
+        scan = SourceScan(folder, skip_folder=self.save_folder)
+        scan.signals.found.connect(self.on_sources_found)
+        scan.signals.finished.connect(self.on_scan_finished)
+        self.source_scans[folder] = scan
+        # Not in the conversion pool, where it would wait behind the jobs it is meant to feed
+        QThreadPool.globalInstance().start(scan)
+
+    def on_sources_found(self, folder, paths):
+        # Output mirrors the tree under a folder named after the dropped one
+        root = os.path.dirname(folder)
+        for path in paths:
+            self.enqueue_conversion(path, output_path_for(path, root, self.save_folder))
+
+    def on_scan_finished(self, folder, count):
+        del self.source_scans[folder]
+        self.intake_label.setText(f"{os.path.basename(folder)}: {count} files queued")
 
     def convert_to_pdf(self):
         if not self.file_path:
             self.show_message("No File Selected", "Please select a file to convert.")
             return
 
-        file_extension = os.path.splitext(self.file_path)[1]
-        selected_type = self.file_type_combobox.currentText()
-        valid_types = {
-            "Text File (.txt)": ".txt",
-            "Python File (.py)": ".py",
-            "Java File (.java)": ".java",
-            "C++ File (.cpp)": ".cpp",
-            "HTML File (.html)": ".html",
-            "CSS File (.css)": ".css",
-            "JavaScript File (.js)": ".js",
-            "Ruby File (.rb)": ".rb",
-            "PHP File (.php)": ".php",
-            "Swift File (.swift)": ".swift",
-            "Go File (.go)": ".go",
-            "Perl File (.pl)": ".pl",
-            "TypeScript File (.ts)": ".ts"
-        }
-
-        if selected_type not in valid_types or file_extension != valid_types[selected_type]:
-            self.show_message("Invalid File Type", "The selected file does not match the chosen type.")
+        if len(self.file_paths) > 1:
+            self.convert_to_book(self.file_paths)
+            return
+
+        # The type comes from the extension; the dropdown just shows it
+        file_type = type_for(self.file_path)
+        if file_type is None:
+            self.show_message("Invalid File Type", f"{os.path.basename(self.file_path)} is not a supported file type.")
             return
+        self.file_type_combobox.setCurrentText(file_type)
+
+        output_path = os.path.join(self.save_folder, pdf_filename(self.file_path))
+        self.enqueue_conversion(self.file_path, output_path)
 
-        try:
-            pdf = PDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
+    def convert_to_book(self, file_paths):
+        unsupported = [path for path in file_paths if os.path.splitext(path)[1] not in EXTENSIONS]
+        if unsupported:
+            self.show_message("Invalid File Type", f"{os.path.basename(unsupported[0])} is not a supported file type.")
+            return
+        output_path = os.path.join(self.save_folder, os.path.basename(common_root(file_paths)) + ".pdf")
+        self.enqueue_job(BookJob(file_paths, output_path, font=self.preview.render_font))
+
+    def enqueue_conversion(self, file_path, output_path):
+        # False if a queued job already writes output_path
+        if os.path.abspath(output_path) in self.queued_outputs:
+            return False
+        cache = ConversionCache(os.path.join(self.save_folder, CACHE_FOLDER_NAME))
+        self.enqueue_job(ConversionJob(file_path, output_path, font=self.preview.render_font, cache=cache,
+                                       search_folder=self.save_folder))
+        return True
+
+    def enqueue_job(self, job):
+        job.signals.started.connect(self.on_conversion_started)
+        job.signals.progress.connect(self.on_conversion_progress)
+        job.signals.finished.connect(self.on_conversion_finished)
+        job.signals.failed.connect(self.on_conversion_failed)
+        job.signals.cancelled.connect(self.on_conversion_cancelled)
+
+        item = QListWidgetItem()
+        item.setData(Qt.UserRole, job.job_id)
+        self.queue_listbox.addItem(item)
+        self.jobs[job.job_id] = (job, item)
+        self.queued_outputs.add(os.path.abspath(job.output_path))
+        self.set_job_status(job.job_id, "queued")
+
+        self.thread_pool.start(job)
+
+    def set_job_status(self, job_id, status):
+        job, item = self.jobs[job_id]
+        item.setText(f"{os.path.basename(job.file_path)} - {status}")
+
+    def finish_job(self, job_id, status):
+        self.set_job_status(job_id, status)
+        job, item = self.jobs.pop(job_id)
+        self.queued_outputs.discard(os.path.abspath(job.output_path))
+        item.setData(Qt.UserRole, None)
+
+    def on_conversion_started(self, job_id):
+        self.set_job_status(job_id, "converting")
+
+    def on_conversion_progress(self, job_id, lines, pages):
+        if job_id in self.jobs:
+            self.set_job_status(job_id, f"{lines} lines, {pages} pages")
+
+    def on_conversion_finished(self, job_id, result):
+        job, item = self.jobs[job_id]
+        if result.get("skipped"):
+            self.finish_job(job_id, f"skipped ({result['skipped']} file)")
+            return
+        cached = ", cached" if result.get("cached") else ""
+        self.finish_job(job_id, f"done ({result['pages']} pages{cached})")
+        if "profile" in result:
+            item.setToolTip(format_report(result["profile"]))
+        self.pdf_panel.index.update_file(result["output"])
+        self.search_panel.run_search()
+        if job.cache:
+            self.cache_touched = True
+
+    def evict_cache(self):
+        # Not in the conversion pool, where it would wait behind the jobs; one round at a time
+        if not self.cache_touched or self.eviction is not None and not self.eviction.done.is_set():
+            return
+        self.cache_touched = False
+        self.eviction = CacheEviction(os.path.join(self.save_folder, CACHE_FOLDER_NAME))
+        QThreadPool.globalInstance().start(self.eviction)
 
-            with open(self.file_path, "r", encoding="utf-8") as file:
-                for line in file:
-                    pdf.multi_cell(0, 10, line)
+    def on_conversion_failed(self, job_id, error):
+        job, item = self.jobs[job_id]
+        item.setToolTip(error)
+        self.finish_job(job_id, f"failed: {error}")
 
-            pdf_filename = os.path.join(self.save_folder, os.path.basename(self.file_path).replace(file_extension, ".pdf"))
-            pdf.output(pdf_filename)
+    def on_conversion_cancelled(self, job_id):
+        self.finish_job(job_id, "cancelled")
 
-            self.show_message("Success", f"PDF saved successfully: {pdf_filename}")
-            self.refresh_pdf_list()
-        except Exception as e:
-            self.show_message("Error", f"An error occurred: {e}")
+    def cancel_conversion(self):
+        selected = self.queue_listbox.currentItem()
+        if not selected or selected.data(Qt.UserRole) is None:
+            return
+        job_id = selected.data(Qt.UserRole)
+        job, item = self.jobs[job_id]
+        job.cancel()
+        # Jobs still waiting in the pool never start; running ones stop at the next progress check
+        if self.thread_pool.tryTake(job):
+            self.on_conversion_cancelled(job_id)
+        else:
+            self.set_job_status(job_id, "cancelling")
 
     def delete_pdf(self):
-        selected = self.pdf_listbox.currentItem()
-        if selected:
-            pdf_name = selected.text()
+        pdf_name = self.pdf_panel.selected_name()
+        if pdf_name:
             pdf_path = os.path.join(self.save_folder, pdf_name)
             try:
                 os.remove(pdf_path)
-                self.refresh_pdf_list()
+                self.pdf_panel.index.remove_file(pdf_name)
+                self.search_panel.remove(pdf_path)
                 self.show_message("Success", f"{pdf_name} deleted.")
             except Exception as e:
                 self.show_message("Error", f"Could not delete {pdf_name}: {e}")
 
+    def open_path(self, path):
+        # The desktop's handler for the file or folder; os.startfile only exists on Windows
+        if not QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(path))):
+            self.show_message("Error", f"Could not open {path}")
+
     def open_pdf_folder(self):
-        os.startfile(self.save_folder)
+        self.open_path(self.save_folder)
+
+    def open_pdf(self, pdf_path, page):
+        self.open_path(pdf_path)
 
     def open_settings_dialog(self):
         settings_dialog = SettingsDialog(self)
@@ -235,7 +418,7 @@ class App(QWidget):
                     background-color: #34495e;
                     color: #ecf0f1;
                 }
-                QListWidget {
+                QListWidget, QTreeView {
                     background-color: #34495e;
                     color: #ecf0f1;
                 }
@@ -258,7 +441,7 @@ class App(QWidget):
                     background-color: #ecf0f1;
                     color: #2c3e50;
                 }
-                QListWidget {
+                QListWidget, QTreeView {
                     background-color: #ecf0f1;
                     color: #2c3e50;
                 }
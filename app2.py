@@ -1,56 +1,50 @@
 import os
-from fpdf import FPDF
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog,
-    QListWidget, QListWidgetItem, QMessageBox, QComboBox, QDialog, QDialogButtonBox, QCheckBox
+    QMessageBox, QComboBox, QDialog, QDialogButtonBox, QCheckBox
 )
-from PyQt5.QtGui import QIcon, QPixmap
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QDesktopServices, QIcon, QPixmap
+from PyQt5.QtCore import Qt, QSize, QThreadPool, QTimer, QUrl
+
+from cache import CACHE_FOLDER_NAME, ConversionCache
+from preview import PreviewPane
+from saved_pdfs import PdfSearchPanel, SavedPdfPanel
+from sources import VALID_TYPES, pdf_filename, type_for
+from workers import EVICT_INTERVAL_MS, MAX_CONCURRENT_CONVERSIONS, CacheEviction, ConversionJob
 
 # Define folder paths and default save folder
 PDF_FOLDER = "SavedPDFs"
-if not os.path.exists(PDF_FOLDER):
-    os.makedirs(PDF_FOLDER)
 
 # Paths for image assets (update these with your file paths)
 LOGO_ICON_PATH = os.path.join("images", "logo.png")
 SETTINGS_ICON_PATH = os.path.join("images", "settings.png")
 FILE_ICON_PATH = os.path.join("images", "folderbluer.png")
 
-# Fonts folder path
-FONTS_FOLDER = "fonts"
-MINECRAFT_FONT_PATH = os.path.join(FONTS_FOLDER, "Minecraft.ttf")
-
-# PDF class with Minecraft font
-class PDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        # Register the Minecraft font
-        self.add_font("Minecraft", "", MINECRAFT_FONT_PATH, uni=True)
-
-    def header(self):
-        # Use Minecraft font for the header
-        self.set_font("Minecraft", size=14)
-        self.cell(0, 10, "Code to PDF Converter", border=0, ln=1, align="C")
-
-    def add_code_content(self, content):
-        self.set_font("Minecraft", size=12)
-        for line in content.splitlines():
-            self.multi_cell(0, 10, line)
-
 class App(QWidget):
     def __init__(self):
         super().__init__()
 
         self.setWindowTitle("Code to PDF Converter")
-        self.setGeometry(100, 100, 600, 500)
+        self.setGeometry(100, 100, 1100, 600)
 
         # Default settings
         self.is_drag_and_drop_enabled = True
         self.is_dark_mode = False
         self.save_folder = PDF_FOLDER
+        os.makedirs(PDF_FOLDER, exist_ok=True)
         self.file_path = None
 
+        # Background conversions, keyed by job id
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(MAX_CONCURRENT_CONVERSIONS)
+        self.jobs = {}
+        # Conversions add to the cache; a timer trims it off the GUI thread now and then
+        self.cache_touched = False
+        self.eviction = None
+        self.evict_timer = QTimer(self)
+        self.evict_timer.timeout.connect(self.evict_cache)
+        self.evict_timer.start(EVICT_INTERVAL_MS)
+
         self.initUI()
 
     def initUI(self):
@@ -65,12 +59,11 @@ class App(QWidget):
         settings_button.setStyleSheet("background-color: transparent; border: none;")
         layout.addWidget(settings_button, alignment=Qt.AlignLeft)
 
-        # Logo
-        logo_label = QLabel(self)
-        logo_pixmap = QPixmap(LOGO_ICON_PATH)
-        logo_label.setPixmap(logo_pixmap.scaled(100, 100, Qt.KeepAspectRatio))
-        logo_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(logo_label)
+        # Logo; the space is kept now and the image decoded after the window first paints
+        self.logo_label = QLabel(self)
+        self.logo_label.setFixedHeight(100)
+        self.logo_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.logo_label)
 
         # Title Label
         self.title_label = QLabel("Code to PDF Converter", self)
@@ -95,19 +88,7 @@ class App(QWidget):
 
         # File type selection dropdown
         self.file_type_combobox = QComboBox(self)
-        self.file_type_combobox.addItem("Text File (.txt)")
-        self.file_type_combobox.addItem("Python File (.py)")
-        self.file_type_combobox.addItem("Java File (.java)")
-        self.file_type_combobox.addItem("C++ File (.cpp)")
-        self.file_type_combobox.addItem("HTML File (.html)")
-        self.file_type_combobox.addItem("CSS File (.css)")
-        self.file_type_combobox.addItem("JavaScript File (.js)")
-        self.file_type_combobox.addItem("Ruby File (.rb)")
-        self.file_type_combobox.addItem("PHP File (.php)")
-        self.file_type_combobox.addItem("Swift File (.swift)")
-        self.file_type_combobox.addItem("Go File (.go)")
-        self.file_type_combobox.addItem("Perl File (.pl)")
-        self.file_type_combobox.addItem("TypeScript File (.ts)")
+        self.file_type_combobox.addItems(VALID_TYPES)
         self.file_type_combobox.setStyleSheet("font-size: 14px; padding: 5px;")
         layout.addWidget(self.file_type_combobox)
 
@@ -122,10 +103,14 @@ class App(QWidget):
         saved_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #34495e;")
         layout.addWidget(saved_label)
 
-        self.pdf_listbox = QListWidget(self)
-        self.pdf_listbox.setStyleSheet("background-color: #ecf0f1; font-size: 14px; border: 1px solid #ccc; border-radius: 5px;")
-        self.pdf_listbox.setIconSize(QSize(32, 32))  # Adjust icon size for list items
-        layout.addWidget(self.pdf_listbox)
+        self.pdf_panel = SavedPdfPanel(FILE_ICON_PATH, self)
+        self.pdf_panel.view.setStyleSheet("background-color: #ecf0f1; font-size: 14px; border: 1px solid #ccc; border-radius: 5px;")
+        self.pdf_panel.view.setIconSize(QSize(32, 32))  # Adjust icon size for list items
+        layout.addWidget(self.pdf_panel)
+
+        self.search_panel = PdfSearchPanel(self)
+        self.search_panel.opened.connect(self.open_pdf)
+        layout.addWidget(self.search_panel)
 
         # Buttons for managing PDFs
         button_layout = QHBoxLayout()
@@ -142,84 +127,129 @@ class App(QWidget):
 
         layout.addLayout(button_layout)
 
+        # Pages of the selected file, laid out as it will be converted
+        main_layout = QHBoxLayout()
+        main_layout.addLayout(layout)
+        self.preview = PreviewPane(fonts=("minecraft",), parent=self)
+        main_layout.addWidget(self.preview, stretch=1)
+
         # Set layout for the window
-        self.setLayout(layout)
+        self.setLayout(main_layout)
 
-        # Refresh the list of PDFs on startup
+        # Index the save folder on startup; it is kept current from then on
         self.refresh_pdf_list()
 
-        # Enable drag and drop (if implemented)
+        # Enable drag and drop
         self.setAcceptDrops(self.is_drag_and_drop_enabled)
 
         # Apply dark mode if enabled
         self.apply_dark_mode()
+        self.assets_loaded = False
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.assets_loaded:
+            self.assets_loaded = True
+            QTimer.singleShot(0, self.load_assets)
+
+    def load_assets(self):
+        logo_pixmap = QPixmap(LOGO_ICON_PATH)
+        self.logo_label.setPixmap(logo_pixmap.scaled(100, 100, Qt.KeepAspectRatio))
 
     def refresh_pdf_list(self):
-        self.pdf_listbox.clear()
-        pdf_files = [f for f in os.listdir(self.save_folder) if f.endswith(".pdf")]
-        for pdf_file in pdf_files:
-            item = QListWidgetItem(pdf_file)
-            item.setIcon(QIcon(FILE_ICON_PATH))  # Set icon for the item
-            self.pdf_listbox.addItem(item)
+        self.pdf_panel.index.set_folder(self.save_folder)
+        self.search_panel.set_folder(self.save_folder)
 
     def browse_file(self):
         file_dialog = QFileDialog(self)
         file_dialog.setFileMode(QFileDialog.ExistingFiles)
         if file_dialog.exec_():
-            file_path = file_dialog.selectedFiles()[0]
-            self.file_path = file_path
-            self.file_entry.setText(file_path)
+            self.select_file(file_dialog.selectedFiles()[0])
+
+    def select_file(self, file_path):
+        self.file_path = file_path
+        self.file_entry.setText(file_path)
+        self.preview.set_source(file_path)
+        file_type = type_for(file_path)
+        if file_type:
+            self.file_type_combobox.setCurrentText(file_type)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        # This window converts one file at a time: the first supported file dropped is selected
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        supported = [path for path in paths if type_for(path)]
+        if supported:
+            event.acceptProposedAction()
+            self.select_file(supported[0])
 
     def convert_to_pdf(self):
         if not self.file_path:
             self.show_message("No File Selected", "Please select a file to convert.")
             return
 
-        file_extension = os.path.splitext(self.file_path)[1]
-        selected_type = self.file_type_combobox.currentText()
-        valid_types = {
-            "Text File (.txt)": ".txt",
-            "Python File (.py)": ".py",
-            "Java File (.java)": ".java",
-            "C++ File (.cpp)": ".cpp",
-            "HTML File (.html)": ".html",
-            "CSS File (.css)": ".css",
-            "JavaScript File (.js)": ".js",
-            "Ruby File (.rb)": ".rb",
-            "PHP File (.php)": ".php",
-            "Swift File (.swift)": ".swift",
-            "Go File (.go)": ".go",
-            "Perl File (.pl)": ".pl",
-            "TypeScript File (.ts)": ".ts"
-        }
-
-        if selected_type not in valid_types or file_extension != valid_types[selected_type]:
-            self.show_message("Invalid File Type", "The selected file does not match the chosen type.")
+        # The type comes from the extension; the dropdown just shows it
+        file_type = type_for(self.file_path)
+        if file_type is None:
+            self.show_message("Invalid File Type", f"{os.path.basename(self.file_path)} is not a supported file type.")
             return
+        self.file_type_combobox.setCurrentText(file_type)
+
+        output_path = os.path.join(self.save_folder, pdf_filename(self.file_path))
+        cache = ConversionCache(os.path.join(self.save_folder, CACHE_FOLDER_NAME))
+        job = ConversionJob(self.file_path, output_path, font="minecraft", cache=cache, search_folder=self.save_folder)
+        job.signals.finished.connect(self.on_conversion_finished)
+        job.signals.failed.connect(self.on_conversion_failed)
+        self.jobs[job.job_id] = job
+        self.thread_pool.start(job)
+
+    def on_conversion_finished(self, job_id, result):
+        self.jobs.pop(job_id)
+        self.cache_touched = True
+        if result.get("skipped"):
+            self.show_message("Skipped", f"{os.path.basename(result['source'])} is a {result['skipped']} file.")
+            return
+        self.pdf_panel.index.update_file(result["output"])
+        self.search_panel.run_search()
+        self.show_message("Success", f"PDF saved successfully: {result['output']}")
 
-        try:
-            pdf = PDF()
-            pdf.add_page()
-            with open(self.file_path, "r", encoding="utf-8") as file:
-                pdf.add_code_content(file.read())
-
-            pdf_filename = os.path.join(self.save_folder, os.path.basename(self.file_path).replace(file_extension, ".pdf"))
-            pdf.output(pdf_filename)
+    def evict_cache(self):
+        # Not in the conversion pool, where it would wait behind the jobs; one round at a time
+        if not self.cache_touched or self.eviction is not None and not self.eviction.done.is_set():
+            return
+        self.cache_touched = False
+        self.eviction = CacheEviction(os.path.join(self.save_folder, CACHE_FOLDER_NAME))
+        QThreadPool.globalInstance().start(self.eviction)
 
-            self.show_message("Success", f"PDF saved successfully: {pdf_filename}")
-            self.refresh_pdf_list()
-        except Exception as e:
-            self.show_message("Error", f"An error occurred: {e}")
+    def on_conversion_failed(self, job_id, error):
+        self.jobs.pop(job_id)
+        self.show_message("Error", f"An error occurred: {error}")
 
     def delete_pdf(self):
-        current_item = self.pdf_listbox.currentItem()
-        if current_item:
-            pdf_file = os.path.join(self.save_folder, current_item.text())
-            os.remove(pdf_file)
-            self.refresh_pdf_list()
+        pdf_name = self.pdf_panel.selected_name()
+        if pdf_name:
+            pdf_path = os.path.join(self.save_folder, pdf_name)
+            os.remove(pdf_path)
+            self.pdf_panel.index.remove_file(pdf_name)
+            self.search_panel.remove(pdf_path)
+
+    def open_path(self, path):
+        # The desktop's handler for the file or folder; os.startfile only exists on Windows
+        if not QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(path))):
+            self.show_message("Error", f"Could not open {path}")
 
     def open_pdf_folder(self):
-        os.startfile(self.save_folder)
+        self.open_path(self.save_folder)
+
+    def open_pdf(self, pdf_path, page):
+        self.open_path(pdf_path)
 
     def open_settings_dialog(self):
         # Implement settings dialog as needed
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import highlight
+from bench_layout import synthetic_lines
+from converter import RENDERERS, convert_file
+
+def timed_convert(source, output, font, highlight_on, repeat, cold=True):
+    best = None
+    for _ in range(repeat):
+        if cold:
+            # Cold tokenizer every run: no line memo, no cached tokens
+            highlight.forget_tokens()
+        start = time.perf_counter()
+        convert_file(source, output, font=font, highlight=highlight_on)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare highlighted against plain conversion time.")
+    parser.add_argument("--lines", type=int, default=100000, help="synthetic source size (default: %(default)s)")
+    parser.add_argument("--font", choices=sorted(RENDERERS), default="arial")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs (default: %(default)s)")
+    # A cold run scans every line and draws a cell per coloured run; about 2.1x
+    # plain at 100k lines, 1.3x when the tokens are cached
+    parser.add_argument("--max-ratio", type=float, default=2.5,
+                        help="fail if a cold highlighted conversion is slower than this multiple of plain "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "synthetic.py")
+        output = os.path.join(workdir, "synthetic.pdf")
+        with open(source, "w", encoding="utf-8") as file:
+            file.write("\n".join(synthetic_lines(args.lines)))
+
+        plain = timed_convert(source, output, args.font, False, args.repeat)
+        colored = timed_convert(source, output, args.font, True, args.repeat)
+        # The same file again: its tokens come from the per-hash cache
+        rerender = timed_convert(source, output, args.font, True, args.repeat, cold=False)
+
+    ratio = colored / plain
+    print(f"{args.lines} lines, {args.font}: plain {plain:.2f}s, highlighted {colored:.2f}s, {ratio:.2f}x")
+    print(f"  re-rendered from cached tokens: {rerender:.2f}s, {rerender / plain:.2f}x")
+    if ratio > args.max_ratio:
+        print(f"FAIL: highlighted conversion is {ratio:.2f}x plain (limit {args.max_ratio}x)")
+        return 1
+    print(f"OK: within {args.max_ratio}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import RENDERERS
+
+FONT_FAMILIES = {"arial": "Arial", "minecraft": "Minecraft"}
+
+def synthetic_lines(count, seed=0):
+    rng = random.Random(seed)
+    words = ["def", "return", "self", "value", "index", "(x, y)", "[i]", "==", "+=", "# note", "\"text\"", "result"]
+    lines = []
+    for i in range(count):
+        indent = "    " * rng.randint(0, 3)
+        # Mostly short code lines, with the odd long one that has to wrap
+        length = rng.choice((0, 3, 6, 8, 10, 12, 40))
+        lines.append(indent + " ".join(rng.choice(words) for _ in range(length)))
+    return lines
+
+def render_multi_cell(font, lines):
+    pdf = RENDERERS[font]()
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILIES[font], size=12)
+    for line in lines:
+        pdf.multi_cell(0, 10, line)
+    return pdf
+
+def render_layout(font, lines):
+    pdf = RENDERERS[font]()
+    pdf.add_page()
+    pdf.add_code_content("\n".join(lines))
+    return pdf
+
+def timed(render, font, lines):
+    start = time.perf_counter()
+    pdf = render(font, lines)
+    return time.perf_counter() - start, pdf.page
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare multi_cell against the bulk CodeLayout path.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated line counts")
+    parser.add_argument("--font", choices=sorted(RENDERERS), default="arial")
+    parser.add_argument("--skip-multi-cell-above", type=int, default=None,
+                        help="only time the layout path for inputs larger than this")
+    args = parser.parse_args(argv)
+
+    print(f"{'lines':>9} {'pages':>7} {'multi_cell':>11} {'layout':>9} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        lines = synthetic_lines(size)
+        layout_time, pages = timed(render_layout, args.font, lines)
+        if args.skip_multi_cell_above is not None and size > args.skip_multi_cell_above:
+            print(f"{size:>9} {pages:>7} {'-':>11} {layout_time:>8.2f}s {'-':>8}")
+            continue
+        multi_cell_time, _ = timed(render_multi_cell, args.font, lines)
+        print(f"{size:>9} {pages:>7} {multi_cell_time:>10.2f}s {layout_time:>8.2f}s {multi_cell_time / layout_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+
+from corpus import source_lines
+from preview import PageIndex, PageView
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def frame_report(name, times):
+    print(f"  {name}: {len(times)} frames, p50 {percentile(times, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(times, 0.99) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms")
+
+def paint(view):
+    start = time.perf_counter()
+    view.viewport().repaint()
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the live preview on a long listing: first page, "
+                                                 "background layout, scrolling, font and zoom changes.")
+    parser.add_argument("--pages", type=int, default=5000, help="rough length of the listing in pages")
+    parser.add_argument("--font", default="arial")
+    parser.add_argument("--other-font", default="minecraft", help="render path switched to and back")
+    parser.add_argument("--frames", type=int, default=400, help="scroll steps timed")
+    args = parser.parse_args(argv)
+
+    app = QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        # About 22 lines a page, as some lines wrap
+        path = os.path.join(folder, "listing.py")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(source_lines(".py", args.pages * 22, random.Random(0))) + "\n")
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+        view = PageView(args.font)
+        view.resize(800, 1000)
+        view.show()
+        start = time.perf_counter()
+        view.set_source(path)
+        paint(view)
+        print(f"  first page painted: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        # The index grows a step per timer tick; the longest step is the longest the window stalls
+        steps = []
+        extend = PageIndex.extend
+
+        def timed_extend(index, *args):
+            step_start = time.perf_counter()
+            extend(index, *args)
+            steps.append(time.perf_counter() - step_start)
+        PageIndex.extend = timed_extend
+        while not view.index.complete:
+            app.processEvents()
+        PageIndex.extend = extend
+        print(f"  index: {len(view.index.pages)} pages in {(time.perf_counter() - start):.2f} s, "
+              f"{len(steps)} steps, longest {max(steps) * 1000:.1f} ms")
+
+        scrollbar = view.verticalScrollBar()
+        frames = []
+        for _ in range(args.frames):
+            scrollbar.setValue(scrollbar.value() + scrollbar.singleStep() * 3)
+            frames.append(paint(view))
+        frame_report("scrolling", frames)
+
+        rng = random.Random(1)
+        frames = []
+        for _ in range(args.frames // 4):
+            scrollbar.setValue(rng.randrange(scrollbar.maximum()))
+            frames.append(paint(view))
+        frame_report("jumping", frames)
+        print(f"  page images: {view.cache_misses} rendered, {view.cache_hits} from cache")
+
+        for font in (args.other_font, args.font):
+            start = time.perf_counter()
+            view.set_render_font(font)
+            paint(view)
+            print(f"  switch to {font}: {(time.perf_counter() - start) * 1000:.0f} ms to repaint, "
+                  f"page {view.current_page()} of {view.index.page_count()}")
+            while not view.index.complete:
+                app.processEvents()
+
+        start = time.perf_counter()
+        view.set_scale(view.scale * 1.5)
+        paint(view)
+        print(f"  zoom 150%: {(time.perf_counter() - start) * 1000:.0f} ms to repaint")
+        view.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import source_lines
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=120):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+def connect(address):
+    if address.startswith("http://"):
+        host, port = address[len("http://"):].rstrip("/").split(":")
+        return http.client.HTTPConnection(host, int(port), timeout=120)
+    return UnixHTTPConnection(address)
+
+def request(connection, method, path, body=None):
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    return response.status, response.getheader("Retry-After"), response.read()
+
+def make_sources(count, seed=0):
+    # Sizes like the files people convert: mostly a few hundred lines, some long ones
+    rng = random.Random(seed)
+    sizes = (30, 120, 400, 1500, 5000)
+    return [("\n".join(source_lines(".py", rng.choice(sizes), rng)) + f"\n# {i}\n").encode("utf-8")
+            for i in range(count)]
+
+def client(address, sources, font, results, deadline):
+    connection = connect(address)
+    for index, source in sources:
+        if time.perf_counter() > deadline:
+            break
+        start = time.perf_counter()
+        rejected = 0
+        while True:
+            status, retry_after, body = request(connection, "POST", f"/jobs?name=load_{index}.py&font={font}", source)
+            if status != 503:
+                break
+            rejected += 1
+            # The server closes the connection after refusing an unread body. Retry-After
+            # says a whole second; coming back sooner keeps the workers from idling
+            connection.close()
+            time.sleep(random.uniform(0.01, 0.1))
+        if status != 202:
+            results.append({"error": f"submit: {status} {body[:200]!r}"})
+            continue
+        job = json.loads(body)
+        while job["status"] in ("queued", "running"):
+            status, _, body = request(connection, "GET", f"/jobs/{job['id']}?wait=30")
+            job = json.loads(body)
+        if job["status"] != "done":
+            results.append({"error": f"job {job['status']}: {job.get('error')}"})
+            continue
+        status, _, pdf = request(connection, "GET", f"/jobs/{job['id']}/pdf")
+        results.append({"latency": time.perf_counter() - start, "pages": job["pages"], "bytes": len(pdf),
+                        "rejected": rejected})
+    connection.close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def start_server(args):
+    command = [sys.executable, os.path.join(REPO, "codetopdf.py"), "serve", "--queue-depth", str(args.queue_depth)]
+    if args.socket:
+        command += ["--socket", args.socket]
+    else:
+        command += ["--port", "0"]
+    if args.workers:
+        command += ["-j", str(args.workers)]
+    if not args.cache:
+        command.append("--no-cache")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    match = re.match(r"Serving on (\S+) with (\d+) workers", line)
+    if not match:
+        process.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    return process, match.group(1), int(match.group(2))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the conversion server with concurrent local clients.")
+    parser.add_argument("--address", default=None, help="a running server (http://host:port or a socket path); "
+                                                        "by default one is started for the test")
+    parser.add_argument("--socket", default=None, help="start the server on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="server worker processes (default: CPU count)")
+    parser.add_argument("--queue-depth", type=int, default=16)
+    parser.add_argument("--cache", action="store_true", help="let the server reuse earlier conversions")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=400, help="conversions in total (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=120, help="stop submitting after this many seconds")
+    parser.add_argument("--font", default="arial")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.address:
+        address, workers = args.address, "?"
+    else:
+        process, address, workers = start_server(args)
+    try:
+        sources = list(enumerate(make_sources(args.jobs)))
+        results = []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        threads = [threading.Thread(target=client, args=(address, sources[i::args.clients], args.font, results,
+                                                         deadline)) for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        connection = connect(address)
+        server_status = json.loads(request(connection, "GET", "/status")[2])
+        connection.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    done = [r for r in results if "latency" in r]
+    errors = [r["error"] for r in results if "error" in r]
+    latencies = [r["latency"] for r in done]
+    print(f"{address}: {workers} workers, queue depth {server_status['queue_depth']}, {args.clients} clients")
+    print(f"  {len(done)} conversions in {elapsed:.2f}s, {len(errors)} errors, "
+          f"{sum(r['rejected'] for r in done)} submissions refused with 503")
+    if done:
+        pages = sum(r["pages"] for r in done)
+        print(f"  throughput: {len(done) / elapsed:.1f} jobs/s, {pages / elapsed:.0f} pages/s")
+        print(f"  latency: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p90 {percentile(latencies, 0.9) * 1000:.0f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+    for error in errors[:5]:
+        print(f"  error: {error}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules timed on their own: what a batch runner, the CLI and each window pay to import
+MODULES = ("sources", "converter", "codetopdf", "app", "app2")
+HEAVY = ("fpdf", "PyQt5.QtWidgets", "sqlite3")
+
+def import_child(module):
+    start = time.perf_counter()
+    __import__(module)
+    elapsed = time.perf_counter() - start
+    loaded = ",".join(name for name in HEAVY if name in sys.modules) or "-"
+    print(f"{elapsed} {loaded}")
+
+def window_child(module, source, output_folder):
+    # Prints "<event> <time.time()>" as the window paints, gets its assets and
+    # delivers the first PDF; the parent subtracts the time it started us
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    def mark(event):
+        print(event, time.time(), flush=True)
+
+    app = QApplication([])
+    window_module = __import__(module)
+    load_assets = window_module.App.load_assets
+
+    def timed_load_assets(self):
+        load_assets(self)
+        mark("assets")
+    window_module.App.load_assets = timed_load_assets
+    window = window_module.App()
+    # Message boxes would wait for a click
+    window.show_message = lambda title, message: None
+
+    def convert():
+        # What picking the file and pressing Convert does
+        window.save_folder = output_folder
+        window.file_path = source
+        extension = os.path.splitext(source)[1]
+        window.file_type_combobox.setCurrentText(next(name for name, expected in window_module.VALID_TYPES.items() if expected == extension))
+        window.convert_to_pdf()
+        QTimer.singleShot(0, wait)
+
+    def wait():
+        if window.jobs:
+            QTimer.singleShot(2, wait)
+            return
+        mark("pdf")
+        app.quit()
+
+    class FirstPaint(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint and not self.seen:
+                self.seen = True
+                mark("window")
+                QTimer.singleShot(0, convert)
+            return False
+
+    first_paint = FirstPaint()
+    first_paint.seen = False
+    window.installEventFilter(first_paint)
+    window.show()
+    app.exec_()
+
+def run_child(args, env=None):
+    command = [sys.executable, os.path.abspath(__file__)] + args
+    return subprocess.run(command, check=True, capture_output=True, text=True, cwd=REPO, env=env).stdout
+
+def time_import(module, repeat):
+    best = None
+    for _ in range(repeat):
+        seconds, loaded = run_child(["--import", module]).split()
+        if best is None or float(seconds) < best[0]:
+            best = (float(seconds), loaded)
+    return best
+
+def time_window(module, source, repeat):
+    # Best time to each event, counted from starting the interpreter
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    best = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_folder:
+            started = time.time()
+            output = run_child(["--window", module, source, output_folder], env)
+        for line in output.splitlines():
+            event, at = line.split()
+            best[event] = min(best.get(event, float("inf")), float(at) - started)
+    return best
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--import"]:
+        import_child(argv[1])
+        return 0
+    if argv[:1] == ["--window"]:
+        window_child(*argv[1:4])
+        return 0
+
+    parser = argparse.ArgumentParser(description="Measure import time, time to window and time to first PDF.")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, best one counts")
+    parser.add_argument("--source", default=os.path.join(REPO, "highlight.py"), help="file converted for the first PDF")
+    args = parser.parse_args(argv)
+
+    print(f"{'import':>10} {'time':>9}  loaded")
+    for module in MODULES:
+        seconds, loaded = time_import(module, args.repeat)
+        print(f"{module:>10} {seconds * 1000:>7.1f}ms  {loaded}")
+
+    print(f"\n{'window':>10} {'painted':>9} {'assets':>9} {'first pdf':>10}  (from interpreter start)")
+    for module in ("app", "app2"):
+        events = time_window(module, os.path.abspath(args.source), args.repeat)
+        print(f"{module:>10} " + " ".join(f"{events.get(event, float('nan')) * 1000:>{width}.0f}ms"
+                                          for event, width in (("window", 7), ("assets", 7), ("pdf", 8))))
+
+if __name__ == "__main__":
+    sys.exit(main())
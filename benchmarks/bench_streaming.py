@@ -0,0 +1,67 @@
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter import RENDERERS, convert_file
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def write_synthetic_file(path, size_mb):
+    block = "".join(
+        f"    value_{i} = compute(index={i}, label=\"row {i}\")  # generated line\n" for i in range(1000)
+    )
+    target = size_mb * 1024 * 1024
+    with open(path, "w", encoding="utf-8") as file:
+        written = 0
+        while written < target:
+            file.write(block)
+            written += len(block)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert a large synthetic file and check that peak RSS does not grow with input size."
+    )
+    parser.add_argument("--size-mb", type=int, default=2048, help="synthetic input size (default: %(default)s)")
+    parser.add_argument("--font", choices=sorted(RENDERERS), default="arial")
+    parser.add_argument("--tolerance-mb", type=float, default=32.0,
+                        help="allowed peak RSS growth after the first 5%% of the input")
+    parser.add_argument("--workdir", default=None, help="where to put the input and output (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        source = os.path.join(workdir, "synthetic.py")
+        output = os.path.join(workdir, "synthetic.pdf")
+        write_synthetic_file(source, args.size_mb)
+        total_lines = os.path.getsize(source) // 60
+
+        samples = {}
+        def progress(lines, pages):
+            if "warm" not in samples and lines >= total_lines * 0.05:
+                samples["warm"] = peak_rss_mb()
+
+        start = time.perf_counter()
+        result = convert_file(source, output, font=args.font, progress=progress)
+        elapsed = time.perf_counter() - start
+        final = peak_rss_mb()
+        warm = samples.get("warm", final)
+
+        print(f"input {args.size_mb} MB, {result['lines']} lines, {result['pages']} pages in {elapsed:.1f}s")
+        print(f"output {os.path.getsize(output) / (1024 * 1024):.1f} MB")
+        print(f"peak RSS after 5%: {warm:.1f} MB, at end: {final:.1f} MB")
+
+    growth = final - warm
+    if growth > args.tolerance_mb:
+        print(f"FAIL: peak RSS grew by {growth:.1f} MB while streaming (tolerance {args.tolerance_mb} MB)")
+        return 1
+    print(f"OK: peak RSS grew {growth:.1f} MB (tolerance {args.tolerance_mb} MB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import write_corpus
+from converter import RENDERERS
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO, "benchmarks", "baseline.json")
+
+# Allowed growth over the baseline before a result counts as a regression
+TIME_TOLERANCE = 0.10
+RSS_TOLERANCE = 0.10
+SIZE_TOLERANCE = 0.01
+
+# Differences below these are noise, whatever the percentage
+NOISE = {"seconds": 0.05, "rss_mb": 2.0, "bytes": 1024}
+
+def run_case(folder, font, output_folder):
+    # Runs in a fresh process, so peak RSS belongs to this case and this font alone
+    from converter import convert_file
+
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder))
+    os.makedirs(output_folder, exist_ok=True)
+    pages = 0
+    size = 0
+    start = time.perf_counter()
+    for path in paths:
+        output = os.path.join(output_folder, os.path.basename(path) + ".pdf")
+        pages += convert_file(path, output, font=font)["pages"]
+        size += os.path.getsize(output)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    return {"files": len(paths), "seconds": seconds, "pages": pages, "bytes": size,
+            "pages_per_second": pages / max(seconds, 1e-9),
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def measure(folder, font, output_folder, repeat):
+    # Best of `repeat` runs; each run in its own process, started in the repo like the apps
+    best = None
+    for _ in range(repeat):
+        command = [sys.executable, os.path.abspath(__file__), "--run-case", folder, font, output_folder]
+        process = subprocess.run(command, check=True, capture_output=True, text=True, cwd=REPO)
+        result = json.loads(process.stdout)
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+def regressions(results, baseline, tolerances):
+    # (case, measure, baseline value, new value) for every result worse than the baseline allows
+    found = []
+    for key, result in results.items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        for name, tolerance in tolerances.items():
+            if result[name] > old[name] * (1 + tolerance) and result[name] - old[name] > NOISE[name]:
+                found.append((key, name, old[name], result[name]))
+    return found
+
+def environment():
+    return {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system(),
+            "cpus": os.cpu_count()}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--run-case"]:
+        print(json.dumps(run_case(*argv[1:4])))
+        return 0
+
+    parser = argparse.ArgumentParser(
+        description="Convert a synthetic corpus with both renderers and compare against a stored baseline.")
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size factor (default: %(default)s)")
+    parser.add_argument("--fonts", default=",".join(sorted(RENDERERS)), help="comma separated renderers")
+    parser.add_argument("--cases", default=None, help="comma separated cases (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, best one counts (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--rss-tolerance", type=float, default=RSS_TOLERANCE)
+    parser.add_argument("--size-tolerance", type=float, default=SIZE_TOLERANCE)
+    parser.add_argument("--workdir", default=None, help="where to put the corpus and output (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    fonts = args.fonts.split(",")
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        cases = write_corpus(os.path.join(workdir, "corpus"), scale=args.scale)
+        names = args.cases.split(",") if args.cases else list(cases)
+        print(f"{'case':>11} {'font':>9} {'files':>6} {'time':>8} {'pages/s':>9} {'rss':>8} {'size':>10}")
+        for name in names:
+            for font in fonts:
+                folder = os.path.join(workdir, "corpus", name)
+                result = measure(folder, font, os.path.join(workdir, "out", font, name), args.repeat)
+                results[f"{name}/{font}"] = result
+                print(f"{name:>11} {font:>9} {result['files']:>6} {result['seconds']:>7.2f}s "
+                      f"{result['pages_per_second']:>9.0f} {result['rss_mb']:>6.0f}MB {result['bytes'] / 1024:>8.0f}KB")
+
+    run = {"scale": args.scale, "environment": environment(), "results": results}
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(run, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    if baseline["scale"] != args.scale:
+        print(f"Baseline was taken at scale {baseline['scale']}; not comparing.")
+        return 0
+    if baseline["environment"] != run["environment"]:
+        print(f"Note: baseline taken on {baseline['environment']}")
+
+    found = regressions(results, baseline, {"seconds": args.time_tolerance, "rss_mb": args.rss_tolerance,
+                                            "bytes": args.size_tolerance})
+    for key, name, old, new in found:
+        print(f"REGRESSION {key} {name}: {old:.2f} -> {new:.2f} ({100.0 * (new - old) / old:+.1f}%)")
+    if not found:
+        print("No regressions against the baseline.")
+    return 1 if found else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_layout import synthetic_lines
+from converter import PDF, RENDERERS, convert_file
+
+# name: (object streams, compress level, header form)
+WRITERS = {
+    "classic": (False, 6, False),
+    "objstm-1": (True, 1, True),
+    "objstm-6": (True, 6, True),
+    "objstm-9": (True, 9, True),
+}
+
+def write_corpus(folder, files, seed=0):
+    # Mostly short files, like a real source tree, with a few long ones
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder, f"file_{i}.py")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(synthetic_lines(rng.choice((20, 60, 150, 400, 2000)), seed=i)))
+        paths.append(path)
+    return paths
+
+def run_writer(paths, output_folder, font, writer):
+    object_streams, level, header_form = WRITERS[writer]
+    PDF.header_form = header_form
+    try:
+        start = time.perf_counter()
+        size = 0
+        for path in paths:
+            output = os.path.join(output_folder, os.path.basename(path) + f".{writer}.pdf")
+            convert_file(path, output, font=font, highlight=False, compress_level=level, object_streams=object_streams)
+            size += os.path.getsize(output)
+        return time.perf_counter() - start, size
+    finally:
+        PDF.header_form = True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare output size and time of the PDF writer settings.")
+    parser.add_argument("--files", type=int, default=300, help="synthetic source files (default: %(default)s)")
+    parser.add_argument("--font", choices=sorted(RENDERERS), default="minecraft")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = write_corpus(workdir, args.files)
+        results = {writer: run_writer(paths, workdir, args.font, writer) for writer in WRITERS}
+
+    base_time, base_size = results["classic"]
+    print(f"{args.files} files, {args.font}")
+    print(f"{'writer':>10} {'time':>8} {'size':>10} {'vs classic':>11}")
+    for writer, (elapsed, size) in results.items():
+        print(f"{writer:>10} {elapsed:>7.2f}s {size / 1024:>8.0f}KB {100.0 * size / base_size:>10.1f}%")
+
+if __name__ == "__main__":
+    main()
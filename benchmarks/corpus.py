@@ -0,0 +1,95 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources import EXTENSIONS
+
+# A few lines of each language, repeated and varied to make up source files
+SNIPPETS = {
+    ".txt": ["Notes for release {n}", "", "- fixed the parser for item {n}", "- see section {n} below"],
+    ".py": ["def step_{n}(value, scale=2):", "    # scale the value", "    return value * scale + {n}", ""],
+    ".java": ["public int step{n}(int value) {{", "    // scale the value", "    return value * 2 + {n};", "}}"],
+    ".cpp": ["#include <vector>", "int step_{n}(const std::vector<int>& v) {{", "    return v.size() * {n};", "}}"],
+    ".html": ["<div class=\"row-{n}\">", "  <a href=\"/item/{n}\">Item {n}</a>", "</div>"],
+    ".css": [".row-{n} {{", "  margin: {n}px 0;", "  color: #3498db;", "}}"],
+    ".js": ["function step{n}(value) {{", "  // scale the value", "  return value * 2 + {n};", "}}"],
+    ".rb": ["def step_{n}(value)", "  # scale the value", "  value * 2 + {n}", "end"],
+    ".php": ["<?php", "function step{n}($value) {{", "    return $value * 2 + {n};", "}}"],
+    ".swift": ["func step{n}(_ value: Int) -> Int {{", "    // scale the value", "    return value * 2 + {n}", "}}"],
+    ".go": ["func step{n}(value int) int {{", "\t// scale the value", "\treturn value*2 + {n}", "}}"],
+    ".pl": ["sub step_{n} {{", "    my ($value) = @_;", "    return $value * 2 + {n};", "}}"],
+    ".ts": ["function step{n}(value: number): number {{", "  // scale the value", "  return value * 2 + {n};", "}}"],
+}
+
+# Text outside Latin-1: accents, Greek, Cyrillic, CJK, symbols and emoji
+UNICODE_WORDS = ["naïve", "café", "Ωmega", "λ", "привет", "数据", "処理", "→", "≠", "✓", "🙂", "€", "ß", "Ünïcödé"]
+
+def source_lines(extension, count, rng):
+    snippet = SNIPPETS[extension]
+    lines = []
+    n = 0
+    while len(lines) < count:
+        lines.extend(line.format(n=n) for line in snippet)
+        n += rng.randint(1, 9)
+    return lines[:count]
+
+def write_file(path, lines):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return path
+
+def write_corpus(folder, scale=1.0, seed=0):
+    # Writes the benchmark corpus under folder; returns {case: [paths]}. The same
+    # scale and seed always give the same files, so runs stay comparable.
+    rng = random.Random(seed)
+    extensions = sorted(EXTENSIONS)
+
+    def count(n):
+        return max(1, int(n * scale))
+
+    cases = {}
+
+    def case(name):
+        path = os.path.join(folder, name)
+        os.makedirs(path, exist_ok=True)
+        cases[name] = []
+        return path
+
+    # Many tiny files: per-file overhead dominates
+    path = case("tiny")
+    for i in range(count(1000)):
+        extension = extensions[i % len(extensions)]
+        lines = source_lines(extension, rng.randint(1, 12), rng)
+        cases["tiny"].append(write_file(os.path.join(path, f"tiny_{i}{extension}"), lines))
+
+    # A few huge files: the render loop and the writer dominate
+    path = case("huge")
+    for i in range(count(2)):
+        lines = source_lines(".py", count(50000), rng)
+        cases["huge"].append(write_file(os.path.join(path, f"huge_{i}.py"), lines))
+
+    # Long lines that wrap over many rows
+    path = case("long_lines")
+    for i in range(count(20)):
+        lines = [" ".join(source_lines(".js", rng.randint(20, 400), rng)) for _ in range(count(40))]
+        cases["long_lines"].append(write_file(os.path.join(path, f"long_{i}.js"), lines))
+
+    # Non-ASCII text mixed into code
+    path = case("unicode")
+    for i in range(count(50)):
+        lines = []
+        for line in source_lines(".py", 300, rng):
+            words = rng.sample(UNICODE_WORDS, rng.randint(1, 4))
+            lines.append(line + "  # " + " ".join(words))
+        cases["unicode"].append(write_file(os.path.join(path, f"unicode_{i}.py"), lines))
+
+    # Medium files in every supported language
+    path = case("languages")
+    for extension in extensions:
+        for i in range(count(5)):
+            lines = source_lines(extension, rng.randint(200, 2000), rng)
+            cases["languages"].append(write_file(os.path.join(path, f"sample_{i}{extension}"), lines))
+
+    return cases
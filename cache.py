@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Default size cap for a conversion cache
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+CACHE_FOLDER_NAME = ".cache"
+
+# Bytes hashed per read
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def partial_path(path):
+    # Where one writer puts path until it is complete. Processes and threads writing the
+    # same entry (identical sources share a key) each get their own, and the last replace wins
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.part"
+
+def _place(source, destination):
+    # Hard link when possible so a hit costs no copy; the link is swapped in atomically
+    partial = partial_path(destination)
+    try:
+        try:
+            os.link(source, partial)
+        except OSError:
+            shutil.copyfile(source, partial)
+        os.replace(partial, destination)
+    except OSError:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+class ConversionCache:
+    # Finished PDFs keyed on source contents plus render settings. Each entry is
+    # <key>.pdf with a <key>.json holding the conversion stats; the .pdf mtime is
+    # bumped on every hit so eviction can drop the least recently used entries.
+    def __init__(self, folder, max_bytes=DEFAULT_CACHE_SIZE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, source_digest, settings):
+        # source_digest is file_digest() of the source file
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        digest.update(source_digest.encode("ascii"))
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.folder, key + ".pdf"), os.path.join(self.folder, key + ".json")
+
+    def fetch(self, key, output_path):
+        pdf_path, meta_path = self._entry(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                stats = json.load(file)
+            os.utime(pdf_path)
+            # Output still linked to this entry from a previous run: nothing to write
+            if not (os.path.exists(output_path) and os.path.samefile(pdf_path, output_path)):
+                _place(pdf_path, output_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return stats
+
+    def store(self, key, pdf_path, stats):
+        # Best effort: the PDF is already written, and losing an entry only costs a later miss
+        entry_path, meta_path = self._entry(key)
+        partial = partial_path(meta_path)
+        try:
+            _place(pdf_path, entry_path)
+            with open(partial, "w", encoding="utf-8") as file:
+                json.dump(stats, file)
+            os.replace(partial, meta_path)
+        except OSError:
+            if os.path.exists(partial):
+                os.remove(partial)
+            return False
+        return True
+
+    def entries(self):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(".pdf"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits its cap
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for path in self._entry(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+            removed += 1
+        return removed
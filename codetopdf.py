@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import cProfile
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import CACHE_FOLDER_NAME, DEFAULT_CACHE_SIZE, ConversionCache
+from converter import COMPRESS_LEVEL, RENDERERS, convert_file, preload_fonts
+from profiling import Profile, append_jsonl, format_report, merge_reports
+from project import build_project
+from search import DEFAULT_LIMIT, SEARCH_INDEX_NAME, SearchIndex
+from sources import common_root, expand_sources, find_sources, output_paths
+
+# Default output folder, shared with the desktop app
+PDF_FOLDER = "SavedPDFs"
+
+# Sources bigger than this (in MB) are skipped by a batch unless asked otherwise
+DEFAULT_MAX_SIZE = 100
+
+# Search index connections of this (worker) process, by folder
+_search_indexes = {}
+
+def _search_index(folder):
+    if folder not in _search_indexes:
+        _search_indexes[folder] = SearchIndex(folder)
+    return _search_indexes[folder]
+
+def _convert_job(job):
+    # Runs in a worker process; errors are reported, not raised, so one bad file can't sink the batch
+    file_path, output_path, font, cache_folder, cache_size, search_folder, timed, options = job
+    profile = Profile() if timed else None
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cache = ConversionCache(cache_folder, cache_size) if cache_folder else None
+        search_index = _search_index(search_folder) if search_folder else None
+        return convert_file(file_path, output_path, font=font, cache=cache, search_index=search_index,
+                            profile=profile, **options)
+    except Exception as e:
+        failure = {"source": file_path, "error": str(e)}
+        if profile is not None:
+            failure["profile"] = profile.report()
+        return failure
+
+def convert_tree(root, output_folder, font="arial", jobs=None, cache_folder=None, cache_size=DEFAULT_CACHE_SIZE,
+                 index=True, timed=False, **options):
+    # options are passed on to convert_file (highlight, compress_level, object_streams, max_bytes and
+    # the line window options); with index, the text goes into the output folder's search index,
+    # and with timed every result carries a profiling report. One job runs in this process.
+    if os.path.isfile(root):
+        sources = [root]
+        root = os.path.dirname(root) or "."
+    else:
+        sources = list(find_sources(root, output_folder))
+    search_folder = output_folder if index else None
+    outputs = output_paths(sources, root, output_folder)
+    work = [(path, outputs[path], font, cache_folder, cache_size, search_folder, timed,
+             options) for path in sources]
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        yield from map(_convert_job, work)
+        return
+    chunksize = max(1, len(work) // (jobs * 8))
+    preload_fonts(font)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=preload_fonts, initargs=(font,)) as executor:
+        for result in executor.map(_convert_job, work, chunksize=chunksize):
+            yield result
+
+def print_summary(results, elapsed, show_cache=False):
+    converted = [r for r in results if "error" not in r and not r.get("skipped")]
+    failed = sum(1 for r in results if "error" in r)
+    skipped = len(results) - len(converted) - failed
+    pages = sum(r["pages"] for r in converted)
+    megabytes = sum(r["bytes"] for r in converted) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+
+    print(f"Converted {len(converted)} files ({failed} failed, {skipped} skipped) in {elapsed:.2f}s")
+    print(f"  {len(converted) / elapsed:.1f} files/s, {pages / elapsed:.1f} pages/s, {megabytes / elapsed:.2f} MB/s")
+    recoded = sum(1 for r in converted if r.get("encoding") not in ("utf-8", None))
+    if recoded:
+        print(f"  {recoded} files read as something other than UTF-8")
+    font_bytes = sum(r.get("font_bytes", 0) for r in converted)
+    if font_bytes:
+        print(f"  fonts: {font_bytes / 1024:.1f} KB of subset font data embedded")
+    if show_cache:
+        hits = sum(1 for r in converted if r.get("cached"))
+        print(f"  cache: {hits} hits, {len(converted) - hits} misses")
+
+def line_window(text):
+    # "FIRST-LAST" or "FIRST-" (to the end), counted from 1
+    first, sep, last = text.partition("-")
+    try:
+        window = (int(first), int(last) if last else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected FIRST-LAST or FIRST-, got {text!r}")
+    if not sep or window[0] < 1 or window[1] is not None and window[1] < window[0]:
+        raise argparse.ArgumentTypeError(f"expected FIRST-LAST or FIRST- with 1 <= FIRST <= LAST, got {text!r}")
+    return window
+
+def at_least(minimum):
+    # argparse type for an int no smaller than minimum
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected a whole number, got {text!r}")
+        if value < minimum:
+            raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {value}")
+        return value
+    return parse
+
+def output_options(args):
+    return {"highlight": not args.plain, "compress_level": args.compress_level,
+            "object_streams": not args.no_object_streams}
+
+def add_output_arguments(parser):
+    parser.add_argument("--plain", action="store_true", help="no syntax highlighting")
+    parser.add_argument("--compress-level", type=int, choices=range(0, 10), default=COMPRESS_LEVEL, metavar="0-9",
+                        help="Flate level for page content (default: %(default)s)")
+    parser.add_argument("--no-object-streams", action="store_true",
+                        help="write a classic xref table instead of PDF 1.5 object and xref streams")
+
+def cmd_convert(args):
+    start = time.perf_counter()
+    cache_folder = None
+    if not args.no_cache:
+        cache_folder = args.cache_dir or os.path.join(args.output, CACHE_FOLDER_NAME)
+    cache_size = args.cache_size * 1024 * 1024
+    results = []
+    timed = args.timings or bool(args.profile_log)
+    # cProfile only sees this process, so a profiled run converts here, one file at a time
+    profiler = cProfile.Profile() if args.profile else None
+    jobs = 1 if profiler else args.jobs
+    if profiler:
+        profiler.enable()
+    max_bytes = args.max_size * 1024 * 1024 if args.max_size else None
+    for result in convert_tree(args.path, args.output, font=args.font, jobs=jobs,
+                               cache_folder=cache_folder, cache_size=cache_size, index=not args.no_index,
+                               timed=timed, max_bytes=max_bytes, lines=args.lines, start_byte=args.start_byte,
+                               max_pages=args.max_pages, **output_options(args)):
+        if "error" in result:
+            stage = result.get("profile", {}).get("failed_stage")
+            during = f" (during {stage})" if stage else ""
+            print(f"FAILED {result['source']}{during}: {result['error']}", file=sys.stderr)
+        elif args.verbose and result.get("skipped"):
+            print(f"skipped {result['source']}: {result['skipped']}")
+        elif args.verbose:
+            note = " (cached)" if result.get("cached") else ""
+            if result["encoding"] != "utf-8":
+                note += f" [{result['encoding']}]"
+            if result.get("truncated"):
+                note += " [stopped at --max-pages]"
+            print(f"{result['source']} -> {result['output']} ({result['pages']} pages){note}")
+        if args.profile_log:
+            append_jsonl(args.profile_log, result)
+        results.append(result)
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+    print_summary(results, time.perf_counter() - start, show_cache=bool(cache_folder))
+    if args.timings:
+        # Summed over files, so with several jobs the total exceeds the wall time
+        print("Time per stage, over all files:")
+        print(format_report(merge_reports(r["profile"] for r in results if "profile" in r)))
+    if profiler:
+        print(f"cProfile data written to {args.profile} (snakeviz, or flameprof for a flame graph)")
+    if cache_folder:
+        ConversionCache(cache_folder, cache_size).evict()
+    return 1 if any("error" in r for r in results) else 0
+
+def cmd_project(args):
+    root = common_root(args.paths)
+    output = args.output or os.path.join(PDF_FOLDER, os.path.basename(root) + ".pdf")
+    # Whatever sits in the output folder stays out of the book
+    sources = expand_sources(args.paths, os.path.dirname(os.path.abspath(output)))
+    if not sources:
+        print("No supported source files found", file=sys.stderr)
+        return 1
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    result = build_project(root, output, font=args.font, jobs=args.jobs, sources=sources, **output_options(args))
+    print(f"{result['output']}: {result['files']} files ({result['rebuilt']} rebuilt, {result['reused']} reused), "
+          f"{result['pages']} pages in {result['seconds']:.2f}s")
+    if result["font_bytes_separate"]:
+        saved = result["font_bytes_separate"] - result["font_bytes"]
+        print(f"  fonts: {result['font_bytes'] / 1024:.1f} KB shared subset, "
+              f"about {saved / 1024:.1f} KB saved against one PDF per file")
+    return 0
+
+def cmd_search(args):
+    if not os.path.exists(os.path.join(args.folder, SEARCH_INDEX_NAME)):
+        print(f"No search index in {args.folder}; convert some files into it first", file=sys.stderr)
+        return 1
+    search_index = SearchIndex(args.folder)
+    start = time.perf_counter()
+    hits = search_index.search(args.query, limit=args.limit)
+    elapsed = time.perf_counter() - start
+    for path, page, line, text in hits:
+        print(f"{os.path.relpath(path)}:{page}:{line}: {text.strip()}")
+    print(f"{len(hits)} matches in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    search_index.close()
+    return 0 if hits else 1
+
+def cmd_serve(args):
+    from server import serve
+
+    def ready(address, conversion_server):
+        print(f"Serving on {address} with {conversion_server.workers} workers, "
+              f"spool in {conversion_server.spool_folder}", flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket, args.spool, args.jobs, args.queue_depth,
+                          use_cache=not args.no_cache, ready=ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def cmd_submit(args):
+    from work_queue import init_queue, submit
+
+    options = dict(output_options(args), max_bytes=args.max_size * 1024 * 1024 if args.max_size else None)
+    try:
+        init_queue(args.work_dir, args.font, options, args.lease_timeout)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    output = os.path.abspath(args.output or os.path.join(args.work_dir, PDF_FOLDER))
+    counts = submit(args.work_dir, args.path, output)
+    print(f"Queued {counts['queued']} files in {args.work_dir} ({counts['waiting']} already waiting, "
+          f"{counts['done']} done and unchanged); PDFs go to {output}")
+    return 0
+
+def cmd_work(args):
+    from work_queue import run_node
+
+    start = time.perf_counter()
+    try:
+        stats = run_node(args.work_dir, args.jobs or os.cpu_count() or 1, exit_when_idle=not args.keep_running)
+    except KeyboardInterrupt:
+        # Our leases go back to the queue once they expire
+        return 1
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    died = stats.count(None)
+    stats = [s for s in stats if s is not None]
+    files = sum(s["files"] for s in stats)
+    print(f"{len(stats)} workers converted {files} files ({sum(s['failed'] for s in stats)} failed, "
+          f"{sum(s['lost'] for s in stats)} leases lost) in {elapsed:.2f}s, {files / elapsed:.1f} files/s")
+    if died:
+        print(f"{died} worker processes died; their leases go back to the queue once they expire")
+        return 1
+    return 0
+
+def cmd_coordinate(args):
+    from work_queue import coordinate
+
+    def report(text):
+        print(f"[{time.strftime('%H:%M:%S')}] {text}", flush=True)
+
+    try:
+        status = coordinate(args.work_dir, args.interval, once=args.once, report=report)
+    except KeyboardInterrupt:
+        return 0
+    return 1 if status["failed"] else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="codetopdf", description="Convert source code files to PDF without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="convert a file or every supported file under a directory")
+    convert.add_argument("path", help="source file or directory")
+    convert.add_argument("-o", "--output", default=PDF_FOLDER, help="folder for the generated PDFs (default: %(default)s)")
+    convert.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    convert.add_argument("--font", choices=sorted(RENDERERS), default="arial", help="render path (default: %(default)s)")
+    add_output_arguments(convert)
+    convert.add_argument("--cache-dir", default=None, help=f"conversion cache (default: <output>/{CACHE_FOLDER_NAME})")
+    convert.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                         help="cache size cap in MB, least recently used entries are evicted (default: %(default)s)")
+    convert.add_argument("--no-cache", action="store_true", help="always re-render")
+    convert.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE, metavar="MB",
+                         help="skip sources bigger than this, 0 for no limit (default: %(default)s)")
+    window = convert.add_mutually_exclusive_group()
+    window.add_argument("--lines", type=line_window, default=None, metavar="FIRST-LAST",
+                        help="render only these lines of each file, e.g. 120000-121000, or 500- for the rest")
+    window.add_argument("--start-byte", type=at_least(0), default=None, metavar="N",
+                        help="start each file at the line holding byte N")
+    convert.add_argument("--max-pages", type=at_least(1), default=None, metavar="N", help="stop each file after N pages")
+    convert.add_argument("--no-index", action="store_true",
+                         help=f"don't add the text to the output folder's search index ({SEARCH_INDEX_NAME})")
+    convert.add_argument("-v", "--verbose", action="store_true", help="print every converted file")
+    convert.add_argument("--timings", action="store_true",
+                         help="report time per stage (read, decode, tokenize, layout, font, compress, write, ...)")
+    convert.add_argument("--profile-log", metavar="FILE", default=None,
+                         help="append every result with its stage timings and counters to FILE as JSON lines")
+    convert.add_argument("--profile", metavar="FILE", default=None,
+                         help="run in one process under cProfile and write the stats to FILE")
+    convert.set_defaults(func=cmd_convert)
+
+    project = subparsers.add_parser("project", help="bind source files and trees into one PDF with contents and "
+                                                    "bookmarks, rebuilding only changed files")
+    project.add_argument("paths", nargs="+", help="source files and directories, in book order")
+    project.add_argument("-o", "--output", default=None,
+                         help=f"output PDF (default: {PDF_FOLDER}/<name of the folder they share>.pdf)")
+    project.add_argument("-j", "--jobs", type=int, default=None, help="worker processes for files that need a layout")
+    project.add_argument("--font", choices=sorted(RENDERERS), default="arial", help="render path (default: %(default)s)")
+    add_output_arguments(project)
+    project.set_defaults(func=cmd_project)
+
+    search = subparsers.add_parser("search", help="find text in converted PDFs, as file:page:line")
+    search.add_argument("query", help="words that must all appear on the same page")
+    search.add_argument("-f", "--folder", default=PDF_FOLDER, help="folder holding the PDFs (default: %(default)s)")
+    search.add_argument("-n", "--limit", type=int, default=DEFAULT_LIMIT, help="most matches shown (default: %(default)s)")
+    search.set_defaults(func=cmd_search)
+
+    serve = subparsers.add_parser("serve", help="run a local conversion service: POST /jobs?name=<file>, "
+                                                "GET /jobs/<id>[?wait=<s>], GET /jobs/<id>/pdf, GET /status")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    serve.add_argument("--port", type=int, default=8765, help="TCP port (default: %(default)s)")
+    serve.add_argument("--socket", default=None, help="listen on this Unix socket instead of TCP")
+    serve.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    serve.add_argument("--queue-depth", type=int, default=64,
+                       help="jobs that may wait for a worker before submissions are refused (default: %(default)s)")
+    serve.add_argument("--spool", default=None, help="folder for uploaded sources and PDFs (default: a temp dir)")
+    serve.add_argument("--no-cache", action="store_true", help="convert every submission, even a repeated one")
+    serve.set_defaults(func=cmd_serve)
+
+    submit = subparsers.add_parser("submit", help="queue files in a shared work directory for `work` nodes to convert")
+    submit.add_argument("work_dir", help="work directory every node can reach (created if needed)")
+    submit.add_argument("path", help="source file or directory")
+    submit.add_argument("-o", "--output", default=None,
+                        help=f"folder for the generated PDFs, shared by all nodes (default: <work_dir>/{PDF_FOLDER})")
+    submit.add_argument("--font", choices=sorted(RENDERERS), default="arial", help="render path (default: %(default)s)")
+    add_output_arguments(submit)
+    submit.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE, metavar="MB",
+                        help="skip sources bigger than this, 0 for no limit (default: %(default)s)")
+    submit.add_argument("--lease-timeout", type=float, default=120, metavar="SECONDS",
+                        help="seconds without a heartbeat before a task is handed to another node "
+                             "(default: %(default)s)")
+    submit.set_defaults(func=cmd_submit)
+
+    work = subparsers.add_parser("work", help="convert tasks from a shared work directory until none are left")
+    work.add_argument("work_dir", help="work directory filled by `submit`")
+    work.add_argument("-j", "--jobs", type=int, default=None, help="worker processes on this node (default: CPU count)")
+    work.add_argument("--keep-running", action="store_true", help="wait for more work instead of exiting when idle")
+    work.set_defaults(func=cmd_work)
+
+    coordinator = subparsers.add_parser("coordinate", help="report progress, throughput and stragglers of a shared "
+                                                           "work directory and requeue expired leases")
+    coordinator.add_argument("work_dir", help="work directory filled by `submit`")
+    coordinator.add_argument("--interval", type=float, default=10, help="seconds between reports (default: %(default)s)")
+    coordinator.add_argument("--once", action="store_true", help="report once and exit")
+    coordinator.set_defaults(func=cmd_coordinate)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,787 @@
+import os
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left
+from itertools import islice
+
+from fpdf import FPDF
+
+from cache import file_digest
+from fonts import load_font
+from highlight import STYLE_COLORS, TOKEN_CACHE, TOKEN_CACHE_MAX_BYTES, tokenizer_for
+from layout import CodeLayout, HighlightLayout
+from line_index import BYTE_NEWLINE_ENCODINGS, source_window
+from profiling import NO_PROFILE
+from sniff import sniff_file
+from streaming import FileBuffer, OffsetTable, read_lines
+
+# Fonts folder path, next to this file so the renderer works from any directory
+FONTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+MINECRAFT_FONT_PATH = os.path.join(FONTS_FOLDER, "Minecraft.ttf")
+
+# How often (in source lines) the render loop reports progress
+PROGRESS_INTERVAL = 500
+
+# Page objects listed per line in the pages root
+KIDS_PER_LINE = 1000
+
+# Bump whenever a change alters the PDFs we produce, so cached output is not reused
+RENDER_VERSION = 4
+
+# Shown in a book in place of a binary file's contents
+BINARY_NOTE = "(binary file, not shown)"
+
+# Flate level for page content, fonts and object streams (zlib's default)
+COMPRESS_LEVEL = 6
+
+# Objects per object stream, and the write buffer for output files
+OBJECTS_PER_STREAM = 200
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Page dictionary as written for every page of a streamed document
+PAGE_OBJECT = '<</Type /Page\n/Parent 1 0 R\n/Resources 2 0 R\n/Contents %d 0 R>>'
+
+# Header drawing per renderer class, painted through one form XObject
+_header_forms = {}
+
+# The identity ToUnicode CMap FPDF writes for every TTF font, compressed once here
+TO_UNICODE = zlib.compress((
+    "/CIDInit /ProcSet findresource begin\n"
+    "12 dict begin\n"
+    "begincmap\n"
+    "/CIDSystemInfo\n"
+    "<</Registry (Adobe)\n"
+    "/Ordering (UCS)\n"
+    "/Supplement 0\n"
+    ">> def\n"
+    "/CMapName /Adobe-Identity-UCS def\n"
+    "/CMapType 2 def\n"
+    "1 begincodespacerange\n"
+    "<0000> <FFFF>\n"
+    "endcodespacerange\n"
+    "1 beginbfrange\n"
+    "<0000> <FFFF> <0000>\n"
+    "endbfrange\n"
+    "endcmap\n"
+    "CMapName currentdict /CMap defineresource pop\n"
+    "end\n"
+    "end"
+).encode("latin-1"))
+
+# PDF class with the plain Arial layout
+class PDF(FPDF):
+    streaming = False
+    # (offset, length) of every content stream written, when requested
+    page_streams = None
+    # Bytes of embedded font data (programs, glyph maps, CMaps) written so far
+    font_bytes = 0
+
+    # Output options; part of the render settings. Object streams (PDF 1.5)
+    # only apply to streamed documents
+    compress_level = COMPRESS_LEVEL
+    object_streams = False
+    # Draw the header once as a form XObject instead of on every page
+    header_form = True
+    _capture = None
+    # search.IndexWriter that receives the text of every page, when indexing
+    text_index = None
+    # profiling.Profile timing the stages of this render
+    profile = NO_PROFILE
+
+    # Render settings; anything here changes the output and is part of the cache key
+    code_font = "Arial"
+    code_font_size = 12
+    line_height = 10
+    header_font = ("Arial", "B", 12)
+    header_text = ""
+    # File name shown under the header on every page of a book section
+    section_title = None
+    # Pages after which the render stops, and whether it had to
+    max_pages = None
+    truncated = False
+
+    def stream_to(self, file):
+        # Write objects straight to `file` and flush every page as soon as it is finished,
+        # so memory stays flat however long the document gets
+        self.streaming = True
+        self.buffer = FileBuffer(file, self.profile)
+        self.offsets = OffsetTable()
+        self.outline = []
+        if self.object_streams:
+            self.pdf_version = "1.5"
+            # Objects written during _enddoc that go into object streams, as (n, body)
+            self._stream_objects = []
+        self._putheader()
+
+    def _putheader(self):
+        if not (self.streaming and len(self.buffer)):
+            super()._putheader()
+
+    def _endpage(self):
+        super()._endpage()
+        if self.streaming:
+            self._putpage(self.page)
+            del self.pages[self.page]
+
+    def _putpage(self, n):
+        content = self.pages[n].encode("latin-1")
+        if self.compress:
+            with self.profile.span("compress"):
+                content = zlib.compress(content, self.compress_level)
+        self._putpageobjects(content)
+
+    def add_compressed_page(self, content):
+        # Append a page whose content stream was compressed elsewhere, e.g. by
+        # render_pages or copied out of a previous PDF (streaming documents only)
+        self.page += 1
+        self._putpageobjects(content)
+
+    def _putpageobjects(self, content):
+        # Same objects FPDF._putpages writes for a page (no links or orientation
+        # changes), assembled in one go since large documents have many pages
+        n = self.n + 1
+        if self.object_streams:
+            # Page dictionaries are rebuilt from the page number when the object streams are written
+            self.offsets.compressed(n, (self.page - 1) // OBJECTS_PER_STREAM, (self.page - 1) % OBJECTS_PER_STREAM)
+        else:
+            self.offsets[n] = len(self.buffer)
+            self.buffer += '%d 0 obj\n%s\nendobj\n' % (n, PAGE_OBJECT % (n + 1))
+        self.offsets[n + 1] = len(self.buffer)
+        filter = '/Filter /FlateDecode ' if self.compress else ''
+        self.buffer += '%d 0 obj\n<<%s/Length %d>>\nstream\n' % (n + 1, filter, len(content))
+        if self.page_streams is not None:
+            # Where the stream data lands, so a later build can copy it back out
+            self.page_streams.append((len(self.buffer), len(content)))
+        self.buffer.write(content)
+        self.buffer += '\nendstream\nendobj\n'
+        self.n = n + 1
+
+    def page_object(self, n):
+        # Object number of page n in a streamed document
+        return 3 + 2 * (n - 1)
+
+    def add_bookmark(self, title, page):
+        self.outline.append((title, page))
+
+    def used_glyphs(self):
+        # Code points drawn with a subset (TTF) font, beyond the control range FPDF always includes
+        glyphs = set()
+        for font in self.fonts.values():
+            if font["type"] == "TTF":
+                glyphs.update(code for code in font["subset"] if code >= 32)
+        return sorted(glyphs)
+
+    def register_fonts(self, glyphs=()):
+        # Register fonts in the order a render does, so /F<n> names in copied
+        # content streams stay valid, and give subset fonts every glyph they need
+        self.set_font(*self.header_font)
+        self.set_font(self.code_font, size=self.code_font_size)
+        for font in self.fonts.values():
+            if font["type"] == "TTF":
+                known = set(font["subset"])
+                font["subset"].extend(code for code in glyphs if code not in known)
+
+    def separate_font_bytes(self, glyph_sets):
+        # Estimated font data of one PDF per glyph set, had each been written on its own:
+        # an empty subset plus that many glyphs at the average size they take in this
+        # document's subset. Nothing is subset just to be measured
+        total = 0
+        for font in self.fonts.values():
+            if "metrics" not in font:
+                continue
+            metrics = font["metrics"]
+            empty = metrics.empty_subset_size()
+            glyphs = len({code for code in font["subset"] if code >= 32})
+            per_glyph = (metrics.subset(font["subset"]).size - empty) / glyphs if glyphs else 0
+            total += sum(empty + len(codes) * per_glyph + len(TO_UNICODE) for codes in glyph_sets)
+        return round(total)
+
+    def finish(self):
+        # Close a streamed document whose pages were all added with add_compressed_page
+        self._enddoc()
+        self.offsets.close()
+
+    def _putpages(self):
+        if not self.streaming:
+            return super()._putpages()
+        # Pages are already written; only the root is left
+        self._beginobj(1)
+        self._out('<</Type /Pages')
+        self._out('/Kids [')
+        for first in range(0, self.page, KIDS_PER_LINE):
+            count = min(KIDS_PER_LINE, self.page - first)
+            self._out(' '.join(str(3 + 2 * i) + ' 0 R' for i in range(first, first + count)))
+        self._out(']')
+        self._out('/Count ' + str(self.page))
+        self._out('/MediaBox [0 0 %.2f %.2f]' % (self.w_pt, self.h_pt))
+        self._out('>>')
+        self._out('endobj')
+
+    def _putfonts(self):
+        with self.profile.span("font"):
+            self._putallfonts()
+
+    def _putallfonts(self):
+        # FPDF writes the core fonts; TTF fonts from the metrics registry are
+        # written here from the subset cache instead of being re-subset every time
+        fonts = self.fonts
+        self.fonts = {k: font for k, font in fonts.items() if "metrics" not in font}
+        try:
+            super()._putfonts()
+        finally:
+            self.fonts = fonts
+        for font in sorted((font for font in fonts.values() if "metrics" in font), key=lambda font: font["i"]):
+            self._putsubsetfont(font)
+
+    def _putsubsetfont(self, font):
+        # The objects FPDF._putfonts writes for a TTF font, with a compressed ToUnicode CMap
+        subset = font["metrics"].subset(font["subset"])
+        fontname = 'MPDFAA+' + font['name']
+        font['n'] = self.n + 1
+        self._newobj()
+        self._out('<</Type /Font\n/Subtype /Type0\n/BaseFont /%s\n/Encoding /Identity-H' % fontname)
+        self._out('/DescendantFonts [%d 0 R]\n/ToUnicode %d 0 R\n>>\nendobj' % (self.n + 1, self.n + 2))
+        self._newobj()
+        self._out('<</Type /Font\n/Subtype /CIDFontType2\n/BaseFont /' + fontname)
+        self._out('/CIDSystemInfo %d 0 R\n/FontDescriptor %d 0 R' % (self.n + 2, self.n + 3))
+        if font['desc'].get('MissingWidth'):
+            self._out('/DW %d' % font['desc']['MissingWidth'])
+        self._out(subset.widths)
+        self._out('/CIDToGIDMap %d 0 R\n>>\nendobj' % (self.n + 4))
+        self._putbinarystream(TO_UNICODE)
+        self._newobj()
+        self._out('<</Registry (Adobe)\n/Ordering (UCS)\n/Supplement 0\n>>\nendobj')
+        self._newobj()
+        self._out('<</Type /FontDescriptor\n/FontName /' + fontname)
+        for key in ('Ascent', 'Descent', 'CapHeight', 'Flags', 'FontBBox', 'ItalicAngle', 'StemV', 'MissingWidth'):
+            value = font['desc'][key]
+            if key == 'Flags':
+                value = (value | 4) & ~32  # non-symbolic
+            self._out(' /%s %s' % (key, value))
+        self._out('/FontFile2 %d 0 R\n>>\nendobj' % (self.n + 2))
+        self._putbinarystream(subset.cid_to_gid)
+        self._putbinarystream(subset.program, '/Length1 %d' % subset.length1)
+        self.font_bytes += subset.size + len(TO_UNICODE)
+
+    def _putbinarystream(self, data, extra=''):
+        # A Flate-compressed stream object written from bytes
+        self._newobj()
+        self._out('<</Length %d\n/Filter /FlateDecode%s\n>>\nstream' % (len(data), '\n' + extra if extra else ''))
+        self._out(data)
+        self._out('endstream\nendobj')
+
+    def _putresources(self):
+        # FPDF._putresources, plus the header form and the outline
+        self._putfonts()
+        self._putimages()
+        self.header_form_n = None
+        if self.header_form and self.header_text and self.page:
+            self._putheaderform()
+        self._beginobj(2)
+        self._out('<<')
+        self._putresourcedict()
+        self._out('>>')
+        self._out('endobj')
+        if self.streaming and self.outline:
+            self._putoutline()
+
+    def header_form_ops(self):
+        # What header() draws with cell(), rendered once per renderer class
+        cls = type(self)
+        if cls not in _header_forms:
+            scratch = cls()
+            scratch.header_form = False
+            scratch.add_page()
+            page = scratch.pages[1]
+            _header_forms[cls] = page[page.index("BT"):]
+        return _header_forms[cls]
+
+    def _putheaderform(self):
+        ops = self.header_form_ops().encode("latin-1")
+        filter = ''
+        if self.compress:
+            ops = zlib.compress(ops, self.compress_level)
+            filter = '/Filter /FlateDecode '
+        self._newobj()
+        self.header_form_n = self.n
+        self._out('<</Type /XObject /Subtype /Form /BBox [0 0 %.2f %.2f] /Resources 2 0 R %s/Length %d>>' % (
+            self.w_pt, self.h_pt, filter, len(ops)))
+        self._putstream(ops)
+        self._out('endobj')
+
+    def _putxobjectdict(self):
+        super()._putxobjectdict()
+        if self.header_form_n:
+            self._out('/Hdr %d 0 R' % self.header_form_n)
+
+    def _newobj(self):
+        self.n += 1
+        self._beginobj(self.n)
+
+    def _beginobj(self, n):
+        if self._capture is None:
+            self.offsets[n] = len(self.buffer)
+            self._out(str(n) + ' 0 obj')
+            return
+        # Collecting for object streams: the object is only written once complete
+        self._endobj()
+        self._capture = (n, [])
+
+    def _endobj(self):
+        if not self._capture:
+            return
+        n, lines = self._capture
+        self._capture = ()
+        body = "\n".join(lines)
+        if body.endswith("endobj"):
+            body = body[:-len("endobj")].rstrip("\n")
+        if "\nstream\n" in body or body.startswith("stream\n"):
+            # Streams cannot live in an object stream
+            self.offsets[n] = len(self.buffer)
+            self.buffer += '%d 0 obj\n%s\nendobj\n' % (n, body)
+            return
+        index = self.page + len(self._stream_objects)
+        self.offsets.compressed(n, index // OBJECTS_PER_STREAM, index % OBJECTS_PER_STREAM)
+        self._stream_objects.append((n, body))
+
+    def _out(self, s):
+        if self._capture is None:
+            return super()._out(s)
+        if isinstance(s, bytes):
+            s = s.decode("latin-1")
+        self._capture[1].append(s)
+
+    def _putoutline(self):
+        # A flat bookmark list: one entry per (title, page)
+        self.outline_root = self.n + 1
+        self._newobj()
+        self._out('<</Type /Outlines /First %d 0 R /Last %d 0 R /Count %d>>' % (
+            self.outline_root + 1, self.outline_root + len(self.outline), len(self.outline)))
+        self._out('endobj')
+        for i, (title, page) in enumerate(self.outline):
+            n = self.outline_root + 1 + i
+            self._newobj()
+            entry = '<</Title ' + self._outlinetitle(title) + ' /Parent %d 0 R' % self.outline_root
+            if i > 0:
+                entry += ' /Prev %d 0 R' % (n - 1)
+            if i < len(self.outline) - 1:
+                entry += ' /Next %d 0 R' % (n + 1)
+            entry += ' /Dest [%d 0 R /XYZ 0 %.2f null]>>' % (self.page_object(page), self.h_pt)
+            self._out(entry)
+            self._out('endobj')
+
+    def _outlinetitle(self, title):
+        try:
+            title.encode("latin-1")
+            return self._textstring(title)
+        except UnicodeEncodeError:
+            # Titles outside Latin-1 are written as UTF-16BE with a byte order mark
+            return '<FEFF' + title.encode("utf-16-be").hex().upper() + '>'
+
+    def _putcatalog(self):
+        super()._putcatalog()
+        if self.streaming and self.outline:
+            self._out('/Outlines %d 0 R' % self.outline_root)
+            self._out('/PageMode /UseOutlines')
+
+    def _enddoc(self):
+        if not self.streaming:
+            return super()._enddoc()
+        # FPDF._enddoc minus the header (already written) and with the xref
+        # copied out of the spooled offset table in blocks
+        if self.object_streams:
+            self._capture = ()
+        self._putpages()
+        self._putresources()
+        self._newobj()
+        self._out('<<')
+        self._putinfo()
+        self._out('>>')
+        self._out('endobj')
+        info = self.n
+        self._newobj()
+        self._out('<<')
+        self._putcatalog()
+        self._out('>>')
+        self._out('endobj')
+        if self.object_streams:
+            self._endobj()
+            self._capture = None
+            first_stream = self.n + 1
+            self._putobjectstreams()
+            self._putxrefstream(first_stream, info + 1, info)
+            self.state = 3
+            return
+        o = len(self.buffer)
+        self._out('xref')
+        self._out('0 ' + str(self.n + 1))
+        self._out('0000000000 65535 f ')
+        for block in self.offsets.xref_blocks():
+            self.buffer += block
+        self._out('trailer')
+        self._out('<<')
+        self._puttrailer()
+        self._out('>>')
+        self._out('startxref')
+        self._out(o)
+        self._out('%%EOF')
+        self.state = 3
+
+    def _putobjectstreams(self):
+        # Page dictionaries first, in page order, then the objects collected in _enddoc
+        count = self.page + len(self._stream_objects)
+        for first in range(0, count, OBJECTS_PER_STREAM):
+            objects = []
+            for i in range(first, min(first + OBJECTS_PER_STREAM, count)):
+                if i < self.page:
+                    n = self.page_object(i + 1)
+                    objects.append((n, PAGE_OBJECT % (n + 1)))
+                else:
+                    objects.append(self._stream_objects[i - self.page])
+            self._putobjectstream(objects)
+        self._stream_objects = []
+
+    def _putobjectstream(self, objects):
+        index = []
+        bodies = []
+        offset = 0
+        for n, body in objects:
+            index.append('%d %d' % (n, offset))
+            bodies.append(body)
+            offset += len(body) + 1
+        head = ' '.join(index) + '\n'
+        with self.profile.span("compress"):
+            data = zlib.compress((head + '\n'.join(bodies)).encode("latin-1"), self.compress_level)
+        self._newobj()
+        self._out('<</Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d>>' % (
+            len(objects), len(head), len(data)))
+        self._putstream(data)
+        self._out('endobj')
+
+    def _putxrefstream(self, first_stream, root, info):
+        # The cross-reference stream is also the trailer. Rows are compressed
+        # into a temporary file first, since /Length has to come before the data
+        start = len(self.buffer)
+        self._newobj()
+        compressor = zlib.compressobj(self.compress_level)
+        with tempfile.TemporaryFile() as rows:
+            with self.profile.span("compress"):
+                for block in self.offsets.xref_rows(first_stream):
+                    rows.write(compressor.compress(block))
+                rows.write(compressor.flush())
+            self._out('<</Type /XRef /Size %d /W %s /Root %d 0 R /Info %d 0 R /Filter /FlateDecode /Length %d>>' % (
+                self.n + 1, OffsetTable.WIDTHS, root, info, rows.tell()))
+            self._out('stream')
+            rows.seek(0)
+            for chunk in iter(lambda: rows.read(WRITE_BUFFER_SIZE), b""):
+                self.buffer.write(chunk)
+        self._out('')
+        self._out('endstream')
+        self._out('endobj')
+        self._out('startxref')
+        self._out(start)
+        self._out('%%EOF')
+
+    def close(self):
+        super().close()
+        if self.streaming:
+            self.offsets.close()
+
+    def header(self):
+        self.set_font(*self.header_font)
+        if self.header_form and self.header_text:
+            # Paint the shared header form, then move on as cell(..., ln=1) would
+            if self.unifontsubset and self.page == 1:
+                # The form draws these glyphs, so the subset needs them as if cell() had
+                self.current_font['subset'].extend(map(ord, self.header_text))
+            self._out('/Hdr Do')
+            self.ln(10)
+        elif self.header_text or not self.section_title:
+            self.cell(0, 10, self.header_text, 0, 1, "C")
+        if self.section_title:
+            self.cell(0, 10, self.fit_text(self.section_title, self.w - self.l_margin - self.r_margin), 0, 1, "L")
+
+    def fit_text(self, text, width):
+        # text in the current font, cut from the left with "..." until it fits
+        # width; core fonts only cover Latin-1
+        if not self.unifontsubset:
+            text = text.encode("latin-1", "replace").decode("latin-1")
+        width -= 2 * self.c_margin
+        if self.get_string_width(text) <= width:
+            return text
+        while text and self.get_string_width("..." + text) > width:
+            text = text[1:]
+        return "..." + text
+
+    def add_contents(self, entries):
+        # Table of contents pages for (title, page) entries
+        self.add_page()
+        self.set_font(self.code_font, size=self.code_font_size)
+        self.cell(0, self.line_height, "Contents", 0, 1)
+        self.ln(self.line_height / 2)
+        number_width = self.get_string_width("0" * 7)
+        title_width = self.w - self.l_margin - self.r_margin - number_width
+        for title, page in entries:
+            self.cell(title_width, self.line_height, self.fit_text(title, title_width), 0, 0)
+            self.cell(number_width, self.line_height, str(page), 0, 1, "R")
+        # Finished here, so a streamed book can go on with add_compressed_page
+        self._endpage()
+
+    def contents_pages(self, count):
+        # Pages add_contents takes for `count` entries, from a scratch document
+        scratch = type(self)()
+        scratch.add_contents([("", 0)] * count)
+        return scratch.page
+
+    def add_code_content(self, content, progress=None):
+        return self.add_code_lines(content.splitlines(), progress)
+
+    def add_code_lines(self, lines, progress=None, highlighted=False):
+        self.set_font(self.code_font, size=self.code_font_size)
+        return self.write_lines(lines, progress, highlighted)
+
+    def write_lines(self, lines, progress=None, highlighted=False):
+        # Lines may be any iterable; they are laid out a block at a time.
+        # Highlighted lines are token runs from highlight.Tokenizer, not strings
+        if highlighted:
+            layout = HighlightLayout(self, self.line_height, STYLE_COLORS)
+        else:
+            layout = CodeLayout(self, self.line_height)
+        lines = iter(lines)
+        rendered = 0
+        text_index = self.text_index
+        profile = self.profile
+        # Pulling a block runs the source reader and, when highlighting, the tokenizer
+        source_stage = profile.span("tokenize" if highlighted else "decode")
+        while not self.truncated:
+            with source_stage:
+                block = list(islice(lines, PROGRESS_INTERVAL))
+            if not block:
+                break
+            with profile.span("layout"):
+                if text_index is None and self.max_pages is None:
+                    layout.write_rows(layout.wrap_lines(block))
+                else:
+                    starts = []
+                    rows = layout.wrap_lines(block, starts)
+                    wrapped = len(rows)
+                    placed = layout.write_rows(rows)
+                    if len(rows) < wrapped:
+                        # Out of pages: keep the lines that at least started on one
+                        self.truncated = True
+                        kept = bisect_left(starts, len(rows))
+                        block = block[:kept]
+                        starts = starts[:kept]
+            if text_index is not None:
+                with profile.span("index"):
+                    text_index.add_block(block, starts, placed, highlighted)
+            rendered += len(block)
+            profile.count("lines", len(block))
+            # progress(lines_rendered, pages_emitted) may raise to abort the render
+            if progress:
+                progress(rendered, self.page)
+        if progress and not rendered:
+            progress(0, self.page)
+        return rendered
+
+# PDF class with Minecraft font
+class MinecraftPDF(PDF):
+    code_font = "Minecraft"
+    # Use Minecraft font for the header
+    header_font = ("Minecraft", "", 14)
+    header_text = "Code to PDF Converter"
+
+    def __init__(self):
+        super().__init__()
+        # Register the Minecraft font from the shared metrics registry
+        load_font(MINECRAFT_FONT_PATH).install(self, "Minecraft")
+
+# Render paths selectable by name (GUI variant, CLI --font)
+RENDERERS = {
+    "arial": PDF,
+    "minecraft": MinecraftPDF,
+}
+
+# TTF files each render path needs
+RENDERER_FONTS = {
+    "minecraft": [MINECRAFT_FONT_PATH],
+}
+
+def preload_fonts(font):
+    # Load font metrics up front, e.g. before forking workers so they share the mapping
+    for ttf_path in RENDERER_FONTS.get(font, ()):
+        load_font(ttf_path)
+
+def new_document(font, compress_level=COMPRESS_LEVEL, object_streams=True):
+    pdf = RENDERERS[font]()
+    pdf.compress_level = compress_level
+    pdf.object_streams = object_streams
+    return pdf
+
+def render_settings(font, file_path, highlight=True, compress_level=COMPRESS_LEVEL, object_streams=True, window=None):
+    # window: the line or byte range and page cap of a partial render, if any
+    renderer = RENDERERS[font]
+    settings = {
+        "version": RENDER_VERSION,
+        "font": font,
+        "code_font": renderer.code_font,
+        "font_size": renderer.code_font_size,
+        "line_height": renderer.line_height,
+        "header": [renderer.header_text, *renderer.header_font],
+        "file_type": os.path.splitext(file_path)[1],
+        "highlight": highlight,
+        "compress_level": compress_level,
+        "object_streams": object_streams,
+    }
+    if window:
+        settings["window"] = window
+    return settings
+
+def source_lines(file, tokenizer=None, digest=None, profile=NO_PROFILE, encoding="utf-8", limit=None):
+    # The lines of a source file opened in binary mode, as token runs when highlighting,
+    # read from the current position for at most limit bytes. A stray undecodable
+    # byte becomes U+FFFD rather than failing the file
+    lines = read_lines(file, profile=profile, encoding=encoding, errors="replace", limit=limit)
+    if tokenizer is None:
+        return lines
+    return TOKEN_CACHE.tokenize(tokenizer, lines, digest)
+
+def skipped_result(file_path, size, reason, profile=None):
+    result = {"source": file_path, "output": None, "skipped": reason, "lines": 0, "pages": 0, "bytes": size,
+              "cached": False}
+    if profile is not None:
+        result["profile"] = profile.report()
+    return result
+
+def convert_file(file_path, output_path, font="arial", progress=None, cache=None, highlight=True,
+                 compress_level=COMPRESS_LEVEL, object_streams=True, search_index=None, profile=None,
+                 max_bytes=None, lines=None, start_byte=None, max_pages=None):
+    # search_index, a search.SearchIndex, gets the text of every page as it is laid out;
+    # profile, a profiling.Profile, times each stage and ends up in the result. Binary
+    # files, and files over max_bytes, are skipped: the result says why under "skipped".
+    # lines=(first, last) renders only those lines (from 1, last included, None for
+    # the end) and start_byte starts at the line holding that byte; both are found
+    # through a line_index.LineIndex. max_pages stops the render after that many pages
+    if lines is not None and start_byte is not None:
+        raise ValueError("a line window and a start byte can't be combined")
+    if lines is not None and (lines[0] < 1 or lines[1] is not None and lines[1] < lines[0]):
+        raise ValueError(f"bad line window {lines}: lines count from 1 and the last can't come before the first")
+    if start_byte is not None and start_byte < 0:
+        raise ValueError(f"bad start byte {start_byte}: bytes count from 0")
+    if max_pages is not None and max_pages < 1:
+        raise ValueError(f"bad page limit {max_pages}: at least one page is rendered")
+    seeking = lines is not None or bool(start_byte)
+    window = [lines and list(lines), start_byte, max_pages] if seeking or max_pages else None
+    tokenizer = tokenizer_for(file_path) if highlight else None
+    timed = profile is not None
+    profile = profile if timed else NO_PROFILE
+    size = os.path.getsize(file_path)
+    if max_bytes is not None and size > max_bytes:
+        return skipped_result(file_path, size, f"over {max_bytes / (1024 * 1024):g} MB", profile if timed else None)
+    with profile.span("sniff"):
+        with open(file_path, "rb") as file:
+            encoding = sniff_file(file)
+    if encoding is None:
+        return skipped_result(file_path, size, "binary", profile if timed else None)
+    if seeking and encoding not in BYTE_NEWLINE_ENCODINGS:
+        raise ValueError(f"line windows need a file whose lines end in a newline byte, not {encoding}")
+    digest = None
+    if cache is not None or search_index is not None or seeking or \
+            (tokenizer and size <= TOKEN_CACHE_MAX_BYTES):
+        with profile.span("hash"):
+            digest = file_digest(file_path)
+    # What the search index records as rendered: the file, or the window of it
+    text_digest = digest if window is None or digest is None else f"{digest}:{window}"
+    if cache is not None:
+        key = cache.key(digest, render_settings(font, file_path, highlight, compress_level, object_streams, window))
+    # A cached PDF comes without its text, so only use it if the index already has it
+    if cache is not None and (search_index is None or search_index.is_current(output_path, text_digest)):
+        stats = cache.fetch(key, output_path)
+        if stats is not None:
+            if progress:
+                progress(stats["lines"], stats["pages"])
+            result = dict(stats, source=file_path, output=output_path, encoding=encoding, cached=True)
+            if timed:
+                result["profile"] = profile.report()
+            return result
+
+    # The byte range to render, reached without decoding what comes before it
+    start, end, first_line = 0, size, 1
+    if seeking and size:
+        with profile.span("seek"):
+            with open(file_path, "rb") as file:
+                start, end, first_line = source_window(file, digest, lines, start_byte)
+
+    # Streams the source in chunks and the PDF out page by page; the output only
+    # replaces output_path once it is complete. The partial file is this writer's
+    # own, so two conversions racing for one output (a task a work queue handed
+    # out twice) both finish and the last one in wins
+    partial_path = f"{output_path}.{os.getpid()}-{threading.get_ident()}.part"
+    text_index = None
+    if search_index is not None:
+        text_index = search_index.writer(output_path, file_path, text_digest, first_line)
+    try:
+        with open(file_path, "rb") as file, open(partial_path, "wb", buffering=WRITE_BUFFER_SIZE) as out:
+            pdf = new_document(font, compress_level, object_streams)
+            pdf.text_index = text_index
+            pdf.profile = profile
+            pdf.max_pages = max_pages
+            pdf.stream_to(out)
+            pdf.add_page()
+            file.seek(start)
+            # Token runs of part of a file must not be cached as the whole file's
+            source = source_lines(file, tokenizer, digest if window is None else None, profile, encoding,
+                                  end - start if seeking else None)
+            rendered = pdf.add_code_lines(source, progress, tokenizer is not None)
+            pdf.close()
+        os.replace(partial_path, output_path)
+        if text_index is not None:
+            with profile.span("index"):
+                text_index.finish(pdf.page)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if text_index is not None:
+            text_index.abort()
+        raise
+
+    result = {
+        "source": file_path,
+        "output": output_path,
+        "lines": rendered,
+        "pages": pdf.page,
+        "bytes": size,
+        "font_bytes": pdf.font_bytes,
+        "encoding": encoding,
+        "truncated": pdf.truncated,
+        "cached": False,
+    }
+    if cache is not None:
+        cache.store(key, output_path, {"lines": rendered, "pages": pdf.page, "bytes": result["bytes"],
+                                       "font_bytes": pdf.font_bytes, "truncated": pdf.truncated})
+    if timed:
+        profile.count("pages", pdf.page)
+        profile.count("source_bytes", result["bytes"])
+        profile.count("output_bytes", pdf.buffer.size)
+        profile.count("font_bytes", pdf.font_bytes)
+        result["profile"] = profile.report()
+    return result
+
+def render_pages(file_path, font="arial", highlight=True, digest=None, compress_level=COMPRESS_LEVEL, title=None):
+    # Lay out one file on pages of its own and return the compressed content
+    # streams, ready to be placed into a larger document; title heads every page
+    tokenizer = tokenizer_for(file_path) if highlight else None
+    pdf = new_document(font, compress_level)
+    pdf.section_title = title
+    pdf.add_page()
+    with open(file_path, "rb") as file:
+        encoding = sniff_file(file)
+        if encoding is None:
+            # The book still lists the file, with a note in place of its contents
+            lines = pdf.add_code_lines([BINARY_NOTE])
+        else:
+            lines = pdf.add_code_lines(source_lines(file, tokenizer, digest, encoding=encoding),
+                                       highlighted=tokenizer is not None)
+    streams = [zlib.compress(pdf.pages[n].encode("latin-1"), compress_level) for n in range(1, pdf.page + 1)]
+    return {"lines": lines, "streams": streams, "glyphs": pdf.used_glyphs()}
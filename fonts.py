@@ -0,0 +1,263 @@
+import array
+import hashlib
+import json
+import mmap
+import os
+import re
+import zlib
+from collections import OrderedDict
+
+from fpdf import FPDF
+from fpdf.ttfonts import TTFontFile
+
+from cache import partial_path
+
+# Parsed font metrics live outside the repo, keyed on the font file's hash
+FONT_CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "codetopdf", "fonts")
+
+# Width table and glyph map both cover the Basic Multilingual Plane
+TABLE_SIZE = 256 * 256
+
+# Subset font programs, keyed on the font hash and the glyph set they cover
+SUBSET_CACHE_FOLDER = os.path.join(FONT_CACHE_FOLDER, "subsets")
+
+# Size cap for the subset folder; the least recently used subsets are dropped past it
+SUBSET_CACHE_SIZE = 32 * 1024 * 1024
+
+# Subsets each process keeps in memory
+SUBSETS_IN_MEMORY = 64
+
+_registry = {}
+
+class FontSubset:
+    # Everything the PDF needs for one subset of a TTF: the compressed font
+    # program, the compressed CIDToGIDMap and the /W array
+    def __init__(self, length1, max_uni, widths, program, cid_to_gid):
+        self.length1 = length1
+        self.max_uni = max_uni
+        self.widths = widths
+        self.program = program
+        self.cid_to_gid = cid_to_gid
+
+    @property
+    def size(self):
+        return len(self.program) + len(self.cid_to_gid)
+
+class _WidthsWriter:
+    # Just enough of an FPDF for _putTTfontwidths to write the /W array into
+    def __init__(self):
+        self.lines = []
+
+    def _out(self, s):
+        self.lines.append(s)
+
+class FontMetrics:
+    # Metrics for one TTF: a descriptor plus two read-only uint16 tables,
+    # widths by code point and glyph id by code point. When they come from the
+    # cache file the tables are memory-mapped, so every process that loads the
+    # font shares the same pages.
+    def __init__(self, ttf_path, digest, info, table):
+        self.ttf_path = ttf_path
+        self.digest = digest
+        self.info = info
+        self.widths = table[:TABLE_SIZE]
+        self.glyph_ids = table[TABLE_SIZE:]
+        self._subsets = OrderedDict()
+        self._empty_size = None
+
+    def has_glyph(self, code):
+        return code < TABLE_SIZE and self.glyph_ids[code] != 0
+
+    def install(self, pdf, family, style=""):
+        # What FPDF.add_font(..., uni=True) does, without re-reading any file
+        fontkey = family.lower() + style.upper()
+        if fontkey in pdf.fonts:
+            return
+        if hasattr(pdf, "str_alias_nb_pages"):
+            subset = list(range(0, 57))  # include numbers in the subset!
+        else:
+            subset = list(range(0, 32))
+        pdf.fonts[fontkey] = {
+            "i": len(pdf.fonts) + 1, "type": "TTF",
+            "name": self.info["name"], "desc": self.info["desc"],
+            "up": self.info["up"], "ut": self.info["ut"],
+            "cw": self.widths,
+            "ttffile": self.ttf_path, "fontkey": fontkey,
+            "subset": subset, "unifilename": None, "metrics": self,
+        }
+        pdf.font_files[fontkey] = {"length1": self.info["originalsize"], "type": "TTF", "ttffile": self.ttf_path}
+        pdf.font_files[self.ttf_path] = {"type": "TTF"}
+
+    def empty_subset_size(self):
+        # Size of a subset without glyphs of its own: the part every subset carries.
+        # Built once per process and kept off the disk cache, as it is only measured
+        if self._empty_size is None:
+            self._empty_size = self._make_subset([]).size
+        return self._empty_size
+
+    def subset(self, codes):
+        # The subset holding `codes`; built once per glyph set, then shared by
+        # every document (and process) that needs the same glyphs
+        codes = sorted(set(codes) - {0})
+        key = hashlib.sha256((self.digest + ":" + ",".join(map(str, codes))).encode("ascii")).hexdigest()
+        subset = self._subsets.get(key)
+        if subset is not None:
+            self._subsets.move_to_end(key)
+            return subset
+        subset = _read_subset(key)
+        if subset is None:
+            subset = self._make_subset(codes)
+            try:
+                _write_subset(key, subset)
+            except OSError:
+                pass
+        self._subsets[key] = subset
+        if len(self._subsets) > SUBSETS_IN_MEMORY:
+            self._subsets.popitem(last=False)
+        return subset
+
+    def _make_subset(self, codes):
+        # What FPDF._putfonts does for a TTF font, kept as bytes instead of written out
+        ttf = TTFontFile()
+        program = ttf.makeSubset(self.ttf_path, codes)
+        cid_to_gid = bytearray(2 * TABLE_SIZE)
+        for code, glyph in ttf.codeToGlyph.items():
+            cid_to_gid[2 * code] = glyph >> 8
+            cid_to_gid[2 * code + 1] = glyph & 0xFF
+        writer = _WidthsWriter()
+        FPDF._putTTfontwidths(writer, {"cw": self.widths, "subset": set(codes), "unifilename": None}, ttf.maxUni)
+        return FontSubset(len(program), ttf.maxUni, writer.lines[0],
+                          zlib.compress(program), zlib.compress(bytes(cid_to_gid)))
+
+def _digest(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def _parse(ttf_path):
+    ttf = TTFontFile()
+    ttf.getMetrics(ttf_path)
+    info = {
+        "name": re.sub("[ ()]", "", ttf.fullName),
+        "desc": {
+            "Ascent": int(round(ttf.ascent, 0)),
+            "Descent": int(round(ttf.descent, 0)),
+            "CapHeight": int(round(ttf.capHeight, 0)),
+            "Flags": ttf.flags,
+            "FontBBox": "[%s %s %s %s]" % tuple(int(round(b, 0)) for b in ttf.bbox),
+            "ItalicAngle": int(ttf.italicAngle),
+            "StemV": int(round(ttf.stemV, 0)),
+            "MissingWidth": int(round(ttf.defaultWidth, 0)),
+        },
+        "up": round(ttf.underlinePosition),
+        "ut": round(ttf.underlineThickness),
+        "originalsize": os.stat(ttf_path).st_size,
+    }
+    table = array.array("H", bytes(4 * TABLE_SIZE))
+    for code, width in enumerate(ttf.charWidths[:TABLE_SIZE]):
+        table[code] = width
+    for code, glyph in ttf.charToGlyph.items():
+        if code < TABLE_SIZE:
+            table[TABLE_SIZE + code] = glyph
+    return info, table
+
+def _write_cache(digest, info, table):
+    os.makedirs(FONT_CACHE_FOLDER, exist_ok=True)
+    base = os.path.join(FONT_CACHE_FOLDER, digest)
+    partial = partial_path(base + ".bin")
+    with open(partial, "wb") as file:
+        table.tofile(file)
+    os.replace(partial, base + ".bin")
+    partial = partial_path(base + ".json")
+    with open(partial, "w", encoding="utf-8") as file:
+        json.dump(info, file)
+    os.replace(partial, base + ".json")
+
+def _read_cache(digest):
+    base = os.path.join(FONT_CACHE_FOLDER, digest)
+    try:
+        with open(base + ".json", "r", encoding="utf-8") as file:
+            info = json.load(file)
+        with open(base + ".bin", "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) != 4 * TABLE_SIZE:
+        mapped.close()
+        return None
+    return info, memoryview(mapped).cast("H")
+
+def _write_subset(key, subset):
+    # One file per subset: a JSON header line, then the two compressed streams
+    os.makedirs(SUBSET_CACHE_FOLDER, exist_ok=True)
+    path = os.path.join(SUBSET_CACHE_FOLDER, key + ".bin")
+    header = {"length1": subset.length1, "max_uni": subset.max_uni, "widths": subset.widths,
+              "program": len(subset.program), "cid_to_gid": len(subset.cid_to_gid)}
+    partial = partial_path(path)
+    with open(partial, "wb") as file:
+        file.write(json.dumps(header).encode("utf-8") + b"\n")
+        file.write(subset.program)
+        file.write(subset.cid_to_gid)
+    os.replace(partial, path)
+    _evict_subsets()
+
+def _evict_subsets(max_bytes=SUBSET_CACHE_SIZE):
+    # Every distinct glyph set gets a file, so without this the folder only grows.
+    # A read bumps the file's mtime; other processes may be removing files too
+    entries = []
+    with os.scandir(SUBSET_CACHE_FOLDER) as it:
+        for entry in it:
+            if entry.name.endswith(".bin"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def _read_subset(key):
+    path = os.path.join(SUBSET_CACHE_FOLDER, key + ".bin")
+    try:
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            program = file.read(header["program"])
+            cid_to_gid = file.read(header["cid_to_gid"])
+        os.utime(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(program) != header["program"] or len(cid_to_gid) != header["cid_to_gid"]:
+        return None
+    return FontSubset(header["length1"], header["max_uni"], header["widths"], program, cid_to_gid)
+
+def load_font(ttf_path):
+    # Parsed once per font file: later calls in this process are a dict lookup
+    # plus a stat, and other processes map the cached tables instead of parsing
+    stat = os.stat(ttf_path)
+    key = os.path.abspath(ttf_path)
+    cached = _registry.get(key)
+    if cached and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+
+    digest = _digest(ttf_path)
+    loaded = _read_cache(digest)
+    if loaded is None:
+        info, table = _parse(ttf_path)
+        try:
+            _write_cache(digest, info, table)
+            loaded = _read_cache(digest)
+        except OSError:
+            pass
+        if loaded is None:
+            # Cache folder not writable: keep the parsed table in memory instead
+            loaded = info, memoryview(table).toreadonly()
+
+    metrics = FontMetrics(ttf_path, digest, *loaded)
+    _registry[key] = ((stat.st_size, stat.st_mtime_ns), metrics)
+    return metrics
@@ -0,0 +1,262 @@
+import os
+import re
+from collections import OrderedDict
+
+# Token styles; each line becomes a tuple of (style, text) runs
+PLAIN, KEYWORD, STRING, COMMENT, NUMBER = range(5)
+
+# Fill colour per style, in the same order
+STYLE_COLORS = [
+    (0.0, 0.0, 0.0),
+    (0.0, 0.0, 0.6),
+    (0.64, 0.08, 0.08),
+    (0.42, 0.45, 0.42),
+    (0.0, 0.45, 0.45),
+]
+
+# Lines of tokens kept by the per-file cache, and the largest source it will hold
+TOKEN_CACHE_LINES = 200000
+TOKEN_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# (state, line) results each tokenizer remembers before starting over
+LINE_MEMO_SIZE = 50000
+
+C_FAMILY_OPENERS = {"/*": ("*/", COMMENT)}
+
+GROUP_STYLES = {"comment": COMMENT, "string": STRING, "keyword": KEYWORD, "number": NUMBER}
+
+class Language:
+    # What the tokenizer needs to know about a language: its keywords, the
+    # delimiters of single-line strings and comments, and the openers of
+    # constructs that may run over several lines (with their closer and style)
+    def __init__(self, name, keywords, line_comments=(), quotes=('"', "'"), openers=None, keyword_patterns=()):
+        self.name = name
+        self.styles = dict(GROUP_STYLES)
+        # Group name -> (opener length, closer, style) for multi-line constructs
+        self.open_groups = {}
+        parts = []
+        for i, opener in enumerate(sorted(openers or {}, key=len, reverse=True)):
+            closer, style = openers[opener]
+            group = "open%d" % i
+            self.open_groups[group] = (len(opener), closer, style)
+            self.styles[group] = style
+            # Runs to the closer when it is on the same line, else matches just the opener
+            parts.append("(?P<%s>%s(?:.*?%s)?)" % (group, re.escape(opener), re.escape(closer)))
+        if line_comments:
+            parts.append("(?P<comment>(?:%s).*)" % "|".join(map(re.escape, line_comments)))
+        if quotes:
+            parts.append("(?P<string>%s)" % "|".join(
+                "%s(?:[^%s\\\\]|\\\\.)*%s?" % (q, q, q) for q in map(re.escape, quotes)))
+        words = [r"\b(?:%s)\b" % "|".join(sorted(keywords, key=len, reverse=True))] if keywords else []
+        if words or keyword_patterns:
+            parts.append("(?P<keyword>%s)" % "|".join(words + list(keyword_patterns)))
+        parts.append(r"(?P<number>\b(?:0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?))")
+        pattern = "|".join(parts)
+        if not keyword_patterns:
+            # Every token then starts with a word character or a delimiter, which
+            # lets the regex skip other positions without trying each alternative
+            starts = {d[0] for d in list(openers or ()) + list(line_comments) + list(quotes)}
+            pattern = "(?=[\\w%s])(?:%s)" % ("".join(map(re.escape, sorted(starts))), pattern)
+        self.pattern = re.compile(pattern)
+
+C_KEYWORDS = ("break case char const continue default do double else enum extern float for goto if int long "
+              "return short signed sizeof static struct switch typedef union unsigned void volatile while").split()
+JS_KEYWORDS = ("async await break case catch class const continue debugger default delete do else export "
+               "extends false finally for function if import in instanceof let new null of return static super "
+               "switch this throw true try typeof undefined var void while with yield").split()
+
+LANGUAGES = {
+    ".py": Language("python", (
+        "False None True and as assert async await break class continue def del elif else except finally for "
+        "from global if import in is lambda nonlocal not or pass raise return try while with yield").split(),
+        line_comments=("#",), openers={'"""': ('"""', STRING), "'''": ("'''", STRING)}),
+    ".java": Language("java", (
+        "abstract assert boolean break byte case catch char class const continue default do double else enum "
+        "extends false final finally float for if implements import instanceof int interface long native new "
+        "null package private protected public return short static super switch synchronized this throw throws "
+        "transient true try var void volatile while").split(),
+        line_comments=("//",), openers=dict(C_FAMILY_OPENERS, **{'"""': ('"""', STRING)})),
+    ".cpp": Language("cpp", C_KEYWORDS + (
+        "auto bool catch class constexpr delete explicit false friend inline mutable namespace new noexcept "
+        "nullptr operator private protected public template this throw true try typename using virtual").split(),
+        line_comments=("//",), openers=C_FAMILY_OPENERS, keyword_patterns=(r"^\s*#\s*\w+",)),
+    ".html": Language("html", (), quotes=('"',), openers={"<!--": ("-->", COMMENT)},
+                      keyword_patterns=(r"</?[A-Za-z][\w:-]*", r"/?>")),
+    ".css": Language("css", (), openers=C_FAMILY_OPENERS,
+                     keyword_patterns=(r"@[\w-]+", r"!important", r"#[0-9a-fA-F]{3,8}\b")),
+    ".js": Language("javascript", JS_KEYWORDS, line_comments=("//",),
+                    openers=dict(C_FAMILY_OPENERS, **{"`": ("`", STRING)})),
+    ".rb": Language("ruby", (
+        "BEGIN END alias and begin break case class def defined do else elsif end ensure false for if in "
+        "module next nil not or redo rescue retry return self super then true undef unless until when while "
+        "yield").split(), line_comments=("#",)),
+    ".php": Language("php", (
+        "abstract and array as break case catch class clone const continue declare default do echo else "
+        "elseif empty extends false final finally fn for foreach function global if implements include "
+        "instanceof interface isset list namespace new null or print private protected public require return "
+        "static switch throw trait true try unset use var while yield").split(),
+        line_comments=("//", "#"), openers=C_FAMILY_OPENERS),
+    ".swift": Language("swift", (
+        "as associatedtype break case catch class continue default defer deinit do else enum extension "
+        "fallthrough false fileprivate for func guard if import in init inout internal is let nil open "
+        "operator private protocol public repeat rethrows return self static struct subscript super switch "
+        "throw throws true try typealias var where while").split(),
+        line_comments=("//",), openers=dict(C_FAMILY_OPENERS, **{'"""': ('"""', STRING)})),
+    ".go": Language("go", (
+        "break case chan const continue default defer else fallthrough false for func go goto if import "
+        "interface iota map nil package range return select struct switch true type var").split(),
+        line_comments=("//",), openers=dict(C_FAMILY_OPENERS, **{"`": ("`", STRING)})),
+    ".pl": Language("perl", (
+        "__END__ continue do else elsif for foreach if last local my next no our package redo require "
+        "return sub unless until use while").split(), line_comments=("#",)),
+    ".ts": Language("typescript", JS_KEYWORDS + (
+        "abstract any as boolean declare enum implements interface keyof namespace never number private "
+        "protected public readonly string type unknown").split(),
+        line_comments=("//",), openers=dict(C_FAMILY_OPENERS, **{"`": ("`", STRING)})),
+}
+
+class Tokenizer:
+    # Line-at-a-time tokenizer. The only state carried between lines is an
+    # open multi-line construct, so a line's tokens depend on (state, line)
+    # alone and are memoised on that: re-rendering an edited file only scans
+    # the lines that changed.
+    def __init__(self, language):
+        self.language = language
+        self._memo = {}
+
+    def line_runs(self, line, state=None):
+        key = (state, line)
+        result = self._memo.get(key)
+        if result is None:
+            if len(self._memo) >= LINE_MEMO_SIZE:
+                self._memo.clear()
+            result = self._memo[key] = self._scan(line, state)
+        return result
+
+    def _scan(self, line, state):
+        # Whitespace never gets a colour of its own: it joins the run before it,
+        # or the one after it at the start of a line, so colours change as
+        # rarely as possible. `style` is None while the run is only whitespace.
+        runs = []
+        style = None
+        text = ""
+        pos = 0
+        if state:
+            closer, style = state
+            end = line.find(closer)
+            if end == -1:
+                return ((style, line),) if line else (), state
+            pos = end + len(closer)
+            text = line[:pos]
+            state = None
+
+        styles = self.language.styles
+        open_groups = self.language.open_groups
+        for match in self.language.pattern.finditer(line, pos):
+            start, end = match.span()
+            if start > pos:
+                gap = line[pos:start]
+                if style is None:
+                    text += gap
+                    if not gap.isspace():
+                        style = PLAIN
+                elif style == PLAIN or gap.isspace():
+                    text += gap
+                else:
+                    runs.append((style, text))
+                    style = PLAIN
+                    text = gap
+            kind = match.lastgroup
+            token_style = styles[kind]
+            if style is None or style == token_style:
+                style = token_style
+                text += match.group()
+            else:
+                runs.append((style, text))
+                style = token_style
+                text = match.group()
+            pos = end
+            if kind in open_groups:
+                opener_length, closer, _ = open_groups[kind]
+                if end - start < opener_length + len(closer):
+                    # Not closed on this line: the rest of it belongs to the construct
+                    text += line[end:]
+                    pos = len(line)
+                    state = (closer, token_style)
+                    break
+
+        if pos < len(line):
+            gap = line[pos:]
+            if style is None or style == PLAIN or gap.isspace():
+                text += gap
+                if style is None and not gap.isspace():
+                    style = PLAIN
+            else:
+                runs.append((style, text))
+                style = PLAIN
+                text = gap
+        if text:
+            runs.append((PLAIN if style is None else style, text))
+        return tuple(runs), state
+
+    def tokenize(self, lines):
+        state = None
+        line_runs = self.line_runs
+        for line in lines:
+            runs, state = line_runs(line, state)
+            yield runs
+
+class TokenCache:
+    # Token runs of whole files, keyed on the source hash and language, for
+    # files re-rendered in the same process (another font, a preview, a rebuild)
+    def __init__(self, max_lines=TOKEN_CACHE_LINES):
+        self.max_lines = max_lines
+        self._files = OrderedDict()
+        self._lines = 0
+
+    def tokenize(self, tokenizer, lines, digest=None):
+        key = (digest, tokenizer.language.name)
+        cached = self._files.get(key) if digest else None
+        if cached is not None:
+            self._files.move_to_end(key)
+            yield from cached
+            return
+        collected = [] if digest else None
+        for runs in tokenizer.tokenize(lines):
+            if collected is not None:
+                collected.append(runs)
+                if len(collected) > self.max_lines:
+                    collected = None
+            yield runs
+        if collected is not None:
+            self._store(key, collected)
+
+    def clear(self):
+        self._files.clear()
+        self._lines = 0
+
+    def _store(self, key, runs):
+        self._files[key] = runs
+        self._lines += len(runs)
+        while self._lines > self.max_lines:
+            _, dropped = self._files.popitem(last=False)
+            self._lines -= len(dropped)
+
+TOKEN_CACHE = TokenCache()
+
+# One tokenizer per language, so the line memo carries over between files
+_tokenizers = {}
+
+def tokenizer_for(file_path):
+    language = LANGUAGES.get(os.path.splitext(file_path)[1].lower())
+    if language is None:
+        return None
+    if language.name not in _tokenizers:
+        _tokenizers[language.name] = Tokenizer(language)
+    return _tokenizers[language.name]
+
+def forget_tokens():
+    # Empties every line memo and the file cache, as if nothing had been highlighted yet
+    for tokenizer in _tokenizers.values():
+        tokenizer._memo.clear()
+    TOKEN_CACHE.clear()
@@ -0,0 +1,277 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+
+# Tabs are expanded before measuring so wrap points match what is drawn
+TAB_SIZE = 4
+
+# Unicode fonts address glyphs by 16-bit code, so anything past the BMP (emoji, ...) is replaced
+OUTSIDE_BMP = re.compile("[\U00010000-\U0010FFFF]")
+
+def escape_text(s):
+    # Add \ before \, ( and ) like FPDF._escape
+    return s.replace("\\", "\\\\").replace(")", "\\)").replace("(", "\\(").replace("\r", "\\r")
+
+# Bulk replacement for one multi_cell(0, h, line) per source line: widths come
+# from a table built once per font, short lines are placed without measuring,
+# and rows go straight into the page stream as text objects. Wrapped lines are
+# left aligned (multi_cell justifies them).
+class CodeLayout:
+    def __init__(self, pdf, line_height):
+        self.pdf = pdf
+        self.line_height = line_height
+        self.unicode = pdf.unifontsubset
+        font = pdf.current_font
+
+        if self.unicode:
+            self.widths = font["cw"]
+            self.missing_width = font["desc"].get("MissingWidth") or 500
+            self.subset = font["subset"]
+            self.glyphs = set(self.subset)
+        else:
+            cw = font["cw"]
+            self.widths = [cw.get(chr(i), 0) for i in range(256)]
+            self.missing_width = 0
+
+        # Same text box as multi_cell(0, h): full width minus the cell margins
+        self.text_width = pdf.w - pdf.r_margin - pdf.l_margin
+        self.wmax = (self.text_width - 2 * pdf.c_margin) * 1000.0 / pdf.font_size
+        # Lines up to this many characters fit whatever they contain
+        widest = max(self.widths) or 1
+        self.safe_length = int(self.wmax // max(widest, self.missing_width))
+
+        self.x = "%.2f" % ((pdf.l_margin + pdf.c_margin) * pdf.k)
+        self._slots = {}
+
+    def prepare(self, line):
+        line = line.expandtabs(TAB_SIZE)
+        if not self.unicode:
+            # Core fonts are Latin-1 only
+            line = line.encode("latin-1", "replace").decode("latin-1")
+        elif max(line, default="") > "\uffff":
+            line = OUTSIDE_BMP.sub("?", line)
+        return line
+
+    def char_width(self, char):
+        code = ord(char)
+        if code < len(self.widths):
+            return self.widths[code]
+        return self.missing_width
+
+    def char_widths(self, line):
+        # Per-character widths, looked up in C wherever the table covers the line
+        if not self.unicode:
+            return map(self.widths.__getitem__, line.encode("latin-1"))
+        if line and ord(max(line)) >= len(self.widths):
+            return map(self.char_width, line)
+        return map(self.widths.__getitem__, map(ord, line))
+
+    def measure(self, line):
+        return sum(self.char_widths(line))
+
+    def wrap(self, line):
+        line = self.prepare(line)
+        return [line[start:end] for start, end in self.spans(line)]
+
+    def spans(self, line):
+        # (start, end) of each row of a prepared line
+        if len(line) <= self.safe_length or self.measure(line) <= self.wmax:
+            return [(0, len(line))]
+
+        # Same break rules as multi_cell: break at the last space before the
+        # overflowing character (inclusive), else just before it
+        edges = list(accumulate(self.char_widths(line), initial=0))
+        spans = []
+        start = 0
+        n = len(line)
+        while True:
+            overflow = bisect_right(edges, edges[start] + self.wmax) - 1
+            if overflow >= n:
+                break
+            sep = line.rfind(" ", start, overflow + 1)
+            if sep == -1:
+                end = max(overflow, start + 1)
+                spans.append((start, end))
+                start = end
+            else:
+                spans.append((start, sep))
+                start = sep + 1
+        spans.append((start, n))
+        return spans
+
+    def wrap_lines(self, lines, starts=None):
+        # starts, when given, receives the index of each line's first row
+        rows = []
+        safe_length = self.safe_length
+        for line in lines:
+            if starts is not None:
+                starts.append(len(rows))
+            if len(line) <= safe_length and "\t" not in line and \
+                    (line.isascii() or self.unicode and max(line) <= "\uffff"):
+                rows.append(line)
+            else:
+                rows.extend(self.wrap(line))
+        return rows
+
+    def slots(self, top):
+        # Baselines of every row that fits below `top`, formatted once per start position
+        if top not in self._slots:
+            pdf = self.pdf
+            h = self.line_height
+            y = top
+            ys = []
+            ends = []
+            while not (y + h > pdf.page_break_trigger) or not ys:
+                ys.append("%.2f" % ((pdf.h - (y + 0.5 * h + 0.3 * pdf.font_size)) * pdf.k))
+                y += h
+                ends.append(y)
+            self._slots[top] = (ys, ends)
+        return self._slots[top]
+
+    def add_glyphs(self, rows):
+        # Unicode fonts embed a subset; register each new code point once, not once per use
+        new = set(map(ord, "".join(rows))) - self.glyphs
+        if new:
+            self.glyphs.update(new)
+            self.subset.extend(sorted(new))
+
+    def encode(self, row):
+        if self.unicode:
+            row = row.encode("utf-16-be").decode("latin-1")
+        return escape_text(row)
+
+    def text_ops(self, ys, rows):
+        x = self.x
+        encode = self.encode
+        return ["BT %s %s Td (%s) Tj ET" % (x, y, encode(row)) for y, row in zip(ys, rows) if row]
+
+    def write_rows(self, rows):
+        # Returns (first row, page) for each run of rows placed on one page. Once
+        # pdf.max_pages are full, the rows that didn't fit are cut off `rows`
+        pdf = self.pdf
+        placed = []
+        start = 0
+        while start < len(rows):
+            if pdf.y + self.line_height > pdf.page_break_trigger and not pdf.in_footer and pdf.accept_page_break():
+                if pdf.max_pages is not None and pdf.page >= pdf.max_pages:
+                    del rows[start:]
+                    break
+                pdf.add_page(pdf.cur_orientation)
+            ys, ends = self.slots(pdf.y)
+            chunk = rows[start:start + len(ys)]
+            placed.append((start, pdf.page))
+            if self.unicode:
+                self.add_glyphs(chunk)
+            ops = self.text_ops(ys, chunk)
+            if ops:
+                pdf._out("\n".join(ops))
+            pdf.y = ends[len(chunk) - 1]
+            start += len(chunk)
+        pdf.x = pdf.l_margin
+        return placed
+
+# CodeLayout for syntax-highlighted text. Lines arrive as tuples of (style,
+# text) runs from highlight.Tokenizer and are measured and wrapped exactly like
+# plain text; each row is one text object with a Tj per run, and a colour
+# operator is written only where the style differs from the one already set
+# on the page.
+class HighlightLayout(CodeLayout):
+    def __init__(self, pdf, line_height, colors):
+        super().__init__(pdf, line_height)
+        self.color_ops = ["%.3f %.3f %.3f rg" % color for color in colors]
+        self.page = None
+        self.style = 0
+        # Show-text operators by run text; keywords and punctuation repeat constantly
+        self._shows = {}
+
+    def prepare_runs(self, runs):
+        # prepare() run by run; tabs expand against the column the run starts at
+        prepared = []
+        column = 0
+        for style, text in runs:
+            if "\t" in text:
+                pad = column % TAB_SIZE
+                text = (" " * pad + text).expandtabs(TAB_SIZE)[pad:]
+            if not self.unicode:
+                text = text.encode("latin-1", "replace").decode("latin-1")
+            elif max(text, default="") > "\uffff":
+                text = OUTSIDE_BMP.sub("?", text)
+            prepared.append((style, text))
+            column += len(text)
+        return prepared
+
+    def wrap_lines(self, lines, starts=None):
+        rows = []
+        safe_length = self.safe_length
+        for runs in lines:
+            if starts is not None:
+                starts.append(len(rows))
+            if len(runs) == 1:
+                text = runs[0][1]
+            else:
+                text = "".join([text for _, text in runs])
+            if "\t" in text or not text.isascii() and (not self.unicode or max(text) > "\uffff"):
+                runs = self.prepare_runs(runs)
+                text = "".join([text for _, text in runs])
+            if len(text) <= safe_length:
+                rows.append(runs)
+                continue
+            spans = self.spans(text)
+            if len(spans) == 1:
+                rows.append(runs)
+            else:
+                rows.extend(slice_runs(runs, spans))
+        return rows
+
+    def add_glyphs(self, rows):
+        super().add_glyphs(["".join([text for _, text in row]) for row in rows])
+
+    def text_ops(self, ys, rows):
+        if self.page != self.pdf.page:
+            # A new page starts from the default (black) fill colour
+            self.page = self.pdf.page
+            self.style = 0
+        x = self.x
+        shows = self._shows
+        if len(shows) > 100000:
+            shows.clear()
+        color_ops = self.color_ops
+        style = self.style
+        ops = []
+        for y, row in zip(ys, rows):
+            if not row:
+                continue
+            parts = ["BT", x, y, "Td"]
+            for run_style, text in row:
+                if run_style != style:
+                    parts.append(color_ops[run_style])
+                    style = run_style
+                show = shows.get(text)
+                if show is None:
+                    show = shows[text] = "(%s) Tj" % self.encode(text)
+                parts.append(show)
+            parts.append("ET")
+            ops.append(" ".join(parts))
+        self.style = style
+        return ops
+
+def slice_runs(runs, spans):
+    # Split a line's runs into one list of runs per (start, end) span
+    rows = []
+    runs = iter(runs)
+    run_style, run_text = next(runs)
+    run_start = 0
+    for start, end in spans:
+        row = []
+        while True:
+            run_end = run_start + len(run_text)
+            if run_end > start:
+                piece = run_text[max(start - run_start, 0):end - run_start]
+                if piece:
+                    row.append((run_style, piece))
+            if run_end >= end:
+                break
+            run_style, run_text = next(runs)
+            run_start = run_end
+        rows.append(row)
+    return rows
@@ -0,0 +1,94 @@
+import array
+import mmap
+import os
+import re
+from bisect import bisect_right
+from itertools import islice
+
+# Line indexes live outside the repo, keyed on the source file's hash
+LINE_INDEX_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "codetopdf", "lines")
+
+# Every LINE_STRIDE-th line start is recorded; reaching any other line scans at most this many lines
+LINE_STRIDE = 1024
+
+# Codecs in which a line ends at the byte 0x0A and no other character contains it
+BYTE_NEWLINE_ENCODINGS = ("utf-8", "utf-8-sig", "cp1252", "latin-1")
+
+NEWLINE = re.compile(b"\n")
+
+def build_offsets(mapped):
+    # Line n + 1 starts right after the n-th newline; islice skips the others without a Python step each
+    offsets = array.array("Q", [0])
+    offsets.extend(match.end() for match in islice(NEWLINE.finditer(mapped), LINE_STRIDE - 1, None, LINE_STRIDE))
+    return offsets
+
+def _index_path(digest):
+    return os.path.join(LINE_INDEX_FOLDER, f"{digest}-{LINE_STRIDE}.bin")
+
+def _write_index(digest, offsets):
+    os.makedirs(LINE_INDEX_FOLDER, exist_ok=True)
+    path = _index_path(digest)
+    # Processes indexing files with the same contents write the same thing; each to its own partial file
+    partial = f"{path}.{os.getpid()}.part"
+    with open(partial, "wb") as file:
+        offsets.tofile(file)
+    os.replace(partial, path)
+
+def _read_index(digest):
+    try:
+        with open(_index_path(digest), "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if not data or len(data) % 8:
+        return None
+    offsets = array.array("Q")
+    offsets.frombytes(data)
+    return offsets
+
+class LineIndex:
+    # Byte offsets of the lines of a mapped source file, so a line window or a
+    # byte offset is reached without decoding anything before it. Lines end
+    # at "\n" (which covers "\r\n"); a file using bare "\r" is one long line.
+    def __init__(self, file, digest):
+        self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = _read_index(digest)
+        if self.offsets is None:
+            self.offsets = build_offsets(self.mapped)
+            _write_index(digest, self.offsets)
+
+    def close(self):
+        self.mapped.close()
+
+    def line_start(self, line):
+        # Byte offset where line (counted from 1) starts; the file size past the last line
+        block, skip = divmod(line - 1, LINE_STRIDE)
+        if block >= len(self.offsets):
+            return len(self.mapped)
+        offset = self.offsets[block]
+        if skip:
+            match = next(islice(NEWLINE.finditer(self.mapped, offset), skip - 1, None), None)
+            offset = match.end() if match else len(self.mapped)
+        return offset
+
+    def line_at(self, offset):
+        # (line, offset where it starts) for the line holding byte offset
+        block = bisect_right(self.offsets, offset) - 1
+        start = self.mapped.rfind(b"\n", self.offsets[block], offset) + 1 or self.offsets[block]
+        return block * LINE_STRIDE + 1 + self.mapped[self.offsets[block]:start].count(b"\n"), start
+
+def source_window(file, digest, lines=None, start_byte=None):
+    # (start, end, first line) of the bytes to render from a non-empty file opened in
+    # binary mode: lines is (first, last) counted from 1, last included or None for the
+    # end of the file; start_byte starts at the beginning of the line holding that byte
+    index = LineIndex(file, digest)
+    try:
+        if lines is not None:
+            first, last = lines
+            start = index.line_start(first)
+            end = index.line_start(last + 1) if last is not None else len(index.mapped)
+            return start, end, first
+        first, start = index.line_at(min(start_byte, len(index.mapped)))
+        return start, len(index.mapped), first
+    finally:
+        index.close()
@@ -0,0 +1,446 @@
+import os
+from collections import OrderedDict
+from itertools import islice
+
+from PyQt5.QtCore import QPointF, QRectF, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QFontDatabase, QFontMetricsF, QImage, QPainter
+from PyQt5.QtWidgets import QAbstractScrollArea, QComboBox, QHBoxLayout, QLabel, QSlider, QVBoxLayout, QWidget
+
+from line_index import BYTE_NEWLINE_ENCODINGS
+from sniff import sniff_file
+from streaming import MAX_LINE_LENGTH, READ_CHUNK_SIZE
+
+# Source lines a page index lays out per timer tick while it grows in the background
+INDEX_LINES_PER_STEP = 5000
+
+# Rendered page images kept, across files, fonts and zoom levels
+PAGE_CACHE_SIZE = 48
+
+# Page indexes kept, one per file version and font
+INDEX_CACHE_SIZE = 8
+
+# Zoom in pixels per millimetre: the default, and the slider's range in percent of it
+DEFAULT_SCALE = 2.0
+ZOOM_RANGE = (50, 200)
+
+# Grey space around and between pages, in pixels
+PAGE_GAP = 12
+
+# converter.RENDERERS, named here so opening the window doesn't load fpdf
+FONTS = ("arial", "minecraft")
+
+# Printable ASCII, for comparing a Qt font's widths with the PDF's
+WIDTH_SAMPLE = "".join(map(chr, range(32, 127)))
+
+# Families registered with Qt for each TTF file, and fonts by (family, style, size, scale)
+_app_fonts = {}
+_qt_fonts = {}
+
+def qt_font(pdf, family, style, size, scale):
+    # The Qt font for a PDF font at `size` points: the TTF the renderer embeds, or whatever
+    # the system has for a core font, stretched to the PDF's widths so rows end where they will
+    key = (family, style, size, scale)
+    if key in _qt_fonts:
+        return _qt_fonts[key]
+    path = pdf.fonts.get(family.lower() + style.upper(), {}).get("ttffile")
+    if path and path not in _app_fonts:
+        families = QFontDatabase.applicationFontFamilies(QFontDatabase.addApplicationFont(path))
+        _app_fonts[path] = families[0] if families else family
+    font = QFont(_app_fonts.get(path, family))
+    font.setStyleHint(QFont.SansSerif)
+    font.setBold("B" in style)
+    font.setPixelSize(max(1, round(size / pdf.k * scale)))
+    pdf.set_font(family, style, size)
+    width = pdf.get_string_width(WIDTH_SAMPLE) * scale
+    pdf.set_font(pdf.code_font, size=pdf.code_font_size)
+    font.setStretch(max(1, min(4000, round(100 * width / QFontMetricsF(font).horizontalAdvance(WIDTH_SAMPLE)))))
+    _qt_fonts[key] = font
+    return font
+
+class PageIndex:
+    # Where each page of a file's PDF starts for one render path, as (byte offset of a
+    # source line, rows of that line already placed on earlier pages). Lines are wrapped
+    # with the converter's own layout, so pages break where the PDF's do, but nothing is
+    # drawn, and the index only grows as far as it has been asked to.
+    def __init__(self, path, font):
+        # fpdf loads with the first preview, not with the window
+        from converter import RENDERERS
+        from layout import CodeLayout
+
+        self.path = path
+        self.render_font = font
+        self.size = os.path.getsize(path)
+        with open(path, "rb") as file:
+            self.encoding = sniff_file(file)
+        if self.encoding is None:
+            raise ValueError("binary file, nothing to preview")
+        if self.encoding not in BYTE_NEWLINE_ENCODINGS:
+            raise ValueError(f"no preview for {self.encoding} files")
+
+        # A scratch document in the state the converter writes lines in
+        self.pdf = RENDERERS[font]()
+        self.pdf.add_page()
+        self.pdf.set_font(self.pdf.code_font, size=self.pdf.code_font_size)
+        self.layout = CodeLayout(self.pdf, self.pdf.line_height)
+        self.top = self.pdf.y
+        self.rows_per_page = len(self.layout.slots(self.top)[0])
+
+        self.pages = [(0, 0)]
+        self.rows = 0
+        # Bytes laid out so far
+        self.offset = 0
+        self.complete = self.size == 0
+
+    def decode(self, data, offset):
+        # A line as the converter reads it: decoded with the sniffed codec, newline dropped
+        encoding = self.encoding
+        if encoding == "utf-8-sig" and offset:
+            encoding = "utf-8"
+        text = data.decode(encoding, "replace")
+        return text[:-1] if text.endswith("\r") else text
+
+    def source_lines(self, offset):
+        # (start, end, text) of each line from byte offset on
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            pending = b""
+            while True:
+                data = file.read(READ_CHUNK_SIZE)
+                parts = (pending + data).split(b"\n")
+                pending = parts.pop()
+                for part in parts:
+                    end = offset + len(part) + 1
+                    yield offset, end, self.decode(part, offset)
+                    offset = end
+                if not data:
+                    break
+        if pending:
+            yield offset, offset + len(pending), self.decode(pending, offset)
+
+    def wrap(self, texts):
+        # Rows of each text, cut into MAX_LINE_LENGTH pieces first as streaming.read_lines does
+        pieces = []
+        owners = []
+        for i, text in enumerate(texts):
+            for start in range(0, max(len(text), 1), MAX_LINE_LENGTH):
+                pieces.append(text[start:start + MAX_LINE_LENGTH])
+                owners.append(i)
+        starts = []
+        rows = self.layout.wrap_lines(pieces, starts)
+        wrapped = [[] for _ in texts]
+        for owner, start, end in zip(owners, starts, starts[1:] + [len(rows)]):
+            wrapped[owner].extend(rows[start:end])
+        return wrapped
+
+    def extend(self, max_lines=INDEX_LINES_PER_STEP):
+        # Lays out up to max_lines more lines, recording every page that starts among them
+        if self.complete:
+            return
+        lines = self.source_lines(self.offset)
+        block = list(islice(lines, max_lines))
+        lines.close()
+        if len(block) < max_lines:
+            self.complete = True
+        rows_per_page = self.rows_per_page
+        for (start, end, _), rows in zip(block, self.wrap([text for _, _, text in block])):
+            count = len(rows)
+            while self.rows + count > len(self.pages) * rows_per_page:
+                self.pages.append((start, len(self.pages) * rows_per_page - self.rows))
+            self.rows += count
+            self.offset = end
+
+    def page_count(self):
+        # Exact once complete; until then extrapolated from the bytes laid out so far
+        if self.complete or not self.offset:
+            return len(self.pages)
+        return max(len(self.pages), round(len(self.pages) * self.size / self.offset))
+
+    def page_rows(self, number):
+        # The rows on page `number` (from 1), or None while the index hasn't reached it
+        if number > len(self.pages):
+            return None
+        start, skip = self.pages[number - 1]
+        wanted = skip + self.rows_per_page
+        rows = []
+        lines = self.source_lines(start)
+        for _, _, text in lines:
+            rows.extend(self.wrap([text])[0])
+            if len(rows) >= wanted:
+                break
+        lines.close()
+        return rows[skip:wanted]
+
+    def render(self, number, scale):
+        # Page `number` as an image, drawn where the PDF puts the header and each row
+        rows = self.page_rows(number)
+        if rows is None:
+            return None
+        pdf = self.pdf
+        image = QImage(round(pdf.w * scale), round(pdf.h * scale), QImage.Format_RGB32)
+        image.fill(Qt.white)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.TextAntialiasing)
+        painter.setPen(Qt.black)
+        width = pdf.w - pdf.l_margin - pdf.r_margin
+        if pdf.header_text:
+            family, style, size = pdf.header_font
+            painter.setFont(qt_font(pdf, family, style, size, scale))
+            painter.drawText(QRectF(pdf.l_margin * scale, pdf.t_margin * scale, width * scale, 10 * scale),
+                             Qt.AlignCenter, pdf.header_text)
+        font = qt_font(pdf, pdf.code_font, "", pdf.code_font_size, scale)
+        painter.setFont(font)
+        metrics = QFontMetricsF(font)
+        x = (pdf.l_margin + pdf.c_margin) * scale
+        limit = (pdf.w - pdf.r_margin - pdf.c_margin) * scale - x
+        h = pdf.line_height
+        for i, row in enumerate(rows):
+            # The baseline CodeLayout.slots computes, measured from the top
+            y = (self.top + (i + 0.5) * h + 0.3 * pdf.font_size) * scale
+            advance = metrics.horizontalAdvance(row)
+            if advance <= limit:
+                painter.drawText(QPointF(x, y), row)
+                continue
+            # Glyph widths still differ a little; a row that would cross the margin is squeezed to its PDF width
+            painter.save()
+            painter.translate(x, y)
+            painter.scale(pdf.get_string_width(row) * scale / advance, 1)
+            painter.drawText(QPointF(0, 0), row)
+            painter.restore()
+        painter.end()
+        return image
+
+class PageView(QAbstractScrollArea):
+    # Scrolls through the pages of one source file. Only pages in view are drawn,
+    # from an LRU of page images; a page the index hasn't reached yet shows as a
+    # placeholder until the background steps get there.
+    pagesChanged = pyqtSignal()
+
+    def __init__(self, font=FONTS[0], parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.render_font = font
+        self.scale = DEFAULT_SCALE
+        self.index = self.index_key = None
+        self.error = None
+        # (page, scroll value) to come back to once the index reaches the page
+        self.target = None
+        self.indexes = OrderedDict()
+        self.images = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.builder = QTimer(self)
+        self.builder.setInterval(0)
+        self.builder.timeout.connect(self.build_step)
+        self.viewport().setStyleSheet("background-color: #7f8c8d;")
+
+    def set_source(self, path):
+        self.path = path
+        self.target = None
+        self.verticalScrollBar().setValue(0)
+        self.select_index()
+
+    def set_render_font(self, font):
+        if font != self.render_font:
+            page = self.current_page()
+            self.render_font = font
+            self.select_index()
+            # The same page under the other font, or as near as the index knows so far
+            self.scroll_to_page(page)
+            if self.index is not None and page > len(self.index.pages):
+                self.target = (page, self.verticalScrollBar().value())
+
+    def set_scale(self, scale):
+        if scale != self.scale:
+            page = self.current_page()
+            self.scale = scale
+            self.update_scrollbars()
+            self.scroll_to_page(page)
+            self.viewport().update()
+
+    def select_index(self):
+        # The index for this file version and font, built or continued in the background
+        self.index = self.index_key = None
+        self.error = None
+        if self.path:
+            try:
+                stat = os.stat(self.path)
+                key = (os.path.abspath(self.path), stat.st_size, stat.st_mtime, self.render_font)
+                if key not in self.indexes:
+                    self.indexes[key] = PageIndex(self.path, self.render_font)
+                    # One step now, so the page count can be estimated from the start
+                    self.indexes[key].extend()
+                    if len(self.indexes) > INDEX_CACHE_SIZE:
+                        self.indexes.popitem(last=False)
+                self.indexes.move_to_end(key)
+                self.index = self.indexes[key]
+                self.index_key = key
+            except (OSError, ValueError) as e:
+                self.error = str(e)
+        if self.index is not None and not self.index.complete:
+            self.builder.start()
+        else:
+            self.builder.stop()
+        self.update_scrollbars()
+        self.viewport().update()
+        self.pagesChanged.emit()
+
+    def build_step(self):
+        index = self.index
+        if index is None or index.complete:
+            self.builder.stop()
+            return
+        if self.target and self.verticalScrollBar().value() != self.target[1]:
+            # Scrolled away in the meantime
+            self.target = None
+        known = len(index.pages)
+        index.extend()
+        if index.complete:
+            self.builder.stop()
+        self.update_scrollbars()
+        if self.target:
+            page = self.target[0]
+            if page <= len(index.pages) or index.complete:
+                self.target = None
+                self.scroll_to_page(min(page, index.page_count()))
+            else:
+                self.scroll_to_page(page)
+                self.target = (page, self.verticalScrollBar().value())
+        # Repaint only if a page in view was waiting for this step
+        first, last = self.visible_pages()
+        if last >= known:
+            self.viewport().update()
+        self.pagesChanged.emit()
+
+    def page_size(self):
+        pdf = self.index.pdf
+        return round(pdf.w * self.scale), round(pdf.h * self.scale)
+
+    def page_stride(self):
+        return self.page_size()[1] + PAGE_GAP
+
+    def update_scrollbars(self):
+        vertical = self.verticalScrollBar()
+        horizontal = self.horizontalScrollBar()
+        if self.index is None:
+            vertical.setRange(0, 0)
+            horizontal.setRange(0, 0)
+            return
+        width, _ = self.page_size()
+        stride = self.page_stride()
+        viewport = self.viewport()
+        vertical.setRange(0, max(0, self.index.page_count() * stride + PAGE_GAP - viewport.height()))
+        vertical.setPageStep(viewport.height())
+        vertical.setSingleStep(max(1, stride // 20))
+        horizontal.setRange(0, max(0, width + 2 * PAGE_GAP - viewport.width()))
+        horizontal.setPageStep(viewport.width())
+
+    def current_page(self):
+        if self.index is None:
+            return 1
+        return self.verticalScrollBar().value() // self.page_stride() + 1
+
+    def scroll_to_page(self, number):
+        if self.index is not None:
+            self.verticalScrollBar().setValue((number - 1) * self.page_stride())
+
+    def visible_pages(self):
+        if self.index is None:
+            return 1, 0
+        stride = self.page_stride()
+        top = self.verticalScrollBar().value()
+        first = top // stride + 1
+        last = min((top + self.viewport().height()) // stride + 1, self.index.page_count())
+        return first, last
+
+    def page_image(self, number):
+        key = (self.index_key, number, self.scale)
+        image = self.images.get(key)
+        if image is not None:
+            self.cache_hits += 1
+            self.images.move_to_end(key)
+            return image
+        image = self.index.render(number, self.scale)
+        if image is None:
+            return None
+        self.cache_misses += 1
+        self.images[key] = image
+        if len(self.images) > PAGE_CACHE_SIZE:
+            self.images.popitem(last=False)
+        return image
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+        self.pagesChanged.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scrollbars()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(self.viewport().rect(), QColor("#7f8c8d"))
+        if self.index is None:
+            painter.setPen(Qt.white)
+            painter.drawText(self.viewport().rect(), Qt.AlignCenter, self.error or "Pick a file to preview it")
+            return
+        width, height = self.page_size()
+        stride = self.page_stride()
+        x = max(PAGE_GAP, (self.viewport().width() - width) // 2) - self.horizontalScrollBar().value()
+        first, last = self.visible_pages()
+        for number in range(first, last + 1):
+            y = PAGE_GAP + (number - 1) * stride - self.verticalScrollBar().value()
+            image = self.page_image(number)
+            if image is not None:
+                painter.drawImage(x, y, image)
+            else:
+                painter.fillRect(x, y, width, height, Qt.white)
+                painter.setPen(Qt.gray)
+                painter.drawText(QRectF(x, y, width, height), Qt.AlignCenter, f"Laying out page {number}...")
+
+class PreviewPane(QWidget):
+    # A PageView with the render path and zoom controls above it
+    def __init__(self, fonts=FONTS, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        controls = QHBoxLayout()
+        self.font_combobox = QComboBox(self)
+        self.font_combobox.addItems(fonts)
+        self.font_combobox.currentTextChanged.connect(self.on_font_changed)
+        self.font_combobox.setVisible(len(fonts) > 1)
+        controls.addWidget(self.font_combobox)
+        self.zoom_slider = QSlider(Qt.Horizontal, self)
+        self.zoom_slider.setRange(*ZOOM_RANGE)
+        self.zoom_slider.setValue(100)
+        self.zoom_slider.valueChanged.connect(self.on_zoom_changed)
+        controls.addWidget(self.zoom_slider)
+        self.page_label = QLabel(self)
+        controls.addWidget(self.page_label)
+        layout.addLayout(controls)
+
+        self.view = PageView(fonts[0], self)
+        self.view.pagesChanged.connect(self.update_page_label)
+        layout.addWidget(self.view)
+
+    @property
+    def render_font(self):
+        return self.view.render_font
+
+    def set_source(self, path):
+        self.view.set_source(path)
+
+    def on_font_changed(self, font):
+        self.view.set_render_font(font)
+
+    def on_zoom_changed(self, value):
+        self.view.set_scale(DEFAULT_SCALE * value / 100)
+
+    def update_page_label(self):
+        index = self.view.index
+        if index is None:
+            self.page_label.setText("")
+            return
+        count = index.page_count()
+        total = str(count) if index.complete else f"~{count}"
+        self.page_label.setText(f"Page {min(self.view.current_page(), count)} of {total}")
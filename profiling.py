@@ -0,0 +1,117 @@
+import json
+from time import perf_counter
+
+# Stages in the order reports list them; anything outside a span counts as "other"
+STAGES = ("sniff", "hash", "seek", "read", "decode", "tokenize", "layout", "index", "font", "compress", "write")
+
+class Span:
+    __slots__ = ("profile", "name")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.profile.enter(self.name)
+
+    def __exit__(self, kind, value, traceback):
+        self.profile.exit(kind is not None)
+
+class Profile:
+    # Wall time per named stage of one conversion, plus counters. Spans nest,
+    # and each one is charged only for the time not spent in the spans inside
+    # it, so stage times add up to the whole conversion. A Profile belongs to
+    # one conversion on one thread.
+    def __init__(self):
+        self.started = perf_counter()
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        # The innermost span an exception went through, to say where a conversion failed
+        self.failed_stage = None
+        self._spans = {}
+        self._stack = []
+        self._mark = self.started
+
+    def span(self, name):
+        span = self._spans.get(name)
+        if span is None:
+            span = self._spans[name] = Span(self, name)
+        return span
+
+    def enter(self, name):
+        now = perf_counter()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        self._stack.append(name)
+        self._mark = now
+
+    def exit(self, failed=False):
+        now = perf_counter()
+        name = self._stack.pop()
+        self._charge(name, now)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if failed and self.failed_stage is None:
+            self.failed_stage = name
+        self._mark = now
+
+    def _charge(self, name, now):
+        self.seconds[name] = self.seconds.get(name, 0.0) + now - self._mark
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        # Plain data: goes into conversion results, across processes and into JSON
+        total = perf_counter() - self.started
+        stages = {name: {"seconds": self.seconds[name], "calls": self.calls.get(name, 0)} for name in self.seconds}
+        stages["other"] = {"seconds": max(0.0, total - sum(self.seconds.values())), "calls": 0}
+        return {"seconds": total, "stages": stages, "counters": dict(self.counters),
+                "failed_stage": self.failed_stage}
+
+class NullProfile:
+    # Stands in when nobody is profiling; spans and counters cost one call
+    def __enter__(self):
+        pass
+
+    def __exit__(self, kind, value, traceback):
+        pass
+
+    def span(self, name):
+        return self
+
+    def count(self, name, n=1):
+        pass
+
+NO_PROFILE = NullProfile()
+
+def merge_reports(reports):
+    # One report for many conversions, e.g. a whole CLI run
+    merged = {"seconds": 0.0, "stages": {}, "counters": {}, "failed_stage": None}
+    for report in reports:
+        merged["seconds"] += report["seconds"]
+        for name, stage in report["stages"].items():
+            total = merged["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += stage["seconds"]
+            total["calls"] += stage["calls"]
+        for name, value in report["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+    return merged
+
+def format_report(report):
+    # One line per stage, slowest first, then the counters
+    total = max(report["seconds"], 1e-9)
+    order = {name: i for i, name in enumerate(STAGES + ("other",))}
+    stages = sorted(report["stages"].items(), key=lambda item: (-item[1]["seconds"], order.get(item[0], 99)))
+    lines = [f"{name:>9} {stage['seconds']:8.3f}s {100 * stage['seconds'] / total:5.1f}%" for name, stage in stages]
+    lines.append(f"{'total':>9} {report['seconds']:8.3f}s")
+    if report["counters"]:
+        lines.append("  " + ", ".join(f"{name} {value}" for name, value in sorted(report["counters"].items())))
+    if report.get("failed_stage"):
+        lines.append(f"  failed during {report['failed_stage']}")
+    return "\n".join(lines)
+
+def append_jsonl(path, record):
+    # One JSON object per line; several runs can share a file
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record, separators=(",", ":")) + "\n")
@@ -0,0 +1,198 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import file_digest, partial_path
+from converter import (COMPRESS_LEVEL, WRITE_BUFFER_SIZE, new_document, preload_fonts, render_pages,
+                       render_settings)
+from sources import find_sources
+
+# 2: sections carry their file name under the header
+MANIFEST_VERSION = 2
+
+def manifest_path_for(output_path):
+    return output_path + ".manifest.json"
+
+def load_manifest(output_path, settings):
+    # A manifest is only trusted if it was written for these settings and the
+    # PDF next to it is still the one it describes
+    try:
+        with open(manifest_path_for(output_path), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        stat = os.stat(output_path)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != settings:
+        return None
+    if manifest.get("pdf") != {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+        return None
+    return manifest
+
+def _render_job(job):
+    file_path, font, highlight, digest, compress_level, title = job
+    return render_pages(file_path, font, highlight, digest, compress_level, title)
+
+class ProjectBuild:
+    # One bound PDF (a "code book") for a source tree or a selection of files:
+    # a contents section, then one section per file headed by its name, with
+    # a bookmark each. Sections are laid out in parallel and then copied into
+    # the book in one sequential pass that shares a single font and resource
+    # dictionary. The manifest beside the output records, per file, its stat,
+    # hash, page range and where its compressed page streams sit in the PDF;
+    # a rebuild copies those bytes for unchanged files and only lays out the
+    # files that changed.
+    def __init__(self, root, output_path, font="arial", jobs=None, highlight=True, compress_level=COMPRESS_LEVEL,
+                 object_streams=True, sources=None):
+        # sources: the files to bind, in order, all under root; default is every file under root
+        self.root = root
+        self.sources = sources
+        self.output_path = output_path
+        self.font = font
+        self.jobs = jobs
+        self.highlight = highlight
+        self.compress_level = compress_level
+        self.object_streams = object_streams
+        # Settings for the whole document; file type varies per file and is not part of it
+        self.settings = render_settings(font, "", highlight, compress_level, object_streams)
+        self.settings.pop("file_type")
+        self.rebuilt = []
+        self.reused = []
+
+    def plan(self, sources, manifest):
+        # Split files into reusable manifest entries and ones that need a fresh layout
+        previous = manifest["files"] if manifest else {}
+        entries = {}
+        stale = []
+        for path in sources:
+            name = os.path.relpath(path, self.root)
+            stat = os.stat(path)
+            entry = previous.get(name)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                entries[name] = entry
+                continue
+            digest = file_digest(path)
+            if entry and entry["sha256"] == digest:
+                entries[name] = dict(entry, mtime_ns=stat.st_mtime_ns)
+                continue
+            entries[name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            stale.append(path)
+        return entries, stale
+
+    def render(self, stale, entries):
+        work = []
+        for path in stale:
+            name = os.path.relpath(path, self.root)
+            work.append((path, self.font, self.highlight, entries[name]["sha256"], self.compress_level, name))
+        if len(stale) < 2 or self.jobs == 1:
+            return dict(zip(stale, map(_render_job, work)))
+        preload_fonts(self.font)
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=preload_fonts, initargs=(self.font,)) as executor:
+            rendered = executor.map(_render_job, work, chunksize=8)
+            return dict(zip(stale, rendered))
+
+    def build(self):
+        sources = self.sources
+        if sources is None:
+            sources = list(find_sources(self.root, os.path.dirname(os.path.abspath(self.output_path))))
+        manifest = load_manifest(self.output_path, self.settings)
+        entries, stale = self.plan(sources, manifest)
+        rendered = self.render(stale, entries)
+
+        # Glyphs the shared subset font must cover, from fresh layouts and stored entries
+        glyphs = set()
+        page_counts = []
+        for path in sources:
+            name = os.path.relpath(path, self.root)
+            glyphs.update(rendered[path]["glyphs"] if path in rendered else entries[name]["glyphs"])
+            page_counts.append(len(rendered[path]["streams"]) if path in rendered else entries[name]["page_count"])
+
+        # Two builds of the same book each write their own partial file; the last replace wins
+        partial = partial_path(self.output_path)
+        old_pdf = open(self.output_path, "rb") if manifest else None
+        try:
+            with open(partial, "wb", buffering=WRITE_BUFFER_SIZE) as out:
+                pdf = new_document(self.font, self.compress_level, self.object_streams)
+                pdf.stream_to(out)
+                pdf.register_fonts(sorted(glyphs))
+
+                # Every section's first page is known before anything is written,
+                # so the contents go first
+                contents = []
+                page = pdf.contents_pages(len(sources))
+                for path, count in zip(sources, page_counts):
+                    contents.append((os.path.relpath(path, self.root), page + 1))
+                    page += count
+                pdf.add_bookmark("Contents", 1)
+                pdf.add_contents(contents)
+
+                pdf.page_streams = []
+                for path in sources:
+                    name = os.path.relpath(path, self.root)
+                    entry = entries[name]
+                    if path in rendered:
+                        result = rendered[path]
+                        streams = result["streams"]
+                        entry.update(lines=result["lines"], glyphs=result["glyphs"])
+                        self.rebuilt.append(name)
+                    else:
+                        streams = []
+                        for offset, length in entry["streams"]:
+                            old_pdf.seek(offset)
+                            streams.append(old_pdf.read(length))
+                        self.reused.append(name)
+
+                    entry["first_page"] = pdf.page + 1
+                    entry["page_count"] = len(streams)
+                    pdf.add_bookmark(name, pdf.page + 1)
+                    first_stream = len(pdf.page_streams)
+                    for content in streams:
+                        pdf.add_compressed_page(content)
+                    entry["streams"] = pdf.page_streams[first_stream:]
+                pdf.finish()
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            if old_pdf:
+                old_pdf.close()
+
+        os.replace(partial, self.output_path)
+        stat = os.stat(self.output_path)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "pdf": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "files": entries,
+        }
+        manifest_path = manifest_path_for(self.output_path)
+        partial = partial_path(manifest_path)
+        try:
+            with open(partial, "w", encoding="utf-8") as file:
+                # dumps goes through the C encoder; dump(file) would not
+                file.write(json.dumps(manifest, separators=(",", ":")))
+            os.replace(partial, manifest_path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+        return {
+            "output": self.output_path,
+            "files": len(sources),
+            "rebuilt": len(self.rebuilt),
+            "reused": len(self.reused),
+            "pages": pdf.page,
+            # One shared subset font against what a PDF per file would embed
+            "font_bytes": pdf.font_bytes,
+            "font_bytes_separate": pdf.separate_font_bytes([entry["glyphs"] for entry in entries.values()]),
+        }
+
+def build_project(root, output_path, font="arial", jobs=None, highlight=True, compress_level=COMPRESS_LEVEL,
+                  object_streams=True, sources=None):
+    start = time.perf_counter()
+    result = ProjectBuild(root, output_path, font=font, jobs=jobs, highlight=highlight, compress_level=compress_level,
+                          object_streams=object_streams, sources=sources).build()
+    result["seconds"] = time.perf_counter() - start
+    return result
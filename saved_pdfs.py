@@ -0,0 +1,449 @@
+import os
+import time
+
+from PyQt5.QtCore import (
+    QAbstractTableModel, QFileSystemWatcher, QModelIndex, QObject, QRunnable, QSortFilterProxyModel, Qt,
+    QThreadPool, QTimer, pyqtSignal
+)
+from PyQt5.QtGui import QIcon
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QComboBox, QHBoxLayout, QHeaderView, QLineEdit, QListWidget, QListWidgetItem, QTreeView,
+    QVBoxLayout, QWidget
+)
+
+from search import SearchIndex
+
+NAME, SIZE, MODIFIED = range(3)
+COLUMNS = ("Name", "Size", "Modified")
+
+# Raw value of a cell (name, bytes, mtime), as opposed to its display text
+SORT_ROLE = Qt.UserRole + 1
+
+# Folder changes arriving within this window are handled by a single scan
+RESCAN_DELAY_MS = 200
+
+# Above this many changed files the model is rebuilt rather than edited row by row
+RESET_THRESHOLD = 1000
+
+# On Windows scandir already has each entry's stat; elsewhere it costs a system call
+STAT_IS_FREE = os.name == "nt"
+
+SIZE_FILTERS = {
+    "Any size": (0, None),
+    "Under 100 KB": (0, 100 * 1024),
+    "100 KB - 1 MB": (100 * 1024, 1024 * 1024),
+    "Over 1 MB": (1024 * 1024, None),
+}
+DATE_FILTERS = {
+    "Any time": None,
+    "Today": 1,
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+}
+
+_icons = {}
+
+def cached_icon(path):
+    # Every row shares one QIcon per image
+    if path not in _icons:
+        _icons[path] = QIcon(path)
+    return _icons[path]
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def scan_folder(folder, known=None):
+    # name -> (size, mtime, inode) for every PDF in folder. Files we already
+    # know with the same inode are not stat'ed again; conversions replace
+    # their output, so a rewritten PDF always comes back with a new inode.
+    known = known or {}
+    found = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                if STAT_IS_FREE:
+                    stat = entry.stat()
+                    found[name] = (stat.st_size, stat.st_mtime, stat.st_ino)
+                    continue
+                inode = entry.inode()
+                previous = known.get(name)
+                if previous is not None and previous[2] == inode:
+                    found[name] = previous
+                    continue
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                # Removed while we were listing
+                continue
+            found[name] = (stat.st_size, stat.st_mtime, inode)
+    return found
+
+class FolderScanSignals(QObject):
+    finished = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+class FolderScan(QRunnable):
+    def __init__(self, folder, known):
+        super().__init__()
+        self.folder = folder
+        self.known = known
+        self.signals = FolderScanSignals()
+
+    def run(self):
+        try:
+            found = scan_folder(self.folder, self.known)
+        except OSError as e:
+            self.signals.failed.emit(self.folder, str(e))
+        else:
+            self.signals.finished.emit(self.folder, found)
+
+class SavedPdfIndex(QAbstractTableModel):
+    # The PDFs in the save folder as a table model. A QFileSystemWatcher
+    # triggers a background scan, and only the difference from what is
+    # already indexed (added, removed and replaced files) reaches the view.
+    # Rows are kept in the current sort order, so the view only ever asks
+    # for the rows it is showing and new files are inserted in place.
+    def __init__(self, icon_path, parent=None):
+        super().__init__(parent)
+        self.icon_path = icon_path
+        self.folder = None
+        # (name, size, mtime, inode) per PDF, in sort order, and the same entries by name
+        self.rows = []
+        self.entries = {}
+        self.sort_column = NAME
+        self.sort_order = Qt.AscendingOrder
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_scan)
+        self.scan_timer = QTimer(self)
+        self.scan_timer.setSingleShot(True)
+        self.scan_timer.timeout.connect(self.scan)
+        self.scan_job = None
+        self.rescan = False
+
+    def set_folder(self, folder):
+        if folder == self.folder:
+            self.schedule_scan()
+            return
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.folder = folder
+        self.reset_rows([])
+        self.watcher.addPath(folder)
+        self.scan()
+
+    def schedule_scan(self, *args):
+        self.scan_timer.start(RESCAN_DELAY_MS)
+
+    def scan(self):
+        if self.scan_job is not None:
+            # One scan at a time; go again once the running one reports back
+            self.rescan = True
+            return
+        known = {name: entry[1:] for name, entry in self.entries.items()}
+        self.scan_job = FolderScan(self.folder, known)
+        self.scan_job.signals.finished.connect(self.on_scanned)
+        self.scan_job.signals.failed.connect(self.on_scan_failed)
+        QThreadPool.globalInstance().start(self.scan_job)
+
+    def on_scanned(self, folder, found):
+        self.scan_job = None
+        if folder == self.folder:
+            self.apply_scan(found)
+        self.scan_again()
+
+    def on_scan_failed(self, folder, error):
+        self.scan_job = None
+        self.scan_again()
+
+    def scan_again(self):
+        if self.rescan:
+            self.rescan = False
+            self.scan()
+
+    def apply_scan(self, found):
+        current = self.entries
+        removed = current.keys() - found.keys()
+        changed = [(name,) + stats for name, stats in found.items() if name in current and current[name][1:] != stats]
+        added = [(name,) + stats for name, stats in found.items() if name not in current]
+        if len(removed) + len(changed) + len(added) > RESET_THRESHOLD:
+            self.reset_rows([(name,) + stats for name, stats in found.items()])
+            return
+        # A changed file may sort elsewhere now: it is taken out and put back in place
+        self.remove_names(removed | {entry[0] for entry in changed})
+        self.insert_entries(changed + added)
+
+    def update_file(self, path):
+        # A file we just wrote; no need to wait for the watcher
+        if self.folder is None or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.folder):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        entry = (os.path.basename(path), stat.st_size, stat.st_mtime, stat.st_ino)
+        if not self.replace_entry(entry):
+            self.insert_entries([entry])
+
+    def remove_file(self, name):
+        self.remove_names({name})
+
+    def file_name(self, row):
+        return self.rows[row][0]
+
+    def reset_rows(self, entries):
+        # One sort instead of thousands of row moves
+        self.beginResetModel()
+        self.rows = sorted(entries, key=self.sort_key, reverse=self.sort_order == Qt.DescendingOrder)
+        self.entries = {entry[0]: entry for entry in self.rows}
+        self.endResetModel()
+
+    def row_of(self, name):
+        # Found by its sort key, then among the entries that share it
+        entry = self.entries[name]
+        row = self.position(entry, after=False)
+        while self.rows[row][0] != name:
+            row += 1
+        return row
+
+    def remove_names(self, names):
+        names = [name for name in names if name in self.entries]
+        if len(names) > RESET_THRESHOLD:
+            names = set(names)
+            self.reset_rows([entry for entry in self.rows if entry[0] not in names])
+            return
+        # Remove runs of adjacent rows together, from the bottom up so row numbers stay valid
+        doomed = sorted(self.row_of(name) for name in names)
+        for name in names:
+            del self.entries[name]
+        while doomed:
+            last = doomed.pop()
+            first = last
+            while doomed and doomed[-1] == first - 1:
+                first = doomed.pop()
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.rows[first:last + 1]
+            self.endRemoveRows()
+
+    def replace_entry(self, entry):
+        if entry[0] not in self.entries:
+            return False
+        self.remove_names([entry[0]])
+        self.insert_entries([entry])
+        return True
+
+    def insert_entries(self, entries):
+        if not entries:
+            return
+        if len(entries) > RESET_THRESHOLD:
+            self.reset_rows(self.rows + entries)
+            return
+        for entry in entries:
+            row = self.position(entry)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.rows.insert(row, entry)
+            self.entries[entry[0]] = entry
+            self.endInsertRows()
+
+    def sort_key(self, entry):
+        if self.sort_column == NAME:
+            return entry[0].lower()
+        return entry[self.sort_column]
+
+    def position(self, entry, after=True):
+        # Where entry goes in the sorted rows, after any equal keys (or before them)
+        key = self.sort_key(entry)
+        descending = self.sort_order == Qt.DescendingOrder
+        lo, hi = 0, len(self.rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = self.sort_key(self.rows[mid])
+            if mid_key == key and after or (mid_key > key if descending else mid_key < key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        names = [self.rows[index.row()][0] for index in persistent]
+        self.sort_column = column
+        self.sort_order = order
+        self.rows.sort(key=self.sort_key, reverse=order == Qt.DescendingOrder)
+        if persistent:
+            rows = {entry[0]: row for row, entry in enumerate(self.rows)}
+            self.changePersistentIndexList(
+                persistent, [self.index(rows[name], index.column()) for name, index in zip(names, persistent)])
+        self.layoutChanged.emit()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        # Display text is only built for rows the view actually shows
+        entry = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == NAME:
+                return entry[0]
+            if column == SIZE:
+                return format_size(entry[1])
+            return time.strftime("%Y-%m-%d %H:%M", time.localtime(entry[2]))
+        if role == Qt.DecorationRole and column == NAME:
+            return cached_icon(self.icon_path)
+        if role == Qt.TextAlignmentRole and column == SIZE:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == SORT_ROLE:
+            return entry[column]
+        return None
+
+class SavedPdfFilter(QSortFilterProxyModel):
+    # Filters the index by name, size and date. Sorting is forwarded to the
+    # index, which sorts its rows in one go instead of comparing pairs of
+    # cells through the proxy.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.name_filter = ""
+        self.size_range = SIZE_FILTERS["Any size"]
+        self.max_age_days = None
+
+    def set_name_filter(self, text):
+        self.name_filter = text.lower()
+        self.invalidateFilter()
+
+    def set_size_filter(self, label):
+        self.size_range = SIZE_FILTERS[label]
+        self.invalidateFilter()
+
+    def set_date_filter(self, label):
+        self.max_age_days = DATE_FILTERS[label]
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        name, size, mtime, _ = self.sourceModel().rows[source_row]
+        if self.name_filter and self.name_filter not in name.lower():
+            return False
+        smallest, largest = self.size_range
+        if size < smallest or (largest is not None and size >= largest):
+            return False
+        if self.max_age_days is not None and mtime < time.time() - self.max_age_days * 86400:
+            return False
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+class SavedPdfPanel(QWidget):
+    # Filter controls above a sortable view of the save folder. The view asks
+    # for rows as they scroll into sight, all of the same height.
+    def __init__(self, icon_path, parent=None):
+        super().__init__(parent)
+        self.index = SavedPdfIndex(icon_path, self)
+        self.proxy = SavedPdfFilter(self)
+        self.proxy.setSourceModel(self.index)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        self.name_entry = QLineEdit(self)
+        self.name_entry.setPlaceholderText("Filter by name")
+        self.name_entry.textChanged.connect(self.proxy.set_name_filter)
+        filter_layout.addWidget(self.name_entry)
+        self.size_combobox = QComboBox(self)
+        self.size_combobox.addItems(SIZE_FILTERS)
+        self.size_combobox.currentTextChanged.connect(self.proxy.set_size_filter)
+        filter_layout.addWidget(self.size_combobox)
+        self.date_combobox = QComboBox(self)
+        self.date_combobox.addItems(DATE_FILTERS)
+        self.date_combobox.currentTextChanged.connect(self.proxy.set_date_filter)
+        filter_layout.addWidget(self.date_combobox)
+        layout.addLayout(filter_layout)
+
+        self.view = QTreeView(self)
+        self.view.setModel(self.proxy)
+        self.view.setRootIsDecorated(False)
+        self.view.setUniformRowHeights(True)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(NAME, Qt.AscendingOrder)
+        # Fixed widths: sizing columns to their contents would read thousands of rows
+        header = self.view.header()
+        header.setStretchLastSection(False)
+        header.setSectionResizeMode(NAME, QHeaderView.Stretch)
+        header.resizeSection(SIZE, 90)
+        header.resizeSection(MODIFIED, 140)
+        layout.addWidget(self.view)
+        self.setLayout(layout)
+
+    def selected_name(self):
+        current = self.view.currentIndex()
+        if not current.isValid():
+            return None
+        return self.index.file_name(self.proxy.mapToSource(current).row())
+
+class PdfSearchPanel(QWidget):
+    # Full-text search over the save folder's search index. Queries run on
+    # the GUI thread; the index answers them in milliseconds.
+    opened = pyqtSignal(str, int)  # output path, page
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.search_index = None
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.query_entry = QLineEdit(self)
+        self.query_entry.setPlaceholderText("Search inside saved PDFs")
+        self.query_entry.textChanged.connect(self.run_search)
+        layout.addWidget(self.query_entry)
+        self.results = QListWidget(self)
+        self.results.setUniformItemSizes(True)
+        self.results.setMaximumHeight(150)
+        self.results.itemActivated.connect(self.open_result)
+        self.results.hide()
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+
+    def set_folder(self, folder):
+        if self.search_index is not None:
+            if self.search_index.folder == os.path.abspath(folder):
+                return
+            self.search_index.close()
+        self.search_index = SearchIndex(folder)
+        self.run_search()
+
+    def remove(self, output_path):
+        if self.search_index is not None:
+            self.search_index.remove(output_path)
+            self.run_search()
+
+    def run_search(self):
+        query = self.query_entry.text()
+        self.results.clear()
+        hits = self.search_index.search(query) if self.search_index is not None and query.strip() else []
+        for path, page, line, text in hits:
+            item = QListWidgetItem(f"{self.search_index.name(path)}  p.{page} l.{line}: {text.strip()}")
+            item.setData(Qt.UserRole, (path, page))
+            self.results.addItem(item)
+        self.results.setVisible(bool(query.strip()))
+
+    def open_result(self, item):
+        path, page = item.data(Qt.UserRole)
+        self.opened.emit(path, page)
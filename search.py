@@ -0,0 +1,222 @@
+import os
+import re
+import sqlite3
+
+# Search index kept in the save folder next to the PDFs it covers
+SEARCH_INDEX_NAME = ".search.sqlite"
+
+# Seconds a writer waits for another process or thread holding the index
+BUSY_TIMEOUT = 60
+
+# Page text a writer holds before writing it out, so huge sources stay flat in memory
+FLUSH_BYTES = 4 * 1024 * 1024
+
+# Hits returned by a search unless asked otherwise
+DEFAULT_LIMIT = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    output TEXT UNIQUE NOT NULL,
+    source TEXT,
+    digest TEXT,
+    pages INTEGER,
+    lines INTEGER
+);
+CREATE TABLE IF NOT EXISTS ranges (
+    first INTEGER PRIMARY KEY,
+    last INTEGER NOT NULL,
+    file_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ranges_file ON ranges (file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5 (text, page UNINDEXED, first_line UNINDEXED);
+"""
+
+def index_path_for(folder):
+    return os.path.join(folder, SEARCH_INDEX_NAME)
+
+def match_query(query):
+    # Each whitespace separated term must appear; a term is matched as a phrase
+    # of its words, so convert_file finds "convert_file" and "convert file"
+    terms = [term for term in query.split() if re.search(r"\w", term)]
+    return " ".join('"%s"' % term.replace('"', '""') for term in terms)
+
+class SearchIndex:
+    # Full-text index of the PDFs in one folder, one FTS5 row per page. Rows
+    # are written in runs of consecutive rowids; the ranges table maps each
+    # run to its file, so replacing or removing a file deletes by rowid range
+    # and a search resolves hits without touching the rest of the index.
+    # Files are stored relative to the folder so it can be moved as a whole.
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.db = sqlite3.connect(index_path_for(self.folder), timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def name(self, output_path):
+        return os.path.relpath(os.path.abspath(output_path), self.folder)
+
+    def is_current(self, output_path, digest):
+        row = self.db.execute("SELECT digest FROM files WHERE output = ?", (self.name(output_path),)).fetchone()
+        return row is not None and row[0] == digest
+
+    def writer(self, output_path, source_path, digest, first_line=1):
+        return IndexWriter(self, self.name(output_path), source_path, digest, first_line)
+
+    def insert_pages(self, rows):
+        # Append rows (page, first_line, text) as one run; returns (first, last) rowid
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            first = self.insert_run(rows)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return first, first + len(rows) - 1
+
+    def insert_run(self, rows):
+        # Inside a write transaction, so nobody else can take the rowids in between
+        top = self.db.execute("SELECT rowid FROM pages ORDER BY rowid DESC LIMIT 1").fetchone()
+        first = top[0] + 1 if top else 1
+        self.db.executemany("INSERT INTO pages (rowid, page, first_line, text) VALUES (?, ?, ?, ?)",
+                            [(first + i,) + row for i, row in enumerate(rows)])
+        return first
+
+    def delete_runs(self, runs):
+        self.db.executemany("DELETE FROM pages WHERE rowid BETWEEN ? AND ?", runs)
+
+    def commit_file(self, name, source, digest, pages, lines, runs, rows):
+        # Swap the file's old runs for the new ones in one transaction
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            if rows:
+                first = self.insert_run(rows)
+                runs = runs + [(first, first + len(rows) - 1)]
+            file_id = self.db.execute(
+                "INSERT INTO files (output, source, digest, pages, lines) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (output) DO UPDATE SET source = excluded.source, digest = excluded.digest, "
+                "pages = excluded.pages, lines = excluded.lines RETURNING id",
+                (name, source, digest, pages, lines)).fetchone()[0]
+            self.drop_runs(file_id)
+            self.db.executemany("INSERT INTO ranges (first, last, file_id) VALUES (?, ?, ?)",
+                                [(first, last, file_id) for first, last in runs])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def drop_runs(self, file_id):
+        runs = self.db.execute("SELECT first, last FROM ranges WHERE file_id = ?", (file_id,)).fetchall()
+        self.delete_runs(runs)
+        self.db.execute("DELETE FROM ranges WHERE file_id = ?", (file_id,))
+
+    def remove(self, output_path):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("DELETE FROM files WHERE output = ? RETURNING id",
+                                  (self.name(output_path),)).fetchone()
+            if row is not None:
+                self.drop_runs(row[0])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def file_for(self, rowid):
+        row = self.db.execute(
+            "SELECT files.output, ranges.last FROM ranges JOIN files ON files.id = ranges.file_id "
+            "WHERE ranges.first <= ? ORDER BY ranges.first DESC LIMIT 1", (rowid,)).fetchone()
+        if row is None or row[1] < rowid:
+            # Left behind by a writer that never finished
+            return None
+        return row[0]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        # (output path, page, line number, line) for each matching line, at most `limit` of them
+        match = match_query(query)
+        if not match:
+            return []
+        words = re.findall(r"\w+", query.lower())
+        pattern = re.compile("|".join(map(re.escape, words)), re.IGNORECASE)
+        hits = []
+        pages = self.db.execute("SELECT rowid, page, first_line, text FROM pages WHERE pages MATCH ? LIMIT ?",
+                                (match, limit))
+        for rowid, page, first_line, text in pages:
+            output = self.file_for(rowid)
+            if output is None:
+                continue
+            path = os.path.join(self.folder, output)
+            for number, line in enumerate(text.split("\n"), first_line):
+                if pattern.search(line):
+                    hits.append((path, page, number, line))
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+class IndexWriter:
+    # Takes the source lines of one conversion block by block, together with
+    # where the layout put them, and files them under the page each line
+    # starts on. Nothing becomes searchable until finish(), which replaces
+    # whatever the index held for the output before.
+    def __init__(self, index, name, source, digest, first_line=1):
+        self.index = index
+        self.name = name
+        self.source = source
+        self.digest = digest
+        # Lines are numbered as in the source, also when only a window of it was rendered
+        self.line = first_line - 1
+        self.page = None
+        self.first_line = None
+        self.text = []
+        # Pages waiting to be written, and the runs of rowids already written
+        self.rows = []
+        self.pending = 0
+        self.runs = []
+
+    def add_block(self, lines, starts, placed, highlighted=False):
+        # starts: first row of each line; placed: (first row, page) of each run of rows
+        chunk = 0
+        last_chunk = len(placed) - 1
+        for line, row in zip(lines, starts):
+            while chunk < last_chunk and placed[chunk + 1][0] <= row:
+                chunk += 1
+            page = placed[chunk][1]
+            if page != self.page:
+                self.end_page()
+                self.page = page
+                self.first_line = self.line + 1
+            self.text.append("".join([text for _, text in line]) if highlighted else line)
+            self.line += 1
+
+    def end_page(self):
+        if self.page is None:
+            return
+        text = "\n".join(self.text)
+        self.rows.append((self.page, self.first_line, text))
+        self.text = []
+        self.pending += len(text)
+        if self.pending >= FLUSH_BYTES:
+            self.runs.append(self.index.insert_pages(self.rows))
+            self.rows = []
+            self.pending = 0
+
+    def finish(self, pages):
+        self.end_page()
+        self.page = None
+        self.index.commit_file(self.name, self.source, self.digest, pages, self.line, self.runs, self.rows)
+        self.rows = []
+        self.runs = []
+
+    def abort(self):
+        # Drop the pages written so far; the index keeps what it had for the output
+        if self.runs:
+            self.index.db.execute("BEGIN IMMEDIATE")
+            self.index.delete_runs(self.runs)
+            self.index.db.execute("COMMIT")
+        self.runs = []
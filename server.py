@@ -0,0 +1,385 @@
+import asyncio
+import collections
+import json
+import os
+import secrets
+import shutil
+import signal
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from cache import CACHE_FOLDER_NAME, ConversionCache
+from converter import RENDERERS, convert_file, preload_fonts
+from sources import pdf_filename
+
+# Jobs that may wait for a worker; past this, submissions get 503 and Retry-After
+DEFAULT_QUEUE_DEPTH = 64
+
+# Largest source accepted, in bytes
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024
+
+# Finished jobs kept for download; older ones are deleted, files and all
+KEEP_FINISHED = 1024
+
+# Longest a status request may wait for its job, in seconds
+MAX_WAIT = 60
+
+# Conversions between two cache evictions
+EVICT_INTERVAL = 256
+
+# Request line plus headers
+MAX_HEAD_BYTES = 64 * 1024
+
+# Subfolder of a job's folder holding the upload, so a source named like its PDF can't overwrite it
+SOURCE_FOLDER_NAME = "source"
+
+# Bytes per read and write when receiving a source or sending a PDF
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable",
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+def _init_worker(fonts):
+    # Every worker loads the font metrics before its first job; Ctrl+C is for the server
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for font in fonts:
+        preload_fonts(font)
+
+def _run_job(job):
+    # Runs in a pool process, which keeps its fonts, font subsets and token cache between jobs
+    file_path, output_path, font, cache_folder, options = job
+    try:
+        cache = ConversionCache(cache_folder) if cache_folder else None
+        return convert_file(file_path, output_path, font=font, cache=cache, **options)
+    except Exception as e:
+        return {"source": file_path, "error": str(e)}
+
+class Job:
+    def __init__(self, job_id, folder, name, font, options):
+        self.id = job_id
+        self.folder = folder
+        self.name = name
+        self.font = font
+        self.options = options
+        self.status = "queued"
+        self.result = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.done = asyncio.Event()
+
+    @property
+    def source_path(self):
+        return os.path.join(self.folder, SOURCE_FOLDER_NAME, self.name)
+
+    @property
+    def output_path(self):
+        return os.path.join(self.folder, pdf_filename(self.name))
+
+    def describe(self):
+        info = {"id": self.id, "name": self.name, "font": self.font, "status": self.status,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished}
+        if self.result is not None:
+            for key in ("pages", "lines", "encoding", "cached", "skipped", "error"):
+                if key in self.result:
+                    info[key] = self.result[key]
+        return info
+
+class ConversionServer:
+    # Converts sources sent over HTTP. The asyncio side only moves bytes and
+    # keeps job state; conversions run in a pool of worker processes started
+    # (and warmed up) once, so a job never pays for process start or fonts.
+    # Jobs wait in a bounded queue; when it is full, new work is turned away
+    # with 503 rather than piling up.
+    def __init__(self, spool_folder, workers=None, queue_depth=DEFAULT_QUEUE_DEPTH, use_cache=True):
+        self.spool_folder = os.path.abspath(spool_folder)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth
+        self.cache_folder = os.path.join(self.spool_folder, CACHE_FOLDER_NAME) if use_cache else None
+        self.jobs = {}
+        self.finished = collections.deque()
+        self.running = 0
+        self.since_evict = 0
+        self.counts = {"submitted": 0, "rejected": 0, "done": 0, "skipped": 0, "failed": 0}
+        self.queue = None
+        self.pool = None
+        self._dispatchers = []
+
+    async def start(self):
+        os.makedirs(self.spool_folder, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        self.pool = self.new_pool()
+        # One task per worker makes the pool start all of them now, not on the first jobs
+        await asyncio.gather(*(loop.run_in_executor(self.pool, os.getpid) for _ in range(self.workers)))
+        self.queue = asyncio.Queue(self.queue_depth)
+        self._dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+
+    def new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(tuple(RENDERERS),))
+
+    def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            job.started = time.time()
+            self.running += 1
+            pool = self.pool
+            try:
+                result = await loop.run_in_executor(pool, _run_job, (
+                    job.source_path, job.output_path, job.font, self.cache_folder, job.options))
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory) and took the pool with it: every job
+                # it was running fails, and the first dispatcher to notice starts a new pool
+                result = {"source": job.source_path, "error": "the worker converting this file died"}
+                if self.pool is pool:
+                    self.pool = self.new_pool()
+                    pool.shutdown(wait=False)
+            except Exception as e:
+                result = {"source": job.source_path, "error": str(e)}
+            finally:
+                self.running -= 1
+            self.finish(job, result)
+            self.since_evict += 1
+            if self.cache_folder and self.since_evict >= EVICT_INTERVAL:
+                self.since_evict = 0
+                loop.run_in_executor(None, ConversionCache(self.cache_folder).evict)
+
+    def finish(self, job, result):
+        job.result = result
+        job.status = "failed" if "error" in result else "skipped" if result.get("skipped") else "done"
+        job.finished = time.time()
+        self.counts[job.status] += 1
+        if os.path.exists(job.source_path):
+            os.remove(job.source_path)
+        job.done.set()
+        self.finished.append(job.id)
+        while len(self.finished) > KEEP_FINISHED:
+            self.drop(self.finished.popleft())
+
+    def drop(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job.folder, ignore_errors=True)
+
+    async def handle(self, reader, writer):
+        # One connection; requests on it are served in turn while the client keeps it open
+        try:
+            while True:
+                head = await read_head(reader)
+                if head is None:
+                    break
+                method, target, version, headers = head
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                try:
+                    await self.respond(method, target, headers, reader, writer)
+                except (HttpError, ValueError) as e:
+                    error = e if isinstance(e, HttpError) else HttpError(400, str(e))
+                    # A body we did not read is still on the wire, so the connection can't be reused
+                    keep_alive = keep_alive and headers.get("content-length", "0") == "0"
+                    await send_json(writer, error.status, {"error": str(error)}, keep_alive, error.headers)
+                if not keep_alive:
+                    break
+        except (OSError, asyncio.IncompleteReadError):
+            # The client went away, or a file failed mid-response: drop the connection
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, headers, reader, writer):
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        if parts == ["jobs"]:
+            if method != "POST":
+                raise HttpError(405, "use POST to submit a job")
+            job = await self.submit(query, headers, reader)
+            await send_json(writer, 202, job.describe(), headers={"Location": f"/jobs/{job.id}"})
+            return
+        if parts == ["status"] and method == "GET":
+            await send_json(writer, 200, self.status())
+            return
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, "no such job")
+            if len(parts) == 3 and parts[2] == "pdf" and method == "GET":
+                await self.send_pdf(job, writer)
+                return
+            if len(parts) == 2 and method == "GET":
+                wait = min(float(query.get("wait", 0)), MAX_WAIT)
+                if wait > 0 and not job.done.is_set():
+                    try:
+                        await asyncio.wait_for(job.done.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                await send_json(writer, 200, job.describe())
+                return
+            if len(parts) == 2 and method == "DELETE":
+                if job.status == "running":
+                    raise HttpError(409, "job is running")
+                job.status = "cancelled"
+                job.done.set()
+                self.drop(job.id)
+                await send_json(writer, 200, job.describe())
+                return
+            raise HttpError(405, "method not allowed")
+        raise HttpError(404, "not found")
+
+    async def submit(self, query, headers, reader):
+        # POST /jobs?name=file.py[&font=minecraft][&plain=1] with the source as the body
+        name = os.path.basename(query.get("name", ""))
+        if not name or name.startswith("."):
+            raise HttpError(400, "name the source file: /jobs?name=<file name>")
+        font = query.get("font", "arial")
+        if font not in RENDERERS:
+            raise HttpError(400, f"font must be one of {', '.join(sorted(RENDERERS))}")
+        if "content-length" not in headers:
+            raise HttpError(411, "send the source with a Content-Length")
+        length = int(headers["content-length"])
+        if length < 0:
+            raise HttpError(400, "Content-Length can't be negative")
+        if length > MAX_UPLOAD_BYTES:
+            raise HttpError(413, f"sources are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        if self.queue.full():
+            self.counts["rejected"] += 1
+            raise HttpError(503, "queue is full, try again shortly", {"Retry-After": "1"})
+
+        job_id = secrets.token_hex(8)
+        folder = os.path.join(self.spool_folder, job_id)
+        os.makedirs(folder)
+        job = Job(job_id, folder, name, font, {"highlight": query.get("plain") != "1"})
+        try:
+            os.makedirs(os.path.dirname(job.source_path))
+            with open(job.source_path, "wb") as file:
+                while length:
+                    data = await reader.read(min(length, TRANSFER_CHUNK_SIZE))
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", length)
+                    file.write(data)
+                    length -= len(data)
+        except BaseException:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        if self.queue.full():
+            # Filled up while the body was arriving
+            shutil.rmtree(folder, ignore_errors=True)
+            self.counts["rejected"] += 1
+            raise HttpError(503, "queue is full, try again shortly", {"Retry-After": "1"})
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        self.counts["submitted"] += 1
+        return job
+
+    async def send_pdf(self, job, writer):
+        if job.status in ("queued", "running"):
+            raise HttpError(409, f"job is {job.status}")
+        if job.status != "done":
+            raise HttpError(409, f"job {job.status}, there is no PDF")
+        try:
+            file = open(job.output_path, "rb")
+        except OSError:
+            raise HttpError(404, "the PDF of this job is gone")
+        with file:
+            writer.write(response_head(200, {
+                "Content-Type": "application/pdf",
+                "Content-Length": str(os.fstat(file.fileno()).st_size),
+                "Content-Disposition": f'attachment; filename="{pdf_filename(job.name)}"',
+            }))
+            while True:
+                data = file.read(TRANSFER_CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+
+    def status(self):
+        return dict(self.counts, workers=self.workers, running=self.running, queued=self.queue.qsize(),
+                    queue_depth=self.queue_depth, kept=len(self.jobs))
+
+async def read_head(reader):
+    # (method, target, version, headers) of the next request, or None once the client is done
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ConnectionError("request head too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise ConnectionError("malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def send_json(writer, status, payload, keep_alive=True, headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    head = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+    if not keep_alive:
+        head["Connection"] = "close"
+    head.update(headers or {})
+    writer.write(response_head(status, head) + body)
+    await writer.drain()
+
+async def serve(host="127.0.0.1", port=8765, socket_path=None, spool_folder=None, workers=None,
+                queue_depth=DEFAULT_QUEUE_DEPTH, use_cache=True, ready=None):
+    # Runs until cancelled, SIGINT or SIGTERM; ready, if given, is called with the
+    # address once requests are accepted. A spool folder made here goes away on exit
+    temporary = spool_folder is None
+    spool_folder = spool_folder or tempfile.mkdtemp(prefix="codetopdf-server-")
+    conversion_server = ConversionServer(spool_folder, workers, queue_depth, use_cache)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, asyncio.current_task().cancel)
+        except (NotImplementedError, RuntimeError):
+            # No asyncio signal handling on Windows; Ctrl+C still ends asyncio.run
+            pass
+    try:
+        await conversion_server.start()
+        if socket_path:
+            server = await asyncio.start_unix_server(conversion_server.handle, socket_path, limit=MAX_HEAD_BYTES)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(conversion_server.handle, host, port, limit=MAX_HEAD_BYTES)
+            address = "http://%s:%d" % server.sockets[0].getsockname()[:2]
+        async with server:
+            if ready:
+                ready(address, conversion_server)
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        conversion_server.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        if temporary:
+            shutil.rmtree(spool_folder, ignore_errors=True)
@@ -0,0 +1,67 @@
+import codecs
+
+# Bytes read from the start of a file to tell text from binary and pick a codec
+SNIFF_BYTES = 64 * 1024
+
+# Byte order marks, UTF-32 first since its little-endian mark starts like UTF-16's;
+# the codecs named here consume the mark themselves
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Control bytes that don't turn up in text (tab, newlines, form feed and escape do)
+CONTROL_BYTES = bytes(set(range(32)) - {9, 10, 11, 12, 13, 27})
+
+# Share of control bytes above which a file without NULs still counts as binary
+MAX_CONTROL_RATIO = 0.05
+
+# Used for anything that is neither UTF-8 nor UTF-16/32; Latin-1 takes the bytes cp1252 leaves undefined
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+
+def utf16_without_bom(prefix):
+    # Mostly ASCII UTF-16 has a NUL in every other byte: the high byte of each unit
+    half = len(prefix) // 2
+    if half < 2:
+        return None
+    even = prefix[0:2 * half:2].count(0)
+    odd = prefix[1:2 * half:2].count(0)
+    for encoding, high, low in (("utf-16-le", odd, even), ("utf-16-be", even, odd)):
+        if high >= 0.4 * half and low <= 0.05 * half:
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(prefix[:2 * half])
+            except UnicodeDecodeError:
+                return None
+            return encoding
+    return None
+
+def sniff(prefix, complete=False):
+    # The codec to read a file starting with prefix, or None if it is binary;
+    # complete says prefix is the whole file
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    if b"\0" in prefix:
+        return utf16_without_bom(prefix)
+    if len(prefix) - len(prefix.translate(None, CONTROL_BYTES)) > MAX_CONTROL_RATIO * len(prefix):
+        return None
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=complete)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            prefix.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+
+def sniff_file(file):
+    # sniff() for a file opened in binary mode, which is left at the start
+    prefix = file.read(SNIFF_BYTES)
+    file.seek(0)
+    return sniff(prefix, len(prefix) < SNIFF_BYTES)
@@ -0,0 +1,73 @@
+import collections
+import os
+
+# File types offered in the GUI and the extension each one expects
+VALID_TYPES = {
+    "Text File (.txt)": ".txt",
+    "Python File (.py)": ".py",
+    "Java File (.java)": ".java",
+    "C++ File (.cpp)": ".cpp",
+    "HTML File (.html)": ".html",
+    "CSS File (.css)": ".css",
+    "JavaScript File (.js)": ".js",
+    "Ruby File (.rb)": ".rb",
+    "PHP File (.php)": ".php",
+    "Swift File (.swift)": ".swift",
+    "Go File (.go)": ".go",
+    "Perl File (.pl)": ".pl",
+    "TypeScript File (.ts)": ".ts"
+}
+EXTENSIONS = set(VALID_TYPES.values())
+
+def pdf_filename(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0] + ".pdf"
+
+def type_for(file_path):
+    # The VALID_TYPES name matching the file's extension, or None if it isn't supported
+    extension = os.path.splitext(file_path)[1]
+    return next((name for name, expected in VALID_TYPES.items() if expected == extension), None)
+
+def output_path_for(file_path, root, output_folder):
+    # Mirror the source tree so files with the same name don't collide
+    relative_dir = os.path.relpath(os.path.dirname(file_path) or ".", root)
+    return os.path.normpath(os.path.join(output_folder, relative_dir, pdf_filename(file_path)))
+
+def output_paths(sources, root, output_folder):
+    # output_path_for each source, except that files which only differ in extension
+    # (foo.py, foo.js) would share a PDF: those keep their extension in its name
+    stems = collections.Counter(os.path.splitext(os.path.abspath(source))[0] for source in sources)
+    outputs = {}
+    for source in sources:
+        output = output_path_for(source, root, output_folder)
+        stem, extension = os.path.splitext(os.path.abspath(source))
+        if stems[stem] > 1:
+            output = output[:-len(".pdf")] + extension + ".pdf"
+        outputs[source] = output
+    return outputs
+
+def find_sources(root, skip_folder=None):
+    # Every supported file under root, in a stable order, skipping hidden folders
+    skip_folder = os.path.abspath(skip_folder) if skip_folder else None
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if not d.startswith(".") and os.path.abspath(os.path.join(dirpath, d)) != skip_folder
+        )
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] in EXTENSIONS:
+                yield os.path.join(dirpath, filename)
+
+def common_root(paths):
+    # The folder a set of files and directories share; names in a book are relative to it
+    return os.path.commonpath([os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path) or ".")
+                               for path in paths])
+
+def expand_sources(paths, skip_folder=None):
+    # Files given directly plus every supported file under the directories, in the order given
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(find_sources(path, skip_folder))
+        else:
+            sources.append(path)
+    return list(dict.fromkeys(sources))
@@ -0,0 +1,116 @@
+import codecs
+import io
+import struct
+import tempfile
+
+from profiling import NO_PROFILE
+
+# Bytes read from the source per chunk
+READ_CHUNK_SIZE = 1024 * 1024
+# A "line" longer than this is handed to the layout in pieces; it wraps anyway
+MAX_LINE_LENGTH = 64 * 1024
+
+def read_lines(file, chunk_size=READ_CHUNK_SIZE, profile=NO_PROFILE, encoding="utf-8", errors="strict", limit=None):
+    # Lines of a binary file, decoded like a text-mode file (universal newlines),
+    # but never holding more than a chunk plus one capped line. With limit, no
+    # more than that many bytes are read from the current position
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors), translate=True)
+    pending = ""
+    while True:
+        with profile.span("read"):
+            if limit is None:
+                data = file.read(chunk_size)
+            else:
+                data = file.read(min(chunk_size, limit))
+                limit -= len(data)
+        with profile.span("decode"):
+            lines = (pending + decoder.decode(data, final=not data)).split("\n")
+        pending = lines.pop()
+        yield from lines
+        while len(pending) > MAX_LINE_LENGTH:
+            yield pending[:MAX_LINE_LENGTH]
+            pending = pending[MAX_LINE_LENGTH:]
+        if not data:
+            break
+    if pending:
+        yield pending
+
+class FileBuffer:
+    # Stands in for FPDF.buffer: appended text goes straight to the file and
+    # len() is the byte offset, which is all FPDF needs for its xref
+    def __init__(self, file, profile=NO_PROFILE):
+        self.file = file
+        self.size = 0
+        self.profile = profile
+
+    def __iadd__(self, s):
+        self.write(s.encode("latin-1"))
+        return self
+
+    def write(self, data):
+        with self.profile.span("write"):
+            self.file.write(data)
+        self.size += len(data)
+
+    def __len__(self):
+        return self.size
+
+class OffsetTable:
+    # Stands in for FPDF.offsets: objects 1 and 2 (pages root, resources) are
+    # written last, everything else is numbered in order, so the entries can
+    # be spooled to a temporary file instead of growing a dict per page.
+    # Entries are xref stream rows (type, field 2, field 3); objects kept in an
+    # object stream record its position in the run of object streams written
+    # at the end, which xref_rows turns into an object number.
+    ENTRY = struct.Struct(">BQH")
+    WIDTHS = "[1 8 2]"
+
+    def __init__(self):
+        self.reserved = {}
+        self.spool = tempfile.TemporaryFile()
+        self.count = 0
+
+    def __setitem__(self, n, offset):
+        self._add(n, 1, offset, 0)
+
+    def compressed(self, n, stream, index):
+        self._add(n, 2, stream, index)
+
+    def _add(self, n, kind, field2, field3):
+        if n <= 2:
+            self.reserved[n] = (kind, field2, field3)
+            return
+        if n != self.count + 3:
+            raise ValueError(f"object {n} written out of order")
+        self.spool.write(self.ENTRY.pack(kind, field2, field3))
+        self.count += 1
+
+    def _entries(self, entries_per_block):
+        self.spool.seek(0)
+        while True:
+            data = self.spool.read(entries_per_block * self.ENTRY.size)
+            if not data:
+                break
+            yield self.ENTRY.iter_unpack(data)
+
+    def xref_blocks(self, entries_per_block=4096):
+        # Cross-reference lines for objects 1..n, a block of text at a time
+        yield "".join("%010d 00000 n \n" % self.reserved[n][1] for n in (1, 2))
+        for entries in self._entries(entries_per_block):
+            yield "".join("%010d 00000 n \n" % offset for _, offset, _ in entries)
+
+    def xref_rows(self, first_stream, entries_per_block=4096):
+        # Packed xref stream rows for objects 0..n, with object stream positions
+        # resolved against the number of the first object stream
+        pack = self.ENTRY.pack
+
+        def rows(entries):
+            return b"".join(pack(kind, field2 + first_stream if kind == 2 else field2, field3)
+                            for kind, field2, field3 in entries)
+
+        yield pack(0, 0, 65535) + rows(self.reserved[n] for n in (1, 2))
+        for entries in self._entries(entries_per_block):
+            yield rows(entries)
+
+    def close(self):
+        self.spool.close()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="also run tests marked slow")
+    parser.addoption("--stream-size-mb", type=int, default=256,
+                     help="input size for the streaming memory test (default: %(default)s)")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes minutes; skipped unless --run-slow is given")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="slow, pass --run-slow to run it")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+@pytest.fixture(autouse=True)
+def private_caches(tmp_path, monkeypatch):
+    # Line indexes and font subsets go under the test's folder, not ~/.cache
+    import fonts
+    import line_index
+    monkeypatch.setattr(line_index, "LINE_INDEX_FOLDER", str(tmp_path / "cache" / "lines"))
+    monkeypatch.setattr(fonts, "SUBSET_CACHE_FOLDER", str(tmp_path / "cache" / "subsets"))
+
+def write_lines(path, count, template="value_{i} = compute({i})  # line {i}"):
+    # A source of `count` numbered lines; returns the path as a string
+    with open(path, "w", encoding="utf-8", newline="\n") as file:
+        file.write("".join(template.format(i=i) + "\n" for i in range(1, count + 1)))
+    return str(path)
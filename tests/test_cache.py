@@ -0,0 +1,56 @@
+import os
+import threading
+
+from cache import ConversionCache, file_digest, partial_path
+
+def make_pdf(path, size):
+    path.write_bytes(b"%PDF-" + b"x" * (size - 5))
+    return str(path)
+
+def test_key_covers_contents_and_settings(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    (tmp_path / "a.py").write_text("print(1)\n")
+    (tmp_path / "b.py").write_text("print(2)\n")
+    a, b = file_digest(str(tmp_path / "a.py")), file_digest(str(tmp_path / "b.py"))
+    assert cache.key(a, {"font": "arial"}) == cache.key(a, {"font": "arial"})
+    assert cache.key(a, {"font": "arial"}) != cache.key(b, {"font": "arial"})
+    assert cache.key(a, {"font": "arial"}) != cache.key(a, {"font": "minecraft"})
+    # Settings are hashed in a fixed order
+    assert cache.key(a, {"font": "arial", "highlight": True}) == cache.key(a, {"highlight": True, "font": "arial"})
+
+def test_store_then_fetch(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"))
+    key = cache.key("0" * 64, {})
+    assert cache.fetch(key, str(tmp_path / "out.pdf")) is None
+    assert cache.store(key, make_pdf(tmp_path / "made.pdf", 100), {"pages": 3})
+    assert cache.fetch(key, str(tmp_path / "out.pdf")) == {"pages": 3}
+    assert (tmp_path / "out.pdf").read_bytes() == (tmp_path / "made.pdf").read_bytes()
+    # Fetching onto the output it is already linked to is still a hit
+    assert cache.fetch(key, str(tmp_path / "out.pdf")) == {"pages": 3}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"), max_bytes=2500)
+    keys = [cache.key(str(i) * 64, {}) for i in range(4)]
+    for i, (age, key) in enumerate(zip((400, 300, 200, 100), keys)):
+        # Entries are hard links where possible, so each needs a file of its own
+        cache.store(key, make_pdf(tmp_path / f"made{i}.pdf", 1000), {})
+        pdf_path = os.path.join(cache.folder, key + ".pdf")
+        os.utime(pdf_path, (os.path.getmtime(pdf_path) - age,) * 2)
+    # A hit makes the oldest entry the most recent
+    assert cache.fetch(keys[0], str(tmp_path / "out.pdf")) is not None
+    assert cache.evict() == 2
+    assert cache.size() <= 2500
+    assert cache.fetch(keys[0], str(tmp_path / "out.pdf")) is not None
+    assert cache.fetch(keys[3], str(tmp_path / "out.pdf")) is not None
+    assert cache.fetch(keys[1], str(tmp_path / "out.pdf")) is None
+    assert cache.fetch(keys[2], str(tmp_path / "out.pdf")) is None
+
+def test_partial_paths_differ_between_threads(tmp_path):
+    path = str(tmp_path / "out.pdf")
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(partial_path(path)))
+    thread.start()
+    thread.join()
+    assert seen[0] != partial_path(path)
+    assert partial_path(path).startswith(path + ".")
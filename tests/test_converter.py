@@ -0,0 +1,66 @@
+import pytest
+
+from cache import ConversionCache
+from codetopdf import build_parser
+from conftest import write_lines
+from converter import convert_file
+
+def test_converts_a_source(tmp_path):
+    source = write_lines(tmp_path / "small.py", 200)
+    result = convert_file(source, str(tmp_path / "small.pdf"))
+    assert result["lines"] == 200
+    assert result["pages"] > 1
+    with open(tmp_path / "small.pdf", "rb") as file:
+        assert file.read(5) == b"%PDF-"
+
+def test_skips_binary_and_oversized_files(tmp_path):
+    binary = tmp_path / "blob.py"
+    binary.write_bytes(bytes(range(256)) * 64)
+    assert convert_file(str(binary), str(tmp_path / "blob.pdf"))["skipped"] == "binary"
+    source = write_lines(tmp_path / "big.py", 1000)
+    assert convert_file(source, str(tmp_path / "big.pdf"), max_bytes=100)["skipped"].startswith("over")
+    assert not (tmp_path / "blob.pdf").exists() and not (tmp_path / "big.pdf").exists()
+
+def test_negative_start_byte_is_rejected(tmp_path):
+    source = write_lines(tmp_path / "lines.py", 100)
+    with pytest.raises(ValueError):
+        convert_file(source, str(tmp_path / "lines.pdf"), start_byte=-1)
+
+@pytest.mark.parametrize("max_pages", [0, -3])
+def test_page_limit_below_one_is_rejected(tmp_path, max_pages):
+    source = write_lines(tmp_path / "lines.py", 100)
+    with pytest.raises(ValueError):
+        convert_file(source, str(tmp_path / "lines.pdf"), max_pages=max_pages)
+
+def test_page_limit_cuts_the_render(tmp_path):
+    source = write_lines(tmp_path / "long.py", 3000)
+    result = convert_file(source, str(tmp_path / "long.pdf"), max_pages=2)
+    assert result["pages"] == 2
+    assert result["lines"] < 3000
+
+def test_line_window_and_start_byte(tmp_path):
+    source = write_lines(tmp_path / "long.py", 3000)
+    assert convert_file(source, str(tmp_path / "window.pdf"), lines=(1500, 1509))["lines"] == 10
+    # Byte 0 of line 2001 onwards: the last thousand lines
+    with open(source, "rb") as file:
+        offset = file.read().index(b"value_2001 ")
+    assert convert_file(source, str(tmp_path / "tail.pdf"), start_byte=offset + 3)["lines"] == 1000
+    with pytest.raises(ValueError):
+        convert_file(source, str(tmp_path / "bad.pdf"), lines=(20, 10))
+
+@pytest.mark.parametrize("option", [["--start-byte", "-5"], ["--max-pages", "0"], ["--max-pages", "-1"]])
+def test_command_line_rejects_bad_windows(capsys, option):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["convert", "source.py"] + option)
+    assert "must be at least" in capsys.readouterr().err
+
+def test_cache_hit_reuses_the_pdf(tmp_path):
+    source = write_lines(tmp_path / "cached.py", 300)
+    cache = ConversionCache(str(tmp_path / "cache"))
+    first = convert_file(source, str(tmp_path / "a.pdf"), cache=cache)
+    second = convert_file(source, str(tmp_path / "b.pdf"), cache=cache)
+    assert not first["cached"] and second["cached"]
+    assert second["pages"] == first["pages"]
+    assert (tmp_path / "a.pdf").read_bytes() == (tmp_path / "b.pdf").read_bytes()
+    # Other settings are another entry
+    assert not convert_file(source, str(tmp_path / "c.pdf"), cache=cache, font="minecraft")["cached"]
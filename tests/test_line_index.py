@@ -0,0 +1,67 @@
+import os
+
+import line_index
+from cache import file_digest
+from conftest import write_lines
+from line_index import LINE_STRIDE, LineIndex, source_window
+
+# Past a few strides, so lines are found both on and between recorded offsets
+LINE_COUNT = 3 * LINE_STRIDE + 100
+
+def line_starts(path):
+    starts = [0]
+    with open(path, "rb") as file:
+        for line in file:
+            starts.append(starts[-1] + len(line))
+    return starts
+
+def open_index(path):
+    file = open(path, "rb")
+    return file, LineIndex(file, file_digest(path))
+
+def test_line_start(tmp_path):
+    path = write_lines(tmp_path / "lines.py", LINE_COUNT)
+    starts = line_starts(path)
+    file, index = open_index(path)
+    with file:
+        for line in (1, 2, LINE_STRIDE, LINE_STRIDE + 1, LINE_STRIDE + 2, 2 * LINE_STRIDE + 7, LINE_COUNT):
+            assert index.line_start(line) == starts[line - 1]
+        # Past the end is the end
+        assert index.line_start(LINE_COUNT + 1) == os.path.getsize(path)
+        assert index.line_start(10 * LINE_COUNT) == os.path.getsize(path)
+        index.close()
+
+def test_line_at(tmp_path):
+    path = write_lines(tmp_path / "lines.py", LINE_COUNT)
+    starts = line_starts(path)
+    file, index = open_index(path)
+    with file:
+        for line in (1, 500, LINE_STRIDE, LINE_STRIDE + 1, LINE_COUNT):
+            assert index.line_at(starts[line - 1]) == (line, starts[line - 1])
+            # Any byte of the line, up to and including its newline
+            assert index.line_at(starts[line] - 1) == (line, starts[line - 1])
+        index.close()
+
+def test_index_is_kept_by_digest(tmp_path):
+    path = write_lines(tmp_path / "lines.py", LINE_COUNT)
+    file, index = open_index(path)
+    with file:
+        offsets = index.offsets
+        index.close()
+    assert len(os.listdir(line_index.LINE_INDEX_FOLDER)) == 1
+    file, index = open_index(path)
+    with file:
+        assert index.offsets == offsets
+        index.close()
+
+def test_source_window(tmp_path):
+    path = write_lines(tmp_path / "lines.py", LINE_COUNT)
+    starts = line_starts(path)
+    digest = file_digest(path)
+    with open(path, "rb") as file:
+        assert source_window(file, digest, lines=(10, 20)) == (starts[9], starts[20], 10)
+        assert source_window(file, digest, lines=(LINE_COUNT - 1, None)) == (starts[-3], starts[-1], LINE_COUNT - 1)
+        assert source_window(file, digest, start_byte=starts[2000] + 5) == (starts[2000], starts[-1], 2001)
+        # A start past the end leaves nothing to render
+        start, end, _ = source_window(file, digest, start_byte=10 * starts[-1])
+        assert start == end
@@ -0,0 +1,84 @@
+import os
+import random
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+from saved_pdfs import NAME, SIZE, STAT_IS_FREE, SavedPdfIndex, scan_folder
+
+# Files in the large folder; a rescan that touches rows one by one in a list this long takes seconds
+LARGE_FOLDER = 20000
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+def found_entries(count, rng):
+    # What scan_folder returns: name -> (size, mtime, inode), with plenty of equal sizes
+    return {f"file{i:05}.pdf": (rng.randrange(50) * 1024, 1e9 + i, i) for i in range(count)}
+
+def assert_consistent(index):
+    keys = [index.sort_key(entry) for entry in index.rows]
+    descending = index.sort_order == Qt.DescendingOrder
+    assert keys == sorted(keys, reverse=descending)
+    assert index.entries == {entry[0]: entry for entry in index.rows}
+    assert index.rowCount() == len(index.rows)
+
+def test_large_rescan(app):
+    rng = random.Random(0)
+    index = SavedPdfIndex(None)
+    found = found_entries(LARGE_FOLDER, rng)
+    index.apply_scan(found)
+    assert len(index.rows) == LARGE_FOLDER
+
+    # A few hundred files removed, rewritten and added since the last scan
+    names = rng.sample(sorted(found), 600)
+    for name in names[:300]:
+        del found[name]
+    for name in names[300:]:
+        found[name] = (found[name][0] + 1, found[name][1] + 1, found[name][2] + LARGE_FOLDER)
+    for i in range(300):
+        found[f"new{i:03}.pdf"] = (i, 2e9, 2 * LARGE_FOLDER + i)
+    start = time.perf_counter()
+    index.apply_scan(found)
+    elapsed = time.perf_counter() - start
+    assert {entry[0]: entry[1:] for entry in index.rows} == found
+    assert_consistent(index)
+    # Generous: row by row it took over ten seconds
+    assert elapsed < 2, f"rescan took {elapsed:.2f}s"
+
+def test_rows_stay_sorted_through_updates(app):
+    rng = random.Random(1)
+    index = SavedPdfIndex(None)
+    index.sort(SIZE, Qt.DescendingOrder)
+    found = found_entries(300, rng)
+    index.apply_scan(found)
+    for step in range(40):
+        names = rng.sample(sorted(found), 10)
+        for name in names[:3]:
+            del found[name]
+        for name in names[3:]:
+            found[name] = (rng.randrange(50) * 1024, found[name][1], found[name][2] + 1000)
+        found[f"added{step}.pdf"] = (rng.randrange(50) * 1024, 0, 10000 + step)
+        index.apply_scan(found)
+        assert_consistent(index)
+    index.remove_file(index.file_name(0))
+    index.sort(NAME, Qt.AscendingOrder)
+    assert_consistent(index)
+    assert len(index.rows) == len(found) - 1
+
+def test_scan_folder_reuses_known_entries(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"%PDF-a")
+    (tmp_path / "b.pdf").write_bytes(b"%PDF-bb")
+    (tmp_path / "notes.txt").write_text("not a PDF")
+    found = scan_folder(str(tmp_path))
+    assert sorted(found) == ["a.pdf", "b.pdf"]
+    assert found["b.pdf"][0] == 7
+    # Same inode: taken from what we knew, without a stat (unless stat comes with the listing)
+    known = dict(found, **{"a.pdf": (123, 0.0, found["a.pdf"][2])})
+    assert scan_folder(str(tmp_path), known)["a.pdf"][0] == (6 if STAT_IS_FREE else 123)
@@ -0,0 +1,52 @@
+from conftest import write_lines
+from converter import convert_file
+from search import SearchIndex, match_query
+
+def test_match_query():
+    assert match_query("convert_file pages") == '"convert_file" "pages"'
+    assert match_query('say "hi"') == '"say" """hi"""'
+    # Nothing to match on
+    assert match_query("+ - ()") == ""
+
+def test_finds_lines_by_page_and_number(tmp_path):
+    out = tmp_path / "out"
+    index = SearchIndex(str(out))
+    try:
+        source = write_lines(tmp_path / "numbers.py", 500)
+        result = convert_file(source, str(out / "numbers.pdf"), search_index=index)
+        hits = index.search("437")
+        assert [(number, line) for _, _, number, line in hits] == [(437, "value_437 = compute(437)  # line 437")]
+        path, page, _, _ = hits[0]
+        assert path == str(out / "numbers.pdf")
+        assert 1 < page <= result["pages"]
+        assert index.search("nothing_like_this") == []
+    finally:
+        index.close()
+
+def test_window_keeps_source_line_numbers(tmp_path):
+    out = tmp_path / "out"
+    index = SearchIndex(str(out))
+    try:
+        source = write_lines(tmp_path / "numbers.py", 2000)
+        convert_file(source, str(out / "numbers.pdf"), search_index=index, lines=(1200, 1300))
+        assert [hit[2] for hit in index.search("value_1250")] == [1250]
+        assert index.search("value_1199") == []
+    finally:
+        index.close()
+
+def test_reconverting_replaces_and_remove_drops(tmp_path):
+    out = tmp_path / "out"
+    index = SearchIndex(str(out))
+    try:
+        source = tmp_path / "notes.py"
+        source.write_text("alpha = 1\n")
+        convert_file(str(source), str(out / "notes.pdf"), search_index=index)
+        source.write_text("beta = 2\n")
+        convert_file(str(source), str(out / "notes.pdf"), search_index=index)
+        assert index.search("alpha") == []
+        assert len(index.search("beta")) == 1
+        assert index.remove(str(out / "notes.pdf"))
+        assert index.search("beta") == []
+        assert not index.remove(str(out / "notes.pdf"))
+    finally:
+        index.close()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+
+from server import MAX_HEAD_BYTES, ConversionServer
+
+SOURCE = b"def main():\n    return 42\n" * 20
+
+async def request(port, method, target, body=b"", headers=None):
+    # (status, headers, body) of one request on its own connection
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = {"Content-Length": str(len(body)), "Connection": "close", **(headers or {})}
+    writer.write(f"{method} {target} HTTP/1.1\r\n".encode("ascii") +
+                 "".join(f"{name}: {value}\r\n" for name, value in head.items()).encode("ascii") + b"\r\n" + body)
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    return int(lines[0].split()[1]), dict(line.lower().split(": ", 1) for line in lines[1:]), body
+
+async def submit_and_wait(port, name, body=SOURCE):
+    status, _, reply = await request(port, "POST", f"/jobs?name={name}", body)
+    assert status == 202
+    job_id = json.loads(reply)["id"]
+    status, _, reply = await request(port, "GET", f"/jobs/{job_id}?wait=30")
+    return job_id, json.loads(reply)
+
+def run_with_server(tmp_path, check):
+    # Runs check(conversion_server, port) against a one-worker server
+    async def main():
+        conversion_server = ConversionServer(str(tmp_path / "spool"), workers=1)
+        await conversion_server.start()
+        server = await asyncio.start_server(conversion_server.handle, "127.0.0.1", 0, limit=MAX_HEAD_BYTES)
+        try:
+            async with server:
+                await check(conversion_server, server.sockets[0].getsockname()[1])
+        finally:
+            conversion_server.close()
+    asyncio.run(main())
+
+def test_convert_and_download(tmp_path):
+    async def check(conversion_server, port):
+        job_id, job = await submit_and_wait(port, "main.py")
+        assert job["status"] == "done" and job["lines"] == 40
+        status, headers, pdf = await request(port, "GET", f"/jobs/{job_id}/pdf")
+        assert status == 200 and pdf.startswith(b"%PDF-")
+        assert int(headers["content-length"]) == len(pdf)
+        assert 'filename="main.pdf"' in headers["content-disposition"]
+        status, _, reply = await request(port, "GET", "/status")
+        assert status == 200 and json.loads(reply)["done"] == 1
+        status, _, _ = await request(port, "DELETE", f"/jobs/{job_id}")
+        assert status == 200
+        assert (await request(port, "GET", f"/jobs/{job_id}"))[0] == 404
+    run_with_server(tmp_path, check)
+
+def test_upload_named_like_its_pdf(tmp_path):
+    # The source of notes.pdf converts to notes.pdf as well; neither may clobber the other
+    async def check(conversion_server, port):
+        job_id, job = await submit_and_wait(port, "notes.pdf")
+        assert job["status"] == "done"
+        status, _, pdf = await request(port, "GET", f"/jobs/{job_id}/pdf")
+        assert status == 200 and pdf.startswith(b"%PDF-")
+    run_with_server(tmp_path, check)
+
+def test_missing_pdf_is_404(tmp_path):
+    async def check(conversion_server, port):
+        job_id, _ = await submit_and_wait(port, "main.py")
+        os.remove(conversion_server.jobs[job_id].output_path)
+        status, _, reply = await request(port, "GET", f"/jobs/{job_id}/pdf")
+        assert status == 404 and "error" in json.loads(reply)
+    run_with_server(tmp_path, check)
+
+def test_bad_requests(tmp_path):
+    async def check(conversion_server, port):
+        assert (await request(port, "POST", "/jobs", SOURCE))[0] == 400
+        assert (await request(port, "POST", "/jobs?name=main.py&font=comic", SOURCE))[0] == 400
+        assert (await request(port, "POST", "/jobs?name=main.py", headers={"Content-Length": "-1"}))[0] == 400
+        assert (await request(port, "GET", "/jobs"))[0] == 405
+        assert (await request(port, "GET", "/jobs/nope"))[0] == 404
+        assert (await request(port, "GET", "/elsewhere"))[0] == 404
+        assert conversion_server.counts["submitted"] == 0
+    run_with_server(tmp_path, check)
@@ -0,0 +1,40 @@
+import codecs
+import io
+
+import pytest
+
+from sniff import SNIFF_BYTES, sniff, sniff_file
+
+TEXT = "def main():\n    print('héllo wörld')\n"
+
+@pytest.mark.parametrize("data, encoding", [
+    (TEXT.encode("ascii", "replace"), "utf-8"),
+    (TEXT.encode("utf-8"), "utf-8"),
+    (codecs.BOM_UTF8 + TEXT.encode("utf-8"), "utf-8-sig"),
+    (TEXT.encode("utf-16"), "utf-16"),
+    (TEXT.encode("utf-32"), "utf-32"),
+    (TEXT.encode("utf-16-le"), "utf-16-le"),
+    (TEXT.encode("utf-16-be"), "utf-16-be"),
+    (TEXT.encode("cp1252") + "€".encode("cp1252"), "cp1252"),
+    # 0x81 is undefined in cp1252
+    (TEXT.encode("latin-1") + b"\x81", "latin-1"),
+])
+def test_text_encodings(data, encoding):
+    assert sniff(data, complete=True) == encoding
+
+def test_binary():
+    assert sniff(bytes(range(256)) * 4, complete=True) is None
+    assert sniff(b"\x7fELF\x02\x01\x01\x00" + b"\x00" * 64, complete=True) is None
+    # No NULs, but too many control bytes for text
+    assert sniff(b"\x01\x02\x03\x04abcdef" * 10, complete=True) is None
+
+def test_prefix_may_end_inside_a_character():
+    data = ("x" * (SNIFF_BYTES - 1) + "é").encode("utf-8")
+    assert sniff(data[:SNIFF_BYTES]) == "utf-8"
+    # ...but not when the prefix is the whole file
+    assert sniff(data[:SNIFF_BYTES], complete=True) != "utf-8"
+
+def test_sniff_file_rewinds():
+    file = io.BytesIO(TEXT.encode("utf-8"))
+    assert sniff_file(file) == "utf-8"
+    assert file.tell() == 0
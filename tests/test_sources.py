@@ -0,0 +1,38 @@
+import os
+
+from codetopdf import convert_tree
+from sources import common_root, find_sources, output_paths, pdf_filename
+
+def make_tree(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"# {name}\nx = 1\n")
+
+def test_find_sources_skips_hidden_output_and_unsupported(tmp_path):
+    make_tree(tmp_path, ["a.py", "b.txt", "c.exe", "sub/d.js", ".git/e.py", "out/f.py"])
+    found = [os.path.relpath(path, tmp_path) for path in find_sources(str(tmp_path), str(tmp_path / "out"))]
+    assert found == ["a.py", "b.txt", os.path.join("sub", "d.js")]
+
+def test_output_paths_mirror_the_tree(tmp_path):
+    sources = [str(tmp_path / "s" / "a.py"), str(tmp_path / "s" / "sub" / "a.py")]
+    outputs = output_paths(sources, str(tmp_path / "s"), str(tmp_path / "out"))
+    assert outputs == {sources[0]: str(tmp_path / "out" / "a.pdf"),
+                       sources[1]: str(tmp_path / "out" / "sub" / "a.pdf")}
+
+def test_duplicate_stems_keep_their_extension(tmp_path):
+    sources = [str(tmp_path / "s" / "foo.py"), str(tmp_path / "s" / "foo.js"), str(tmp_path / "s" / "bar.py")]
+    outputs = output_paths(sources, str(tmp_path / "s"), str(tmp_path / "out"))
+    assert sorted(os.path.basename(path) for path in outputs.values()) == ["bar.pdf", "foo.js.pdf", "foo.py.pdf"]
+
+def test_convert_tree_writes_one_pdf_per_source(tmp_path):
+    make_tree(tmp_path / "s", ["foo.py", "foo.js", "bar.py"])
+    out = tmp_path / "out"
+    results = list(convert_tree(str(tmp_path / "s"), str(out), jobs=1, index=False))
+    assert len(results) == 3 and not any("error" in result for result in results)
+    assert sorted(os.listdir(out)) == ["bar.pdf", "foo.js.pdf", "foo.py.pdf"]
+
+def test_names(tmp_path):
+    assert pdf_filename(os.path.join("src", "main.cpp")) == "main.pdf"
+    make_tree(tmp_path, ["a/x.py", "a/b/y.py"])
+    assert common_root([str(tmp_path / "a" / "x.py"), str(tmp_path / "a" / "b")]) == str(tmp_path / "a")
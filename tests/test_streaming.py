@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Peak RSS of a conversion may grow this much from a small input to one many times its size
+RSS_TOLERANCE_MB = 32
+
+# The small input is this fraction of the large one
+SMALL_FRACTION = 16
+
+# Converts argv[1] to argv[2] in a fresh interpreter and prints its peak RSS in MB
+# (ru_maxrss is in kilobytes on Linux)
+CONVERT = """
+import resource, sys
+sys.path.insert(0, sys.argv[4])
+from converter import convert_file
+result = convert_file(sys.argv[1], sys.argv[2], font=sys.argv[3])
+print(result["lines"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+def write_source(path, size_mb):
+    block = "".join(f"    value_{i} = compute(index={i}, label=\"row {i}\")  # generated line\n" for i in range(1000))
+    block = block.encode("utf-8")
+    with open(path, "wb") as file:
+        for _ in range(size_mb * 1024 * 1024 // len(block) + 1):
+            file.write(block)
+
+def convert(source, font):
+    output = subprocess.run([sys.executable, "-c", CONVERT, source, source + ".pdf", font, REPO],
+                            check=True, capture_output=True, text=True).stdout
+    lines, peak = output.split()
+    return int(lines), float(peak)
+
+@pytest.mark.slow
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads peak RSS the Linux way")
+@pytest.mark.parametrize("font", ["arial", "minecraft"])
+def test_peak_rss_is_flat(tmp_path, pytestconfig, font):
+    size_mb = pytestconfig.getoption("--stream-size-mb")
+    small = str(tmp_path / "small.py")
+    large = str(tmp_path / "large.py")
+    write_source(small, max(1, size_mb // SMALL_FRACTION))
+    write_source(large, size_mb)
+
+    small_lines, small_peak = convert(small, font)
+    large_lines, large_peak = convert(large, font)
+
+    assert large_lines > small_lines * (SMALL_FRACTION // 2)
+    assert large_peak - small_peak <= RSS_TOLERANCE_MB, (
+        f"peak RSS {small_peak:.1f} MB for {size_mb // SMALL_FRACTION} MB, {large_peak:.1f} MB for {size_mb} MB")
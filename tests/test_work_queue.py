@@ -0,0 +1,98 @@
+import json
+import os
+import time
+
+import pytest
+
+from work_queue import (MAX_ATTEMPTS, Worker, count_tasks, final_status, format_status, init_queue, requeue_expired,
+                        submit)
+
+# Short enough to let a lease expire within a test
+LEASE_TIMEOUT = 0.3
+
+def make_queue(tmp_path, count=3):
+    source = tmp_path / "src"
+    source.mkdir()
+    for i in range(count):
+        (source / f"file{i}.py").write_text(f"x = {i}\n" * 50)
+    work_dir = str(tmp_path / "work")
+    init_queue(work_dir, lease_timeout=LEASE_TIMEOUT)
+    return work_dir, str(source), str(tmp_path / "out")
+
+def test_settings_are_fixed_at_creation(tmp_path):
+    work_dir = str(tmp_path / "work")
+    init_queue(work_dir, lease_timeout=LEASE_TIMEOUT)
+    init_queue(work_dir, lease_timeout=LEASE_TIMEOUT)
+    with pytest.raises(ValueError):
+        init_queue(work_dir, font="minecraft", lease_timeout=LEASE_TIMEOUT)
+
+def test_submit_skips_queued_and_done(tmp_path):
+    work_dir, source, out = make_queue(tmp_path)
+    assert submit(work_dir, source, out) == {"queued": 3, "waiting": 0, "done": 0}
+    assert submit(work_dir, source, out) == {"queued": 0, "waiting": 3, "done": 0}
+    Worker(work_dir, name="a").run()
+    assert submit(work_dir, source, out) == {"queued": 0, "waiting": 0, "done": 3}
+    # A changed source is queued again
+    with open(os.path.join(source, "file1.py"), "a") as file:
+        file.write("y = 2\n")
+    assert submit(work_dir, source, out)["queued"] == 1
+
+def test_duplicate_stems_get_their_own_pdf(tmp_path):
+    work_dir, source, out = make_queue(tmp_path, count=0)
+    for name in ("foo.py", "foo.js"):
+        with open(os.path.join(source, name), "w") as file:
+            file.write("x = 1\n")
+    submit(work_dir, source, out)
+    Worker(work_dir, name="a").run()
+    assert sorted(os.listdir(out)) == ["foo.js.pdf", "foo.py.pdf"]
+
+def test_workers_claim_different_tasks(tmp_path):
+    work_dir, source, out = make_queue(tmp_path)
+    submit(work_dir, source, out)
+    first, second = Worker(work_dir, name="a").claim(), Worker(work_dir, name="b").claim()
+    assert first[1]["id"] != second[1]["id"]
+    assert os.path.basename(first[0]).endswith("@a.json")
+    assert count_tasks(work_dir) == {"pending": 1, "leased": 2, "done": 0, "failed": 0}
+
+def test_expired_leases_go_back_to_the_queue(tmp_path):
+    work_dir, source, out = make_queue(tmp_path, count=2)
+    submit(work_dir, source, out)
+    stalled, alive = Worker(work_dir, name="stalled"), Worker(work_dir, name="alive")
+    stalled.claim()
+    alive.claim()
+    assert requeue_expired(work_dir, LEASE_TIMEOUT) == 0
+    time.sleep(LEASE_TIMEOUT * 2)
+    # A heartbeat keeps a lease
+    alive.heartbeat()
+    assert requeue_expired(work_dir, LEASE_TIMEOUT) == 1
+    assert count_tasks(work_dir, ("pending", "leased")) == {"pending": 1, "leased": 1}
+    task = Worker(work_dir, name="next").claim()[1]
+    assert task["attempts"] == 1 and task["error"] == "lease expired on stalled"
+
+def test_task_is_set_aside_after_max_attempts(tmp_path):
+    work_dir, source, out = make_queue(tmp_path, count=1)
+    submit(work_dir, source, out)
+    for attempt in range(MAX_ATTEMPTS):
+        assert Worker(work_dir, name=f"w{attempt}").claim() is not None
+        time.sleep(LEASE_TIMEOUT * 2)
+        requeue_expired(work_dir, LEASE_TIMEOUT)
+    assert count_tasks(work_dir) == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+
+def test_run_converts_everything_and_reports(tmp_path):
+    work_dir, source, out = make_queue(tmp_path)
+    submit(work_dir, source, out)
+    stats = Worker(work_dir, name="a").run()
+    assert stats["files"] == 3 and stats["failed"] == 0
+    assert sorted(os.listdir(out)) == ["file0.pdf", "file1.pdf", "file2.pdf"]
+    for name in os.listdir(os.path.join(work_dir, "done")):
+        with open(os.path.join(work_dir, "done", name)) as file:
+            assert json.load(file)["node"] == "a"
+
+    # Every worker has written its exit heartbeat, so this doesn't wait
+    start = time.time()
+    status = final_status(work_dir, lease_timeout=LEASE_TIMEOUT)
+    assert time.time() - start < LEASE_TIMEOUT
+    assert [node["files"] for node in status["nodes"]] == [3]
+    lines = format_status(status, lease_timeout=LEASE_TIMEOUT)
+    assert lines[0] == "queue: 0 pending, 0 leased, 3 done, 0 failed"
+    assert any(line.split()[:3] == ["a", "3", "files"] and line.endswith("finished") for line in lines)
@@ -0,0 +1,421 @@
+import glob
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from converter import convert_file, preload_fonts
+from sources import find_sources, output_paths
+
+# Pending tasks are spread over this many folders, so a claim lists a small folder
+# and workers, each starting on a shard of its own, rarely race for the same file
+SHARDS = 16
+
+# A lease nobody has touched for this long (in seconds) goes back to the queue
+DEFAULT_LEASE_TIMEOUT = 120
+
+# Failures and expired leases a task gets before it is set aside in failed/
+MAX_ATTEMPTS = 3
+
+# Seconds an idle worker waits before looking for work again
+IDLE_POLL = 1.0
+
+# A task held this many times longer than the average one counts as a straggler,
+# but only once it has been held for STRAGGLER_MIN_SECONDS
+STRAGGLER_FACTOR = 5
+STRAGGLER_MIN_SECONDS = 30
+
+FOLDERS = ("pending", "leased", "done", "failed", "nodes", "tmp")
+CONFIG_NAME = "queue.json"
+
+# A shared work directory holds:
+#   queue.json                   render settings every worker uses
+#   pending/<shard>/<id>.json    tasks waiting for a worker
+#   leased/<id>@<worker>.json    tasks being converted; a worker claims one by renaming it here
+#                                and keeps touching it while it works
+#   done/<id>.json, failed/<id>.json
+#   nodes/<worker>.json          each worker's counters, rewritten with every heartbeat
+# Renames within one directory tree are atomic, also on network file systems,
+# so two workers can never both win the same task.
+
+def _write_json(work_dir, path, data):
+    # Written under tmp/ and renamed into place, so nobody reads half a file
+    partial = os.path.join(work_dir, "tmp", f"{os.path.basename(path)}.{socket.gethostname()}.{os.getpid()}")
+    with open(partial, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(partial, path)
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+def task_id(source):
+    return hashlib.sha1(os.path.abspath(source).encode("utf-8")).hexdigest()[:20]
+
+def _is_done(work_dir, task):
+    # Whether done/ records this task for the same version (size and mtime) of its source
+    try:
+        done = _read_json(os.path.join(work_dir, "done", task["id"] + ".json"))
+    except (OSError, ValueError):
+        return False
+    return done["size"] == task["size"] and done["mtime"] == task["mtime"]
+
+def _pending_path(work_dir, tid):
+    return os.path.join(work_dir, "pending", "%02d" % (int(tid[:4], 16) % SHARDS), tid + ".json")
+
+def init_queue(work_dir, font="arial", options=None, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+    # Settings are fixed when the queue is created, so every node renders the same PDFs
+    for name in FOLDERS:
+        os.makedirs(os.path.join(work_dir, name), exist_ok=True)
+    for shard in range(SHARDS):
+        os.makedirs(os.path.join(work_dir, "pending", "%02d" % shard), exist_ok=True)
+    config = {"font": font, "options": options or {}, "lease_timeout": lease_timeout}
+    config_path = os.path.join(work_dir, CONFIG_NAME)
+    if os.path.exists(config_path):
+        existing = _read_json(config_path)
+        if existing != config:
+            raise ValueError(f"{work_dir} was set up with other settings: {existing}")
+        return existing
+    _write_json(work_dir, config_path, config)
+    return config
+
+def submit(work_dir, path, output_folder):
+    # Queues every supported file under path, or path itself. A source already
+    # queued or leased is left alone, and so is one that is done, unless it
+    # changed since. Returns counts of what happened to each file
+    if os.path.isfile(path):
+        sources = [path]
+        root = os.path.dirname(path) or "."
+    else:
+        sources = find_sources(path, output_folder)
+        root = path
+    sources = [os.path.abspath(source) for source in sources]
+    # Files that only differ in extension keep it in the PDF's name, or nodes
+    # converting them at the same time would overwrite each other's output
+    outputs = output_paths(sources, root, output_folder)
+    leased = {name.split("@")[0] for name in os.listdir(os.path.join(work_dir, "leased"))}
+    counts = {"queued": 0, "waiting": 0, "done": 0}
+    for source in sources:
+        tid = task_id(source)
+        pending_path = _pending_path(work_dir, tid)
+        if tid in leased or os.path.exists(pending_path):
+            counts["waiting"] += 1
+            continue
+        stat = os.stat(source)
+        output = os.path.abspath(outputs[source])
+        task = {"id": tid, "source": source, "output": output, "size": stat.st_size, "mtime": stat.st_mtime,
+                "attempts": 0}
+        if _is_done(work_dir, task):
+            counts["done"] += 1
+            continue
+        _write_json(work_dir, pending_path, task)
+        failed_path = os.path.join(work_dir, "failed", tid + ".json")
+        if os.path.exists(failed_path):
+            os.remove(failed_path)
+        counts["queued"] += 1
+    return counts
+
+def _return_task(work_dir, task, error):
+    # Back to pending for another try, or set aside once it has had MAX_ATTEMPTS
+    task = dict(task, attempts=task.get("attempts", 0) + 1, error=error)
+    if task["attempts"] >= MAX_ATTEMPTS:
+        _write_json(work_dir, os.path.join(work_dir, "failed", task["id"] + ".json"), task)
+    else:
+        _write_json(work_dir, _pending_path(work_dir, task["id"]), task)
+
+def _touched(stat):
+    # A claim renames the task (which updates ctime) before it first touches the lease
+    return max(stat.st_mtime, stat.st_ctime)
+
+def requeue_expired(work_dir, lease_timeout):
+    # Hands leases nobody touched within lease_timeout back to the queue and returns
+    # how many. Any worker or the coordinator may run this at any time: the lease is
+    # renamed away first, so only one of them requeues each task
+    leased_folder = os.path.join(work_dir, "leased")
+    now = time.time()
+    stale = []
+    with os.scandir(leased_folder) as entries:
+        for entry in entries:
+            try:
+                if now - _touched(entry.stat()) > lease_timeout:
+                    stale.append(entry.name)
+            except FileNotFoundError:
+                continue
+    requeued = 0
+    for name in stale:
+        lease = os.path.join(leased_folder, name)
+        taken = os.path.join(work_dir, "tmp", name + ".expired")
+        try:
+            os.rename(lease, taken)
+        except FileNotFoundError:
+            continue
+        if now - os.stat(taken).st_mtime <= lease_timeout:
+            # Touched after all, between the listing and the rename
+            os.rename(taken, lease)
+            continue
+        task = _read_json(taken)
+        # A worker that finished just before we got here has already recorded it
+        if not _is_done(work_dir, task):
+            worker = name[:-len(".json")].split("@", 1)[1]
+            _return_task(work_dir, task, f"lease expired on {worker}")
+            requeued += 1
+        os.remove(taken)
+    return requeued
+
+def count_tasks(work_dir, folders=("pending", "leased", "done", "failed")):
+    counts = {}
+    for name in folders:
+        if name == "pending":
+            counts[name] = sum(len(os.listdir(os.path.join(work_dir, "pending", "%02d" % shard)))
+                               for shard in range(SHARDS))
+        else:
+            counts[name] = len(os.listdir(os.path.join(work_dir, name)))
+    return counts
+
+class Worker:
+    # Claims tasks from a shared work directory and converts them, one at a time,
+    # until nothing is pending or leased anywhere. A heartbeat thread touches the
+    # lease held and rewrites nodes/<name>.json every quarter of the lease timeout
+    def __init__(self, work_dir, name=None):
+        self.work_dir = work_dir
+        self.config = _read_json(os.path.join(work_dir, CONFIG_NAME))
+        self.name = name or f"{socket.gethostname()}.{os.getpid()}"
+        self.first_shard = int(hashlib.sha1(self.name.encode("utf-8")).hexdigest(), 16) % SHARDS
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.lease = None
+        self.current = None
+        self.stats = {"name": self.name, "host": socket.gethostname(), "pid": os.getpid(), "started": time.time(),
+                      "files": 0, "failed": 0, "lost": 0, "pages": 0, "bytes": 0, "busy_seconds": 0.0}
+
+    def claim(self):
+        # (lease path, task) of a pending task we now hold, or None
+        for i in range(SHARDS):
+            shard = os.path.join(self.work_dir, "pending", "%02d" % ((self.first_shard + i) % SHARDS))
+            for name in os.listdir(shard):
+                if not name.endswith(".json"):
+                    continue
+                lease = os.path.join(self.work_dir, "leased", f"{name[:-len('.json')]}@{self.name}.json")
+                try:
+                    os.rename(os.path.join(shard, name), lease)
+                    # The rename keeps the submit time; the lease starts now
+                    os.utime(lease)
+                    task = _read_json(lease)
+                except FileNotFoundError:
+                    # Another worker got there first
+                    continue
+                with self.lock:
+                    self.lease = lease
+                    self.current = {"id": task["id"], "source": task["source"], "started": time.time()}
+                return lease, task
+        return None
+
+    def release(self, lease):
+        with self.lock:
+            self.lease = None
+            self.current = None
+        try:
+            os.remove(lease)
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self):
+        with self.lock:
+            if self.lease:
+                try:
+                    os.utime(self.lease)
+                except FileNotFoundError:
+                    # Requeued while we went quiet; whoever converts it again writes the same PDF
+                    self.lease = None
+                    self.stats["lost"] += 1
+            status = dict(self.stats, current=self.current, updated=time.time())
+        _write_json(self.work_dir, os.path.join(self.work_dir, "nodes", self.name + ".json"), status)
+
+    def beat(self):
+        while not self.stopped.wait(self.config["lease_timeout"] / 4):
+            self.heartbeat()
+
+    def convert(self, lease, task):
+        if _is_done(self.work_dir, task):
+            # Requeued after an expired lease, but its first worker got it done after all
+            self.release(lease)
+            return
+        started = time.time()
+        try:
+            os.makedirs(os.path.dirname(task["output"]), exist_ok=True)
+            # convert_file only replaces the output once it is complete, so a task
+            # converted twice just writes the same PDF twice
+            result = convert_file(task["source"], task["output"], font=self.config["font"], **self.config["options"])
+        except Exception as e:
+            _return_task(self.work_dir, task, f"{e} (on {self.name})")
+            with self.lock:
+                self.stats["failed"] += 1
+            self.release(lease)
+            return
+        finished = time.time()
+        # Partial files left next to the output by workers that died converting it
+        for partial in glob.glob(glob.escape(task["output"]) + ".*.part"):
+            try:
+                if finished - os.stat(partial).st_mtime > self.config["lease_timeout"]:
+                    os.remove(partial)
+            except FileNotFoundError:
+                pass
+        _write_json(self.work_dir, os.path.join(self.work_dir, "done", task["id"] + ".json"), {
+            "id": task["id"], "source": task["source"], "output": result["output"], "size": task["size"],
+            "mtime": task["mtime"], "pages": result["pages"], "lines": result["lines"],
+            "skipped": result.get("skipped"), "node": self.name, "started": started, "finished": finished,
+        })
+        with self.lock:
+            self.stats["files"] += 1
+            self.stats["pages"] += result["pages"]
+            self.stats["bytes"] += result["bytes"]
+            self.stats["busy_seconds"] += finished - started
+        self.release(lease)
+
+    def run(self, exit_when_idle=True):
+        preload_fonts(self.config["font"])
+        self.heartbeat()
+        beating = threading.Thread(target=self.beat, daemon=True)
+        beating.start()
+        try:
+            while True:
+                claimed = self.claim()
+                if claimed is not None:
+                    self.convert(*claimed)
+                    continue
+                # Nothing to claim: bring back what stalled workers left, then wait for it
+                requeue_expired(self.work_dir, self.config["lease_timeout"])
+                counts = count_tasks(self.work_dir, ("pending", "leased"))
+                if exit_when_idle and counts["pending"] == counts["leased"] == 0:
+                    break
+                time.sleep(IDLE_POLL)
+        finally:
+            self.stopped.set()
+            beating.join()
+            self.stats["finished"] = time.time()
+            self.heartbeat()
+        return self.stats
+
+def _run_worker(work_dir, exit_when_idle):
+    return Worker(work_dir).run(exit_when_idle)
+
+def run_node(work_dir, workers=1, exit_when_idle=True):
+    # One worker per process on this machine; returns their final counters, None for
+    # a worker whose process died (the pool then stops the others as well)
+    if workers == 1:
+        return [_run_worker(work_dir, exit_when_idle)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_worker, work_dir, exit_when_idle) for _ in range(workers)]
+        stats = []
+        for future in futures:
+            try:
+                stats.append(future.result())
+            except BrokenProcessPool:
+                stats.append(None)
+        return stats
+
+def queue_status(work_dir):
+    # Task counts plus the last heartbeat of every worker that ever ran on the queue
+    nodes = []
+    with os.scandir(os.path.join(work_dir, "nodes")) as entries:
+        for entry in entries:
+            try:
+                nodes.append(_read_json(entry.path))
+            except (OSError, ValueError):
+                continue
+    return dict(count_tasks(work_dir), nodes=nodes, time=time.time())
+
+def _active(node, since, lease_timeout):
+    # Workers that finished, or went silent for good, before `since` belong to an earlier run
+    return node.get("finished", node["updated"]) >= since - lease_timeout
+
+def final_status(work_dir, since=0, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+    # The status once every worker of this run has written the heartbeat it leaves on
+    # exit, so the last report counts every file converted. Heartbeats come a quarter
+    # lease apart, so after half a lease the ones still running have reported too
+    deadline = time.time() + lease_timeout / 2
+    while True:
+        status = queue_status(work_dir)
+        waiting = [n for n in status["nodes"] if "finished" not in n and _active(n, since, lease_timeout)
+                   and status["time"] - n["updated"] <= lease_timeout / 2]
+        if not waiting or status["time"] >= deadline:
+            return status
+        time.sleep(IDLE_POLL)
+
+def format_status(status, previous=None, since=0, lease_timeout=DEFAULT_LEASE_TIMEOUT):
+    # Report lines: the queue, throughput now (against the previous status) and over
+    # the run, each worker active since `since`, then stragglers and silent workers
+    now = status["time"]
+    nodes = sorted((n for n in status["nodes"] if _active(n, since, lease_timeout)), key=lambda n: n["name"])
+    lines = [f"queue: {status['pending']} pending, {status['leased']} leased, {status['done']} done, "
+             f"{status['failed']} failed"]
+    files = sum(n["files"] for n in nodes)
+    pages = sum(n["pages"] for n in nodes)
+    megabytes = sum(n["bytes"] for n in nodes) / (1024 * 1024)
+    if nodes:
+        elapsed = max(now - min(n["started"] for n in nodes), 1e-9)
+        rate = f"{files / elapsed:.1f} files/s, {pages / elapsed:.0f} pages/s, {megabytes / elapsed:.2f} MB/s"
+        if previous is not None:
+            before = {n["name"]: n for n in previous["nodes"]}
+            interval = max(now - previous["time"], 1e-9)
+            recent = sum(n["files"] - before.get(n["name"], {}).get("files", 0) for n in nodes)
+            recent_pages = sum(n["pages"] - before.get(n["name"], {}).get("pages", 0) for n in nodes)
+            rate = f"{recent / interval:.1f} files/s, {recent_pages / interval:.0f} pages/s now; " + rate
+        running = sum(1 for n in nodes if "finished" not in n and now - n["updated"] <= lease_timeout / 2)
+        lines.append(f"throughput: {rate} overall, {running} workers running")
+    busy = sum(n["busy_seconds"] for n in nodes)
+    average = busy / files if files else 0
+    stragglers = []
+    silent = []
+    for n in nodes:
+        quiet = now - n["updated"]
+        if "finished" in n:
+            state = "finished"
+        elif quiet > lease_timeout / 2:
+            # Stopped or stuck: two heartbeats missed
+            state = f"silent for {quiet:.0f}s"
+            silent.append(f"  {n['name']}: no heartbeat for {quiet:.0f}s")
+        elif n.get("current"):
+            held = now - n["current"]["started"]
+            state = f"converting {os.path.basename(n['current']['source'])} for {held:.0f}s"
+            if held > max(STRAGGLER_MIN_SECONDS, STRAGGLER_FACTOR * average):
+                stragglers.append(f"  {n['current']['source']} on {n['name']} for {held:.0f}s "
+                                  f"(average task {average:.1f}s)")
+        else:
+            state = "idle"
+        rate = n["files"] / max(n.get("finished", n["updated"]) - n["started"], 1e-9)
+        lines.append(f"  {n['name']:<24} {n['files']:>7} files {n['pages']:>8} pages {rate:>7.1f} files/s  "
+                     f"{n['failed']} failed  {state}")
+    if stragglers:
+        lines.append("stragglers:")
+        lines.extend(stragglers)
+    if silent:
+        lines.append("silent workers (their leases go back to the queue once they expire):")
+        lines.extend(silent)
+    return lines
+
+def coordinate(work_dir, interval=10, once=False, report=print):
+    # Requeues expired leases and reports progress every interval seconds until
+    # nothing is pending or leased; returns the last status. Workers that finished
+    # before it started are left out, unless it only reports once
+    config = _read_json(os.path.join(work_dir, CONFIG_NAME))
+    since = 0 if once else time.time()
+    previous = None
+    while True:
+        requeued = requeue_expired(work_dir, config["lease_timeout"])
+        status = queue_status(work_dir)
+        finished = status["pending"] == status["leased"] == 0
+        if finished and not once:
+            status = final_status(work_dir, since, config["lease_timeout"])
+        lines = format_status(status, previous, since, config["lease_timeout"])
+        if requeued:
+            lines.insert(1, f"requeued {requeued} expired leases")
+        report("\n".join(lines))
+        if once or finished:
+            return status
+        previous = status
+        time.sleep(interval)
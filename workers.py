@@ -0,0 +1,155 @@
+import itertools
+import os
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from cache import ConversionCache
+from profiling import Profile
+from search import SearchIndex
+from sources import common_root, find_sources
+
+# Conversions that may run at the same time; the rest wait in the pool's queue
+MAX_CONCURRENT_CONVERSIONS = 2
+
+# Files a folder scan hands over at a time, so the first conversions start while it is still walking
+SCAN_BATCH_SIZE = 50
+
+# Milliseconds between two cache evictions in the windows; a round only runs after conversions
+EVICT_INTERVAL_MS = 30 * 1000
+
+_job_ids = itertools.count(1)
+
+class ConversionCancelled(Exception):
+    pass
+
+class ConversionSignals(QObject):
+    started = pyqtSignal(int)
+    progress = pyqtSignal(int, int, int)  # job id, lines rendered, pages emitted
+    finished = pyqtSignal(int, dict)
+    failed = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+class ConversionJob(QRunnable):
+    def __init__(self, file_path, output_path, font="arial", cache=None, search_folder=None):
+        super().__init__()
+        # The App keeps a reference until the job reports back, so Qt must not delete it
+        self.setAutoDelete(False)
+        self.job_id = next(_job_ids)
+        self.file_path = file_path
+        self.output_path = output_path
+        self.font = font
+        self.cache = cache
+        # Folder whose search index receives the text; the connection belongs to the pool thread
+        self.search_folder = search_folder
+        self.signals = ConversionSignals()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def _report_progress(self, lines, pages):
+        if self._cancel_event.is_set():
+            raise ConversionCancelled()
+        self.signals.progress.emit(self.job_id, lines, pages)
+
+    def run(self):
+        if self._cancel_event.is_set():
+            self.signals.cancelled.emit(self.job_id)
+            return
+        self.signals.started.emit(self.job_id)
+        # The renderer (and fpdf with it) loads with the first conversion, not with the window
+        from converter import convert_file
+        search_index = None
+        # Timed stage by stage; the report comes back in the result as "profile"
+        profile = Profile()
+        try:
+            # Files from a dropped folder go to a mirror of its tree
+            os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+            if self.search_folder:
+                search_index = SearchIndex(self.search_folder)
+            result = convert_file(self.file_path, self.output_path, font=self.font, progress=self._report_progress,
+                                  cache=self.cache, search_index=search_index, profile=profile)
+        except ConversionCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as e:
+            during = f" (during {profile.failed_stage})" if profile.failed_stage else ""
+            self.signals.failed.emit(self.job_id, f"{e}{during}")
+        else:
+            self.signals.finished.emit(self.job_id, result)
+        finally:
+            if search_index is not None:
+                search_index.close()
+
+class BookJob(ConversionJob):
+    # Binds several files into one book PDF; it reports back like a conversion
+    # but can only be cancelled before it starts
+    def __init__(self, file_paths, output_path, font="arial"):
+        # Listed in the queue under the book's name
+        super().__init__(output_path, output_path, font=font)
+        self.file_paths = file_paths
+
+    def run(self):
+        if self._cancel_event.is_set():
+            self.signals.cancelled.emit(self.job_id)
+            return
+        self.signals.started.emit(self.job_id)
+        from project import build_project
+        try:
+            # In process: forking a worker pool from this thread of a multi-threaded Qt
+            # process can deadlock the children, and other jobs already use the CPUs
+            result = build_project(common_root(self.file_paths), self.output_path, font=self.font, jobs=1,
+                                   sources=self.file_paths)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+        else:
+            self.signals.finished.emit(self.job_id, result)
+
+class CacheEviction(QRunnable):
+    # Trims a conversion cache to its cap off the GUI thread: eviction scans
+    # the whole cache folder, which would stall the window
+    def __init__(self, folder):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.folder = folder
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            ConversionCache(self.folder).evict()
+        except OSError:
+            # A conversion replaced or removed an entry under us; the next round catches up
+            pass
+        finally:
+            self.done.set()
+
+class SourceScanSignals(QObject):
+    found = pyqtSignal(str, list)  # dropped folder, a batch of the files under it
+    finished = pyqtSignal(str, int)  # dropped folder, files found
+
+class SourceScan(QRunnable):
+    # Walks a dropped folder for supported files off the GUI thread;
+    # unreadable folders are skipped, like os.walk does
+    def __init__(self, folder, skip_folder=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.folder = folder
+        self.skip_folder = skip_folder
+        self.signals = SourceScanSignals()
+
+    def run(self):
+        batch = []
+        count = 0
+        for path in find_sources(self.folder, self.skip_folder):
+            batch.append(path)
+            if len(batch) == SCAN_BATCH_SIZE:
+                self.signals.found.emit(self.folder, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.signals.found.emit(self.folder, batch)
+            count += len(batch)
+        self.signals.finished.emit(self.folder, count)